@@ -0,0 +1,171 @@
+import os
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+from functools import lru_cache
+from types import MappingProxyType
+from country_flags import get_country_flag
+
+# Compiled, memory-mapped form of airports.json.
+#
+# Layout (little endian):
+#   header    magic, version, record count, key count, offsets of the three sections
+#   records   fixed-width rows: string table offsets for name, city, country,
+#             iata, icao and country flag; latitude, longitude (float64),
+#             altitude (int32), utc offset in hours (float32, NaN if unknown), dst
+#   keys      sorted (code, record number) pairs for every IATA and ICAO code
+#   strings   deduplicated utf-8 strings, each prefixed with its uint16 length
+#
+# Every worker maps the same file read-only, so the data lives once in the page
+# cache instead of as a few MB of dicts and strs per gunicorn process.
+
+source_path = 'airports.json'
+db_path = os.getenv('AIRPORT_DB_PATH', 'airports.bin')
+
+MAGIC = b'APDB'
+VERSION = 1
+header_struct = struct.Struct('<4sHxxIIIII')
+record_struct = struct.Struct('<6Iddif1s3x')
+key_struct = struct.Struct('<4sI')
+string_fields = ('name', 'city', 'country', 'iata', 'icao', 'country_flag')
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
+def compile_airports(json_path=source_path, out_path=db_path):
+    with open(json_path) as ap:
+        airports = list(json.load(ap).values())
+
+    strings = bytearray()
+    string_offsets = {}
+
+    def intern(value):
+        if value not in string_offsets:
+            encoded = value.encode('utf-8')
+            string_offsets[value] = len(strings)
+            strings.extend(struct.pack('<H', len(encoded)))
+            strings.extend(encoded)
+        return string_offsets[value]
+
+    records = bytearray()
+    for data in airports:
+        values = dict(data, country_flag=get_country_flag(data['country']) or '')
+        records.extend(record_struct.pack(
+            *[intern(values[field]) for field in string_fields],
+            float(data['latitude']),
+            float(data['longitude']),
+            int(data['altitude']),
+            _to_float(data['timezone']),
+            data['dst'].encode('ascii')[:1] or b' '))
+
+    # IATA keys are written last so they win over the few 3-letter ICAO codes
+    codes = {}
+    for field in ('icao', 'iata'):
+        for number, data in enumerate(airports):
+            if data[field]:
+                codes[data[field].upper()] = number
+    keys = b''.join(key_struct.pack(code.encode('ascii'), number) for code, number in sorted(codes.items()))
+
+    records_offset = header_struct.size
+    keys_offset = records_offset + len(records)
+    strings_offset = keys_offset + len(keys)
+    header = header_struct.pack(MAGIC, VERSION, len(airports), len(codes),
+                                records_offset, keys_offset, strings_offset)
+    tmp_path = '{0}.{1}.tmp'.format(out_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(records)
+        f.write(keys)
+        f.write(strings)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class AirportDatabase(Mapping):
+    """Read-only mapping of IATA/ICAO code to airport record over the compiled file."""
+
+    def __init__(self, path=db_path):
+        with open(path, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count, self._key_count, self._records_offset, self._keys_offset, \
+            self._strings_offset = header_struct.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{0} is not a version {1} airport database'.format(path, VERSION))
+        self.record = lru_cache(maxsize=2048)(self._read_record)
+
+    @classmethod
+    def open(cls, path=db_path, json_path=source_path):
+        """Map the compiled database, (re)building it first if it is missing, stale or another version.
+
+        Deploys build it ahead of time (bin/post_compile), so this only compiles
+        in development or after a format change.
+        """
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(json_path):
+            compile_airports(json_path, path)
+        try:
+            return cls(path)
+        except (ValueError, struct.error) as e:
+            print('====== REBUILDING AIRPORT DATABASE {0}: {1} ======'.format(path, e))
+            compile_airports(json_path, path)
+            return cls(path)
+
+    def _string(self, offset):
+        start = self._strings_offset + offset
+        length, = struct.unpack_from('<H', self._buf, start)
+        return self._buf[start + 2:start + 2 + length].decode('utf-8')
+
+    def _read_record(self, number):
+        fields = record_struct.unpack_from(self._buf, self._records_offset + number * record_struct.size)
+        record = {field: self._string(offset) for field, offset in zip(string_fields, fields[:6])}
+        record['country_flag'] = record['country_flag'] or None
+        record['latitude'], record['longitude'], record['altitude'], record['timezone'] = fields[6:10]
+        record['dst'] = fields[10].decode('ascii').strip()
+        return MappingProxyType(record)
+
+    def _find(self, code):
+        key = code.upper().encode('ascii', 'ignore').ljust(4, b'\0')
+        lo, hi = 0, self._key_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, number = key_struct.unpack_from(self._buf, self._keys_offset + mid * key_struct.size)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return number
+        return None
+
+    def __getitem__(self, code):
+        number = self._find(code) if len(code) <= 4 else None
+        if number is None:
+            raise KeyError(code)
+        return self.record(number)
+
+    def __iter__(self):
+        for code, number in key_struct.iter_unpack(
+                self._buf[self._keys_offset:self._keys_offset + self._key_count * key_struct.size]):
+            yield code.rstrip(b'\0').decode('ascii')
+
+    def __len__(self):
+        return self._key_count
+
+    def records(self):
+        for number in range(self._count):
+            yield self.record(number)
+
+    def coordinates(self):
+        """Yield (record number, latitude, longitude) without decoding any strings."""
+        for number, fields in enumerate(record_struct.iter_unpack(
+                self._buf[self._records_offset:self._records_offset + self._count * record_struct.size])):
+            yield number, fields[6], fields[7]
+
+
+if __name__ == '__main__':
+    print('wrote {0}'.format(compile_airports()))
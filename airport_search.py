@@ -0,0 +1,146 @@
+import re
+import bisect
+import heapq
+from itertools import islice
+import unicodedata
+from collections import defaultdict
+
+# In-process replacement for the remote airport search_ajax endpoint. Every
+# airport with an IATA code is indexed by the words of its name, city and
+# country plus its IATA/ICAO codes, and each query word is matched exactly,
+# as a prefix or within one typo (deletion-neighbourhood lookup).
+
+_non_alnum = re.compile(r'[^a-z0-9]+')
+
+# shorter words only match whole tokens, and a query made of nothing else is
+# left to the remote endpoint; one word never unions more than
+# max_word_postings airports, so a broad word like "air" stays cheap
+min_prefix_length = 3
+max_word_postings = 500
+
+code_score = 100
+exact_score = 4
+prefix_score = 2
+typo_score = 1
+field_weights = {
+    'name': 1.0,
+    'city': 1.0,
+    'country': 0.5
+}
+
+
+def normalize_text(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    ascii_text = ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    return _non_alnum.sub(' ', ascii_text).strip()
+
+
+def _deletes(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class AirportSearchIndex(object):
+
+    def __init__(self, records):
+        self.airports = []
+        self.names = []
+        self.codes = {}
+        postings = defaultdict(dict)
+        for record in records:
+            if not record['iata']:
+                continue
+            number = len(self.airports)
+            self.airports.append(record)
+            self.names.append(record['name'])
+            self.codes.setdefault(record['iata'].lower(), number)
+            if record['icao']:
+                self.codes.setdefault(record['icao'].lower(), number)
+            for field, weight in field_weights.items():
+                for token in normalize_text(record[field]).split():
+                    postings[token][number] = max(postings[token].get(number, 0), weight)
+        self.postings = dict(postings)
+        self.vocabulary = sorted(self.postings)
+        self.typo_index = defaultdict(set)
+        for token in self.vocabulary:
+            if len(token) >= 4:
+                for variant in _deletes(token):
+                    self.typo_index[variant].add(token)
+
+    def _prefix_tokens(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def _typo_tokens(self, word):
+        if len(word) < 4:
+            return set()
+        # tokens one insert, delete or substitution away from word
+        candidates = set(self.typo_index.get(word, ()))
+        for variant in _deletes(word):
+            candidates.update(self.typo_index.get(variant, ()))
+            if variant in self.postings:
+                candidates.add(variant)
+        candidates.discard(word)
+        return candidates
+
+    def _word_tokens(self, word):
+        """(token, score) pairs one query word matches, best first."""
+        tokens = [(word, exact_score)] if word in self.postings else []
+        if len(word) >= min_prefix_length:
+            tokens.extend((token, prefix_score) for token in self._prefix_tokens(word) if token != word)
+            tokens.extend((token, typo_score) for token in self._typo_tokens(word))
+        return tokens
+
+    def _match_word(self, tokens):
+        scores = {}
+        budget = max_word_postings
+        for token, score in tokens:
+            postings = self.postings[token]
+            if budget <= 0:
+                break
+            budget -= len(postings)
+            for number, weight in islice(postings.items(), len(postings) + min(budget, 0)):
+                if scores.get(number, 0) < score * weight:
+                    scores[number] = score * weight
+        return scores
+
+    def _filter_word(self, scores, tokens):
+        # only the airports still in scores can match, so look them up instead of
+        # walking the postings of a common word
+        word_scores = {}
+        for token, score in tokens:
+            postings = self.postings[token]
+            if len(postings) < len(scores):
+                candidates = (number for number in postings if number in scores)
+            else:
+                candidates = (number for number in scores if number in postings)
+            for number in candidates:
+                if word_scores.get(number, 0) < score * postings[number]:
+                    word_scores[number] = score * postings[number]
+        return {number: scores[number] + word_score for number, word_score in word_scores.items()}
+
+    def search(self, query, limit=10):
+        """Return airports matching every word of query, best first.
+
+        Queries with no word of at least min_prefix_length letters that are not
+        an airport code return nothing, so the caller asks the remote endpoint.
+        """
+        normalized = normalize_text(query)
+        words = normalized.split()
+        code_match = self.codes.get(normalized.replace(' ', ''))
+        if not words or (code_match is None and max(map(len, words)) < min_prefix_length):
+            return []
+        # the most selective word first, so the others only filter its matches
+        matches = sorted((self._word_tokens(word) for word in words),
+                         key=lambda tokens: sum(len(self.postings[token]) for token, score in tokens))
+        scores = self._match_word(matches[0])
+        for tokens in matches[1:]:
+            if not scores:
+                break
+            scores = self._filter_word(scores, tokens)
+        if code_match is not None:
+            scores[code_match] = scores.get(code_match, 0) + code_score
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self.names[item[0]]))
+        return [self.airports[number] for number, score in ranked]
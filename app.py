@@ -1,18 +1,26 @@
 # -*- coding: utf-8 -*-
 
 from flask import Flask, request, abort, jsonify, send_from_directory
-from weather import Weather
+from weather import Weather, geocode_cache, forecast_cache, weather_timeout_text
 from places import Places
-from flight_api import FlightApi
-from aqi import WeatherAQI
+from flight_api import FlightApi, route_cache, airport_board_cache
+from aqi import WeatherAQI, nearest_station_cache, station_data_cache
+from cache import rendered_replies
+from http_client import default_client, LineHttpClient
+from singleflight import upstream_calls
+from webhook import EventDispatcher, EventQueue, log_line_api_error
+from router import PostbackRouter
+from intents import IntentClassifier
+from geo import parse_latlng
+from flex import FlexMessage
 import os
 import sys
 import json
-import re
 import errno
-import requests
+import queue
+from concurrent.futures import ThreadPoolExecutor, wait
 from linebot import (
-    LineBotApi, WebhookHandler
+    LineBotApi
 )
 
 from linebot.exceptions import (
@@ -36,10 +44,10 @@ from linebot.models import (
 )
 
 app = Flask(__name__)
-weather = Weather()
-places = Places()
-flight_api = FlightApi()
-weather_aqi = WeatherAQI()
+weather = Weather(http=default_client)
+places = Places(http=default_client)
+flight_api = FlightApi(http=default_client)
+weather_aqi = WeatherAQI(http=default_client)
 channel_secret = os.getenv('LINE_CHANNEL_SECRET', None)
 channel_access_token = os.getenv('LINE_CHANNEL_ACCESS_TOKEN', None)
 
@@ -51,8 +59,22 @@ if channel_access_token is None:
     sys.exit(1)
 static_tmp_path = os.path.join(os.path.dirname(__file__), 'static', 'tmp')
 
-line_bot_api = LineBotApi(channel_access_token)
-handler = WebhookHandler(channel_secret)
+# upstream chains of a single reply run concurrently on this pool and the
+# reply is sent with whatever finished before the deadline
+fanout_executor = ThreadPoolExecutor(max_workers=int(os.getenv('FANOUT_WORKERS', '8')))
+reply_deadline = float(os.getenv('REPLY_DEADLINE_SECONDS', '8'))
+
+line_bot_api = LineBotApi(channel_access_token, http_client=LineHttpClient)
+handler = EventDispatcher(channel_secret)
+# WEBHOOK_MODE=queue acknowledges /callback right after the signature check
+# and runs the handlers on a bounded in-process queue (WEBHOOK_WORKERS consumers)
+webhook_mode = os.getenv('WEBHOOK_MODE', 'sync')
+event_queue = EventQueue(handler)
+postback_router = PostbackRouter()
+text_intents = IntentClassifier()
+# base URL for links to files under static/; handlers may run off the request
+# (WEBHOOK_MODE=queue), so it is PUBLIC_URL or else taken from the webhook request
+public_url = os.getenv('PUBLIC_URL', None)
 
 
 def make_static_tmp_dir():
@@ -68,6 +90,9 @@ def make_static_tmp_dir():
 
 @app.route("/callback", methods=['POST'])
 def callback():
+    global public_url
+    if public_url is None:
+        public_url = request.host_url
     # get X-Line-Signature header value
     signature = request.headers['X-Line-Signature']
 
@@ -77,12 +102,17 @@ def callback():
 
     # handle webhook body
     try:
-        handler.handle(body, signature)
+        if webhook_mode == 'queue':
+            events = handler.parser.parse(body, signature)
+            try:
+                event_queue.put(events)
+            except queue.Full as full:
+                print('====== EVENT QUEUE FULL, HANDLING INLINE ======')
+                handler.handle_events(full.args[0])
+        else:
+            handler.handle(body, signature)
     except LineBotApiError as e:
-        print("Got exception from LINE Messaging API: %s\n" % e.message)
-        for m in e.error.details:
-            print("  %s: %s" % (m.property, m.message))
-        print("\n")
+        log_line_api_error(e)
     except InvalidSignatureError:
         abort(400)
 
@@ -97,19 +127,45 @@ def health_check():
         }
     )
 
+@app.route("/stats", methods=['GET'])
+def stats():
+    return jsonify(
+        {
+            'http': default_client.pool_stats(),
+            'geocode_cache': geocode_cache.stats(),
+            'forecast_cache': forecast_cache.stats(),
+            'aqi_station_cache': nearest_station_cache.stats(),
+            'aqi_data_cache': station_data_cache.stats(),
+            'route_cache': route_cache.stats(),
+            'airport_board_cache': airport_board_cache.stats(),
+            'rendered_replies': rendered_replies.stats(),
+            'singleflight': upstream_calls.stats(),
+            'event_queue': event_queue.stats()
+        }
+    )
+
 @app.route('/aqi', methods=['GET'])
 def push_aqi():
     to = request.args.get('id')
     lat = request.args.get('lat')
     lng = request.args.get('lng')
     print('====== PUSH AQI TO: {} ======='.format(to))
+    try:
+        if not to:
+            raise ValueError('id is required')
+        lat, lng = parse_latlng(lat, lng)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     aqi_station_id = weather_aqi.get_nearest_station(lat, lng)
     if aqi_station_id is not None:
         weather_aqi_data = weather_aqi.get_aqi_data(aqi_station_id)
         if weather_aqi_data is not None:
             weather_aqi_msg = weather_aqi.get_aqi_message(weather_aqi_data)
             messages = []
-            messages.append(FlexSendMessage(alt_text='Air Quality Index', contents=weather_aqi_msg))
+            messages.append(FlexMessage(alt_text='Air Quality Index', contents=weather_aqi_msg))
             line_bot_api.push_message(to=to, messages=messages)
     return jsonify({
         'status': 'ok'
@@ -124,7 +180,7 @@ def generate_flight_map(origin, destination, resolution='720x360'):
         'MX': resolution,
         'PM': '*'
     }
-    resp = requests.get(url, params=params)
+    resp = default_client.get(url, params=params)
     if resp.status_code == 200:
         dir_name = 'static'
         resolution = resolution.split('x')[1]
@@ -138,19 +194,53 @@ def generate_flight_map(origin, destination, resolution='720x360'):
             print('====== FILE: {0} IS EXIST ========'.format(filename))
         return 'https://{0}/{1}'.format(request.host, filename)
 
+def gather_reply_parts(*calls):
+    futures = [fanout_executor.submit(func, *args) for func, args in calls]
+    done, not_done = wait(futures, timeout=reply_deadline)
+    parts = []
+    for future in futures:
+        if future not in done:
+            future.cancel()
+            print('====== REPLY PART MISSED DEADLINE ======')
+        elif future.exception() is not None:
+            print('====== REPLY PART FAILED: {0} ======'.format(future.exception()))
+        elif future.result() is not None:
+            parts.append(future.result())
+    return parts
+
+def get_weather_reply(place_name_or_latlng):
+    weather_data = weather.get_weather_data(place_name_or_latlng)
+    weather_message = weather.get_weather_message(weather_data)
+    return FlexMessage(alt_text="Weather Forecast", contents=weather_message)
+
+def get_aqi_reply(lat, lng):
+    aqi_station_id = weather_aqi.get_nearest_station(lat, lng)
+    if aqi_station_id is None:
+        return None
+    weather_aqi_data = weather_aqi.get_aqi_data(aqi_station_id)
+    if weather_aqi_data is None:
+        return None
+    weather_aqi_msg = weather_aqi.get_aqi_message(weather_aqi_data)
+    return FlexMessage(alt_text='Air Quality Index', contents=weather_aqi_msg)
+
 @handler.add(MessageEvent, message=LocationMessage)
 def handle_location_message(event):
     latlng = '{0} {1}'.format(event.message.latitude, event.message.longitude)
-    weather_data = weather.get_weather_data(latlng)
-    weather_message = weather.get_weather_message(weather_data)
-    messages = []
-    messages.append(FlexSendMessage(alt_text="Weather Forecast", contents=weather_message))
-    aqi_station_id = weather_aqi.get_nearest_station(event.message.latitude, event.message.longitude)
-    if aqi_station_id is not None:
-        weather_aqi_data = weather_aqi.get_aqi_data(aqi_station_id)
-        if weather_aqi_data is not None:
-            weather_aqi_msg = weather_aqi.get_aqi_message(weather_aqi_data)
-            messages.append(FlexSendMessage(alt_text='Air Quality Index', contents=weather_aqi_msg))
+    messages = gather_reply_parts(
+        (get_weather_reply, (latlng,)),
+        (get_aqi_reply, (event.message.latitude, event.message.longitude))
+    )
+    if len(messages) == 0:
+        messages.append(TextSendMessage(text='Sorry, I couldn\'t get the weather for your location right now'))
+    nearest_airports = flight_api.get_nearest_airports(event.message.latitude, event.message.longitude)
+    if len(nearest_airports) > 0:
+        messages[-1].quick_reply = QuickReply(items=[
+            QuickReplyButton(
+                action=PostbackAction(label='{0} {1}'.format(airport['iata'], airport['city'])[:20],
+                                      data='airport={0}'.format(airport['iata']),
+                                      display_text='{0} Airport'.format(airport['iata']))
+            ) for airport in nearest_airports
+        ])
     # weather_aqi_data = weather.get_weather_aqi(event.message.latitude, event.message.longitude)
     # weather.get_weather_aqi_message_v2(weather_aqi_data)
     # weather_aqi_msg_v2 = weather.get_weather_aqi_message_v2(weather_aqi_data)
@@ -162,80 +252,94 @@ def handle_location_message(event):
 def handle_postback_event(event):
     data = event.postback.data
     print('postback data:{}'.format(data))
-    if 'place_search?' in data:
-        query_params = data.split('?')[1]
-        lat = float(query_params.split('&')[0].split('=')[1])
-        lng = float(query_params.split('&')[1].split('=')[1])
-        type = query_params.split('&')[2].split('=')[1]
-        if type == 'all':
-            places_data = places.get_nearby_places(lat, lng)
-        else:
-            places_data = places.get_nearby_places(lat, lng, type)
-        messages = []
-        if isinstance(places_data, str):
-            messages.append(TextSendMessage(text=places_data))
-            line_bot_api.reply_message(event.reply_token, messages=messages)
-        else:
-            messages.append(FlexSendMessage(alt_text='Places', contents=places_data))
+    postback_router.dispatch(event, data)
+
+
+@postback_router.add('place_search', lat=float, lng=float, type=str)
+def handle_place_search(event, lat, lng, type):
+    if type == 'all':
+        places_data = places.get_nearby_places(lat, lng, host_url=public_url)
+    else:
+        places_data = places.get_nearby_places(lat, lng, type, host_url=public_url)
+    messages = []
+    if isinstance(places_data, str):
+        messages.append(TextSendMessage(text=places_data))
+        line_bot_api.reply_message(event.reply_token, messages=messages)
+    else:
+        messages.append(FlexMessage(alt_text='Places', contents=places_data))
+        line_bot_api.reply_message(event.reply_token, messages)
+
+
+@postback_router.add('weather', place=str)
+def handle_weather_postback(event, place):
+    try:
+        weather_data = weather.get_weather_data(place)
+    except TimeoutError as e:
+        print('====== {0} ======'.format(e))
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=weather_timeout_text))
+        return
+    bubble_container = weather.get_weather_message(weather_data)
+    line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text="Weather Forecast",
+                                                                  contents=bubble_container))
+
+
+@postback_router.add('weather_hourly', lat=float, lng=float)
+def handle_weather_hourly_postback(event, lat, lng):
+    forecast_hourly_data = weather.get_weather_forcast_hourly(lat, lng)
+    bubble_container = weather.get_weather_forecast_hourly_data(forecast_hourly_data)
+    line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text="Weather Forecast Hourly",
+                                                                  contents=bubble_container))
+
+
+@postback_router.add('flight_info', flight_no=str)
+def handle_flight_info_postback(event, flight_no):
+    latest_flight = flight_api.get_latest_flight(flight_no)
+    if latest_flight is not None:
+        flight_metadata = flight_api.get_flight_metadata(latest_flight['flight_number'], latest_flight['adshex'])
+        if flight_metadata['success'] is True:
+            payload = flight_metadata['payload']
+            flight_schedule = None
+            if flight_api.needs_flight_schedule(payload):
+                flight_schedule = flight_api.get_flight_schedule(latest_flight['flight_number'])
+            flight_bubble = flight_api.create_flight_message(latest_flight['flight_number'], latest_flight['adshex'], payload, flight_schedule)
+            # image_original_url = generate_flight_map(flight_metadata['payload']['flightData']['departureApt'], flight_metadata['payload']['flightData']['arrivalApt'])
+            # image_preview_url = generate_flight_map(flight_metadata['payload']['flightData']['departureApt'], flight_metadata['payload']['flightData']['arrivalApt'], '240x120')
+            # image_msg = ImageSendMessage(original_content_url=image_original_url, preview_image_url=image_preview_url)
+            messages = []
+            messages.append(FlexMessage(alt_text="Flight Information", contents=flight_bubble))
+            # messages.append(image_msg)
             line_bot_api.reply_message(event.reply_token, messages)
 
-    if 'weather=' in data:
-        weather_data = weather.get_weather_data(data.split("=")[1])
-        bubble_container = weather.get_weather_message(weather_data)
-        line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="Weather Forecast",
-                                                                      contents=bubble_container))
-    if 'weather_hourly?' in data:
-        latlng = data.split('?')[1]
-        lat, lng = latlng.split('&')
-        lat = lat.split('=')[1]
-        lng = lng.split('=')[1]
-        forecast_hourly_data = weather.get_weather_forcast_hourly(lat, lng)
-        bubble_container = weather.get_weather_forecast_hourly_data(forecast_hourly_data)
-        line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="Weather Forecast Hourly",
-                                                                      contents=bubble_container))
-    
-    if 'flight_info' in data:
-        flight_no = data.split('=')[1]
-        latest_flight = flight_api.get_latest_flight(flight_no)
-        if latest_flight is not None:
-            flight_metadata = flight_api.get_flight_metadata(latest_flight['flight_number'], latest_flight['adshex'])
-            if flight_metadata['success'] is True:
-                flight_bubble = flight_api.create_flight_message(latest_flight['flight_number'], latest_flight['adshex'], flight_metadata['payload'])
-                # image_original_url = generate_flight_map(flight_metadata['payload']['flightData']['departureApt'], flight_metadata['payload']['flightData']['arrivalApt'])
-                # image_preview_url = generate_flight_map(flight_metadata['payload']['flightData']['departureApt'], flight_metadata['payload']['flightData']['arrivalApt'], '240x120')
-                # image_msg = ImageSendMessage(original_content_url=image_original_url, preview_image_url=image_preview_url)
-                messages = []
-                messages.append(FlexSendMessage(alt_text="Flight Information", contents=flight_bubble))
-                # messages.append(image_msg)
-                line_bot_api.reply_message(event.reply_token, messages)
-
-    if 'airport' in data:
-        airport_code = data.split('=')[1]
-        airport_name = flight_api.get_airport_name_from_code(airport_code)
-        if airport_name is not None:
-            airport_data = flight_api.get_airport_data(airport_code)
-            if airport_data is not None:
-                airport_message = flight_api.create_airport_message(airport_data)
-                line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="Airport Information",
-                                                                            contents=airport_message))
-            else:
-                line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Sorry, there is no airport information for \"{0}\"'.format(airport_name)))
+
+@postback_router.add('airport', airport_code=str)
+def handle_airport_postback(event, airport_code):
+    airport_name = flight_api.get_airport_name_from_code(airport_code)
+    if airport_name is not None:
+        airport_data = flight_api.get_airport_data(airport_code)
+        if airport_data is not None:
+            airport_message = flight_api.create_airport_message(airport_data)
+            line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text="Airport Information",
+                                                                        contents=airport_message))
         else:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Sorry, I could\'t find airport information for {0}'.format(airport_code)))
-    
-    if 'aqi_today_forecast' in data:
-        station_id = data.split('=')[1]
-        weather_aqi_data = weather_aqi.get_aqi_data(station_id)
-        if weather_aqi_data is not None:
-            bubble_msg = weather_aqi.get_aqi_today_message(weather_aqi_data)
-            line_bot_api.reply_message(event.reply_token, messages=FlexSendMessage(alt_text='Today Air Quality', contents=bubble_msg))
-    
-    if 'aqi_daily_forecast' in data:
-        station_id = data.split('=')[1]
-        weather_aqi_data = weather_aqi.get_aqi_data(station_id)
-        if weather_aqi_data is not None:
-            carousel_container = weather_aqi.get_aqi_daily_message(weather_aqi_data)
-            line_bot_api.reply_message(event.reply_token, messages=FlexSendMessage(alt_text='Daily Air Quality', contents=carousel_container))
+            line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Sorry, there is no airport information for \"{0}\"'.format(airport_name)))
+    else:
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Sorry, I could\'t find airport information for {0}'.format(airport_code)))
+
+
+@postback_router.add('aqi_today_forecast', station_id=str)
+def handle_aqi_today_postback(event, station_id):
+    weather_aqi_data = weather_aqi.get_aqi_data(station_id)
+    if weather_aqi_data is not None:
+        bubble_msg = weather_aqi.get_aqi_today_message(weather_aqi_data)
+        line_bot_api.reply_message(event.reply_token, messages=FlexMessage(alt_text='Today Air Quality', contents=bubble_msg))
+
+
+@postback_router.add('aqi_daily_forecast', station_id=str)
+def handle_aqi_daily_postback(event, station_id):
+    weather_aqi_data = weather_aqi.get_aqi_data(station_id)
+    if weather_aqi_data is not None:
+        carousel_container = weather_aqi.get_aqi_daily_message(weather_aqi_data)
+        line_bot_api.reply_message(event.reply_token, messages=FlexMessage(alt_text='Daily Air Quality', contents=carousel_container))
 
 def print_source(event):
     if isinstance(event.source, SourceUser):
@@ -248,121 +352,143 @@ def print_source(event):
 
 @handler.add(MessageEvent, message=TextMessage)
 def handle_text_message(event):
-    text = event.message.text
     print_source(event)
-    if 'aqi' == text.lower():
-        line_bot_api.reply_message(event.reply_token, messages=TextSendMessage(text='Please share your location to get an accurate AQI krub', 
-                    quick_reply=QuickReply(items=
-                        [
-                            QuickReplyButton(action=LocationAction(label='Share Location'))
-                        ]
-                    )))
-    
-    if 'มองบน' in text.lower():
-        image_carousel_template = ImageCarouselTemplate(columns=[
-            ImageCarouselColumn(image_url='https://media.giphy.com/media/5Wi5ydRYRM28q9Gvyv/giphy.gif',
-            action=MessageAction(label='มองบน', text='มองบน'))
-        ])
-        line_bot_api.reply_message(event.reply_token, TemplateSendMessage(alt_text='มองบนเรยจ้า', template=image_carousel_template))
-    
-    if 'lineqa' in text.lower():
-        image_carousel_template = ImageCarouselTemplate(columns=[
-            ImageCarouselColumn(image_url='https://media.giphy.com/media/4VUugEkI9a9DsKTmW1/giphy.gif',
-            action=MessageAction(label='Daebak', text='대박!'))
-        ])
-        line_bot_api.reply_message(event.reply_token, TemplateSendMessage(alt_text='대박!', template=image_carousel_template))
-        
-
-    if 'อากาศ' == text or 'weather' == text.lower():
-        quick_reply = QuickReply(
-            items=[
-                QuickReplyButton(
-                    action=LocationAction(label='Send Location')
-                ),
-                QuickReplyButton(
-                    action=PostbackAction(label='Tokyo Weather', data='weather=tokyo', display_text='Tokyo Weather')
-                ),
-                QuickReplyButton(
-                    action=PostbackAction(label='Seoul Weather', data='weather=seoul', display_text='Seoul Weather')
-                ),
-                QuickReplyButton(
-                    action=PostbackAction(label='London Weather', data='weather=london',
-                                          display_text='London Weather')
-                )
-            ]
-        )
-        reply_message = TextSendMessage(text="Let me know your location or place",
-                                        quick_reply=quick_reply)
-        line_bot_api.reply_message(event.reply_token, messages=reply_message)
-
-    m = re.match('weather in (.*)', text.lower())
-
-    if m is not None:
-        place_name = m.group(1)
+    text_intents.dispatch(event, event.message.text)
+
+
+@text_intents.add('aqi', r'aqi\Z')
+def handle_aqi_text(event):
+    line_bot_api.reply_message(event.reply_token, messages=TextSendMessage(text='Please share your location to get an accurate AQI krub', 
+                quick_reply=QuickReply(items=
+                    [
+                        QuickReplyButton(action=LocationAction(label='Share Location'))
+                    ]
+                )))
+
+
+@text_intents.add('look_up', r'(?s:.*?)มองบน')
+def handle_look_up_text(event):
+    image_carousel_template = ImageCarouselTemplate(columns=[
+        ImageCarouselColumn(image_url='https://media.giphy.com/media/5Wi5ydRYRM28q9Gvyv/giphy.gif',
+        action=MessageAction(label='มองบน', text='มองบน'))
+    ])
+    line_bot_api.reply_message(event.reply_token, TemplateSendMessage(alt_text='มองบนเรยจ้า', template=image_carousel_template))
+
+
+@text_intents.add('lineqa', r'(?s:.*?)lineqa')
+def handle_lineqa_text(event):
+    image_carousel_template = ImageCarouselTemplate(columns=[
+        ImageCarouselColumn(image_url='https://media.giphy.com/media/4VUugEkI9a9DsKTmW1/giphy.gif',
+        action=MessageAction(label='Daebak', text='대박!'))
+    ])
+    line_bot_api.reply_message(event.reply_token, TemplateSendMessage(alt_text='대박!', template=image_carousel_template))
+
+
+@text_intents.add('weather_menu', r'(?:อากาศ|weather)\Z')
+def handle_weather_menu_text(event):
+    quick_reply = QuickReply(
+        items=[
+            QuickReplyButton(
+                action=LocationAction(label='Send Location')
+            ),
+            QuickReplyButton(
+                action=PostbackAction(label='Tokyo Weather', data='weather=tokyo', display_text='Tokyo Weather')
+            ),
+            QuickReplyButton(
+                action=PostbackAction(label='Seoul Weather', data='weather=seoul', display_text='Seoul Weather')
+            ),
+            QuickReplyButton(
+                action=PostbackAction(label='London Weather', data='weather=london',
+                                      display_text='London Weather')
+            )
+        ]
+    )
+    reply_message = TextSendMessage(text="Let me know your location or place",
+                                    quick_reply=quick_reply)
+    line_bot_api.reply_message(event.reply_token, messages=reply_message)
+
+
+@text_intents.add('weather_in', r'weather in (.*)')
+def handle_weather_in_text(event, place_name):
+    location = weather.get_latlng_from_place_name(place_name)
+    if isinstance(location, str):
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=location))
+        return
+    try:
         weather_data = weather.get_weather_data(place_name)
-        latlng_data, address = weather.get_latlng_from_place_name(place_name)
-        # weather_aqi_data = weather.get_weather_aqi_by_place_name(place_name)
-        weather_aqi_station_id = weather_aqi.get_nearest_station(latlng_data['lat'], latlng_data['lng'])
-        weather_aqi_data = weather_aqi.get_aqi_data(weather_aqi_station_id)
-        if isinstance(weather_data, str):
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=weather_data))
-        else:
-            messages = []
-            weather_msg = weather.get_weather_message(weather_data)
-            messages.append(FlexSendMessage(alt_text="Weather Forecast", contents=weather_msg))
-            if weather_aqi_data is not None:
-                weather_aqi_msg = weather_aqi.get_aqi_message(weather_aqi_data)
-                messages.append(FlexSendMessage(alt_text="Air Quality Index", contents=weather_aqi_msg))
-            # weather_aqi_msg = weather.get_weather_aqi_message(weather_aqi_data)
-            # messages.append(weather_aqi_msg)
-            # weather.get_weather_aqi_message_v2(weather_aqi_data)
-            # weather_aqi_msg_v2 = weather.get_weather_aqi_message_v2(weather_aqi_data)
-            # messages.append(weather_aqi_msg_v2)
-            line_bot_api.reply_message(event.reply_token, messages=messages)
-
-    n = re.match('flight (.*)', text.lower())
-    if n is not None:
-        latest_flight = flight_api.get_latest_flight(n.group(1).upper())
-        if latest_flight is not None:
-            flight_metadata = flight_api.get_flight_metadata(latest_flight['flight_number'], latest_flight['adshex'])
-            if flight_metadata['success'] is True:
-                flight_bubble = flight_api.create_flight_message(latest_flight['flight_number'], latest_flight['adshex'], flight_metadata['payload'])
-                messages = []
-                messages.append(FlexSendMessage(alt_text="Flight Information", contents=flight_bubble))
-                line_bot_api.reply_message(event.reply_token, messages)
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Sorry, I can\'t find your flight: {}. Please try another flight number'.format(n.group(1).upper())))
-
-    p = re.match('(^[A-Z]{3}-[A-Z]{3}$)', text.upper())
-    if p is not None:
-        text = p.group(1).upper()
-        origin = text.split('-')[0]
-        destination = text.split('-')[1]
-        flight_route_data = flight_api.get_flight_by_route(origin, destination)
-        if flight_route_data is not None:
-            carouesel_container = flight_api.create_flight_route_message(flight_route_data)
-            line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="Flight {0} Route Info".format(text),
-                                                                          contents=carouesel_container))
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Sorry, There is no flight for "{}" route.'.format(text)))
-    
-    q = re.match('airport (.*)', text.lower())
-    if q is not None:
-        text = q.group(1).lower()
-        airports = flight_api.get_airport_code(text)
-        if airports is not None:
-            quick_reply_items = []
-            for airport in airports:
-                airport_name = (airport['title'][:14] + ' ({0})'.format(airport['url'].split('/')[-1])) if len(airport['title']) > 14 else airport['title'] + ' ({0})'.format(airport['url'].split('/')[-1])
-                quick_reply_items.append(
-                    {
-                        "type": "action",
-                        "action": {
-                            "type": "postback",
-                            "label": airport_name,
-                            "data": "airport={0}".format(airport['url'].split('/')[-1])
-                        }
+    except TimeoutError as e:
+        print('====== {0} ======'.format(e))
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=weather_timeout_text))
+        return
+    latlng_data, address = location
+    # weather_aqi_data = weather.get_weather_aqi_by_place_name(place_name)
+    weather_aqi_station_id = weather_aqi.get_nearest_station(latlng_data['lat'], latlng_data['lng'])
+    weather_aqi_data = weather_aqi.get_aqi_data(weather_aqi_station_id)
+    if isinstance(weather_data, str):
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=weather_data))
+    else:
+        messages = []
+        weather_msg = weather.get_weather_message(weather_data)
+        messages.append(FlexMessage(alt_text="Weather Forecast", contents=weather_msg))
+        if weather_aqi_data is not None:
+            weather_aqi_msg = weather_aqi.get_aqi_message(weather_aqi_data)
+            messages.append(FlexMessage(alt_text="Air Quality Index", contents=weather_aqi_msg))
+        # weather_aqi_msg = weather.get_weather_aqi_message(weather_aqi_data)
+        # messages.append(weather_aqi_msg)
+        # weather.get_weather_aqi_message_v2(weather_aqi_data)
+        # weather_aqi_msg_v2 = weather.get_weather_aqi_message_v2(weather_aqi_data)
+        # messages.append(weather_aqi_msg_v2)
+        line_bot_api.reply_message(event.reply_token, messages=messages)
+
+
+@text_intents.add('flight', r'flight (.*)')
+def handle_flight_text(event, flight_no):
+    flight_no = flight_no.upper()
+    latest_flight = flight_api.get_latest_flight(flight_no)
+    if latest_flight is not None:
+        flight_metadata = flight_api.get_flight_metadata(latest_flight['flight_number'], latest_flight['adshex'])
+        if flight_metadata['success'] is True:
+            payload = flight_metadata['payload']
+            flight_schedule = None
+            if flight_api.needs_flight_schedule(payload):
+                flight_schedule = flight_api.get_flight_schedule(latest_flight['flight_number'])
+            flight_bubble = flight_api.create_flight_message(latest_flight['flight_number'], latest_flight['adshex'], payload, flight_schedule)
+            line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text="Flight Information", contents=flight_bubble))
+            return
+    line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Sorry, I can\'t find your flight: {}. Please try another flight number'.format(flight_no)))
+
+
+@text_intents.add('route', r'([a-z]{3}-[a-z]{3})$')
+def handle_route_text(event, route):
+    text = route.upper()
+    origin, destination = text.split('-')
+    flight_route_data = flight_api.get_flight_by_route(origin, destination)
+    if flight_route_data is not None:
+        carouesel_container = flight_api.create_flight_route_message(flight_route_data)
+        line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text="Flight {0} Route Info".format(text),
+                                                                      contents=carouesel_container))
+        return
+    line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Sorry, There is no flight for "{}" route.'.format(text)))
+
+
+@text_intents.add('airport', r'airport (.*)')
+def handle_airport_text(event, query):
+    airports = flight_api.get_airport_code(query)
+    if airports is not None:
+        quick_reply_items = []
+        for airport in airports:
+            airport_name = (airport['title'][:14] + ' ({0})'.format(airport['url'].split('/')[-1])) if len(airport['title']) > 14 else airport['title'] + ' ({0})'.format(airport['url'].split('/')[-1])
+            quick_reply_items.append(
+                {
+                    "type": "action",
+                    "action": {
+                        "type": "postback",
+                        "label": airport_name,
+                        "data": "airport={0}".format(airport['url'].split('/')[-1])
                     }
-                )
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Here are possible airports', quick_reply=QuickReply(items=quick_reply_items)))
+                }
+            )
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Here are possible airports', quick_reply=QuickReply(items=quick_reply_items)))
 
 
 make_static_tmp_dir()
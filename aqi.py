@@ -1,15 +1,22 @@
 
-import requests
 import os
 import json
+import time
+import threading
 from datetime import datetime
-import dateutil.parser
-from dateutil.tz import gettz
+from http_client import default_client
+from cache import TTLCache, rendered_replies, refresh_executor
+from geo import GeoIndex, snap_to_grid, haversine_km
+from singleflight import upstream_calls
+from flex import Template, Slot, Splice
+from aqi_levels import airvisual_styles, style_for, styles_for
+from timeutil import parse_iso, format_iso_local
+from daily import aggregate_daily
 api_host = os.getenv('NEW_AQI_API_HOST', None)
 api_key = os.getenv('NEW_AQI_API_KEY', None)
 
 from linebot.models import (
-    BubbleContainer, FlexSendMessage, TextSendMessage, TextMessage, CarouselContainer
+    FlexSendMessage, TextSendMessage, TextMessage
 )
 
 headers = {
@@ -22,442 +29,582 @@ headers = {
     'x-aqi-index': 'us'
 }
 
-class WeatherAQI(object):
+# level 1: neighbourhood grid cell -> nearest station id, which hardly ever changes
+station_grid_degrees = float(os.getenv('AQI_STATION_GRID_DEGREES', '0.01'))
+nearest_station_cache = TTLCache(maxsize=int(os.getenv('AQI_STATION_CACHE_SIZE', '4096')),
+                                 ttl=int(os.getenv('AQI_STATION_TTL', str(7 * 24 * 3600))),
+                                 stale_ttl=int(os.getenv('AQI_STATION_STALE_TTL', str(30 * 24 * 3600))))
+# level 2: station id -> station payload, fresh until the next hourly reading is due
+station_data_cache = TTLCache(maxsize=int(os.getenv('AQI_DATA_CACHE_SIZE', '1024')),
+                              ttl=900,
+                              stale_ttl=int(os.getenv('AQI_DATA_STALE_TTL', str(3 * 3600))))
+reading_interval = 3600
+reading_slack = 300
+min_data_ttl = 60
 
-    def get_nearest_station(self, lat, lng):
-        url = '{0}/api/v4/nearest'.format(api_host)
-        req_body = {
-            'lat': lat,
-            'lon': lng
-        }
-        response = requests.post(url, headers=headers, json=req_body)
-        resp_json = response.json()
-        if resp_json['status'] == 'success':
-            return resp_json['data']['id']
-        return None
-    
-    def get_aqi_data(self, station_id):
-        url = '{0}/api/v3/station/id?id={1}'.format(api_host, station_id)
-        response = requests.get(url, headers=headers)
-        resp_json = response.json()
-        if resp_json['status'] == 'success':
-            return resp_json['data']
-        return None
-    
-    # custom text color, background color, icon
-    def _get_aqi_message_style(self, aqi_level):
-        styles = dict()
-        if aqi_level > 0 and aqi_level <= 50:
-            styles['text'] = 'Good'
-            styles['background_color'] = '#a8e05f'
-            styles['text_color'] = '#718B3C'
-            styles['text_size'] = 'xxl'
-            styles['icon_url'] = 'https://i.imgur.com/3uysQp6.png'
-            styles['level_image_url'] = 'https://i.imgur.com/nETuKgV.png'
-                
-        elif aqi_level > 50 and aqi_level <= 100:
-            styles['text'] = 'Moderate'
-            styles['background_color'] = '#FDD74B'
-            styles['text_color'] = '#A57F23'
-            styles['text_size'] = 'xxl'
-            styles['icon_url'] = 'https://i.imgur.com/jT8N7QZ.png'
-            styles['level_image_url'] = 'https://i.imgur.com/S8flXXh.png'
-
-        elif aqi_level > 100 and aqi_level <= 150:
-            styles['text'] = 'Unhealthy for Sensitive Groups'
-            styles['background_color'] = '#fe9b57'
-            styles['text_color'] = '#b25826'
-            styles['text_size'] = 'sm'
-            styles['icon_url'] = 'https://i.imgur.com/ivh1pqK.png'
-            styles['level_image_url'] = 'https://i.imgur.com/D0vyXVx.png'
-
-        elif aqi_level > 150 and aqi_level <= 200:
-            styles['text'] = 'Unhealthy'
-            styles['background_color'] = '#fe6a69'
-            styles['text_color'] = '#af2c3b'
-            styles['text_size'] = 'xxl'
-            styles['icon_url'] = 'https://i.imgur.com/8tXR9wV.png'
-            styles['level_image_url'] = 'https://i.imgur.com/Rbi6wIW.png'
-
-        elif aqi_level > 200 and aqi_level <= 300:
-            styles['text'] = 'Very Unhealthy'
-            styles['background_color'] = '#A97ABE'
-            styles['text_color'] = '#946AA9'
-            styles['text_size'] = 'xxl'
-            styles['icon_url'] = 'https://i.imgur.com/rEfasQc.png'
-            styles['level_image_url'] = 'https://i.imgur.com/eibuQO2.png'
-
-        elif aqi_level > 300:
-            styles['text'] = 'Hazardous'
-            styles['background_color'] = '#7E4D51'
-            styles['text_color'] = '#5D3B39'
-            styles['text_size'] = 'xxl'
-            styles['icon_url'] = 'https://i.imgur.com/DhQWeMe.png'
-            styles['level_image_url'] = 'https://i.imgur.com/qXm1PmD.png'
-        return styles
 
-    def get_aqi_message(self, aqi_raw_data):
-        styles = self._get_aqi_message_style(aqi_raw_data['current_measurement']['aqius'])
-        bubble = {
-            "type": "bubble",
-            "direction": "ltr",
-            "header": {
+
+class StationCatalogue(object):
+    """Every station seen in an upstream response, with an in-process nearest search.
+
+    Set AQI_STATION_CATALOGUE_PATH to persist it so it stays warm across restarts;
+    workers sharing the file merge their stations into it.
+
+    Stations found after the k-d tree was built wait in a small pending list
+    that nearest() scans directly; once rebuild_after of them have piled up
+    the tree is rebuilt on the refresh pool, off the request path.
+    """
+
+    def __init__(self, persist_path=None, rebuild_after=256):
+        self._stations = TTLCache(maxsize=50000, ttl=365 * 24 * 3600, persist_path=persist_path)
+        self.rebuild_after = rebuild_after
+        self._lock = threading.Lock()
+        self._index = self._build_index()
+        self._pending = {}
+        self._rebuilding = False
+
+    def __len__(self):
+        return len(self._stations)
+
+    def _build_index(self):
+        return GeoIndex((key, value[0], value[1]) for key, value in self._stations.items())
+
+    def add(self, station_id, lat, lng):
+        if station_id is None or lat is None or lng is None:
+            return
+        key, value = str(station_id), [float(lat), float(lng)]
+        if self._stations.get(key) == value:
+            return
+        self._stations.set(key, value)
+        with self._lock:
+            self._pending[key] = value
+            rebuild = len(self._pending) >= self.rebuild_after and not self._rebuilding
+            if rebuild:
+                self._rebuilding = True
+        if rebuild:
+            refresh_executor.submit(self._rebuild)
+
+    def _rebuild(self):
+        with self._lock:
+            indexed = dict(self._pending)
+        try:
+            index = self._build_index()
+        except Exception as e:
+            print('====== STATION INDEX REBUILD FAILED: {0} ======'.format(e))
+            index = None
+        with self._lock:
+            if index is not None:
+                self._index = index
+                for key, value in indexed.items():
+                    if self._pending.get(key) == value:
+                        del self._pending[key]
+            self._rebuilding = False
+
+    def add_from_payload(self, data):
+        station_id = data.get('_id') or data.get('id')
+        location = data.get('location') or {}
+        coordinates = location.get('coordinates')
+        if coordinates and len(coordinates) == 2:
+            # GeoJSON order: [longitude, latitude]
+            self.add(station_id, coordinates[1], coordinates[0])
+        elif 'latitude' in data and 'longitude' in data:
+            self.add(station_id, data['latitude'], data['longitude'])
+
+    def nearest(self, lat, lng, max_km):
+        lat, lng = float(lat), float(lng)
+        with self._lock:
+            index, pending = self._index, list(self._pending.items())
+        found = index.nearest(lat, lng, 1, max_km) if len(index) else []
+        best = found[0] if found else None
+        for key, (station_lat, station_lng) in pending:
+            distance = haversine_km(lat, lng, station_lat, station_lng)
+            if distance <= max_km and (best is None or distance < best[0]):
+                best = (distance, key)
+        return best[1] if best else None
+
+station_catalogue = StationCatalogue(os.getenv('AQI_STATION_CATALOGUE_PATH', None))
+# a known station closer than this answers nearest-station queries locally
+local_station_max_km = float(os.getenv('AQI_LOCAL_STATION_MAX_KM', '3'))
+
+
+def _station_data_ttl(data):
+    """Seconds until the station's next hourly reading should be published."""
+    for section in ('current_measurement', 'current_weather'):
+        ts = (data.get(section) or {}).get('ts')
+        if ts:
+            try:
+                published = parse_iso(ts).epoch
+            except (ValueError, OverflowError):
+                continue
+            return max(min_data_ttl, published + reading_interval + reading_slack - time.time())
+    return None
+
+
+def _reading_version(data):
+    """Identifies the station reading a message is rendered from, or None if it has no timestamps."""
+    version = tuple((data.get(section) or {}).get('ts') for section in ('current_measurement', 'current_weather'))
+    return version if any(version) else None
+
+
+aqi_bubble = Template({
+    "type": "bubble",
+    "direction": "ltr",
+    "header": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
                 "type": "box",
-                "layout": "vertical",
+                "layout": "baseline",
+                "spacing": "sm",
                 "contents": [
+                    {
+                        "type": "icon",
+                        "url": "https://i.imgur.com/m0st7TA.png",
+                        "size": "xs"
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('station'),
+                        "size": "xs",
+                        "align": "start",
+                        "color": "#C1C4C5",
+                        "wrap": True
+                    }
+                ]
+            }
+        ]
+    },
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "box",
+                "layout": "horizontal",
+                "contents": [
+                    {
+                        "type": "image",
+                        "url": Slot('icon_url'),
+                        "flex": 0
+                    },
                     {
                         "type": "box",
-                        "layout": "baseline",
-                        "spacing": "sm",
+                        "layout": "vertical",
                         "contents": [
                             {
-                                "type": "icon",
-                                "url": "https://i.imgur.com/m0st7TA.png",
-                                "size": "xs"
+                                "type": "text",
+                                "text": Slot('aqi'),
+                                "size": "xxl",
+                                "align": "center",
+                                "weight": "bold",
+                                "color": Slot('text_color')
                             },
                             {
                                 "type": "text",
-                                "text": "{0}, {1}".format(aqi_raw_data['name'], aqi_raw_data['city']),
+                                "text": "US AQI",
                                 "size": "xs",
-                                "align": "start",
-                                "color": "#C1C4C5",
+                                "align": "center",
+                                "color": Slot('text_color')
+                            },
+                            {
+                                "type": "text",
+                                "text": Slot('level_text'),
+                                "size": Slot('text_size'),
+                                "align": "center",
+                                "gravity": "center",
+                                "weight": "bold",
+                                "color": Slot('text_color'),
                                 "wrap": True
                             }
                         ]
                     }
                 ]
-            },
-            "body": {
+            }
+        ]
+    },
+    "footer": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "md",
+        "contents": [
+            {
                 "type": "box",
-                "layout": "vertical",
+                "layout": "horizontal",
                 "contents": [
                     {
                         "type": "box",
                         "layout": "horizontal",
+                        "spacing": "sm",
                         "contents": [
                             {
                                 "type": "image",
-                                "url": styles['icon_url'],
-                                "flex": 0
+                                "url": Slot('weather_icon_url'),
+                                "flex": 0,
+                                "size": "xxs"
                             },
                             {
-                                "type": "box",
-                                "layout": "vertical",
-                                "contents": [
-                                    {
-                                        "type": "text",
-                                        "text": str(aqi_raw_data['current_measurement']['aqius']),
-                                        "size": "xxl",
-                                        "align": "center",
-                                        "weight": "bold",
-                                        "color": styles['text_color']
-                                    },
-                                    {
-                                        "type": "text",
-                                        "text": "US AQI",
-                                        "size": "xs",
-                                        "align": "center",
-                                        "color": styles['text_color']
-                                    },
-                                    {
-                                        "type": "text",
-                                        "text": styles['text'],
-                                        "size": styles['text_size'],
-                                        "align": "center",
-                                        "gravity": "center",
-                                        "weight": "bold",
-                                        "color": styles['text_color'],
-                                        "wrap": True
-                                    }
-                                ]
+                                "type": "text",
+                                "text": Slot('temperature'),
+                                "size": "md",
+                                "gravity": "center",
+                                "color": "#AAAAAA"
                             }
                         ]
-                    }
-                ]
-            },
-            "footer": {
-                "type": "box",
-                "layout": "vertical",
-                "spacing": "md",
-                "contents": [
+                    },
                     {
                         "type": "box",
                         "layout": "horizontal",
                         "contents": [
                             {
-                                "type": "box",
-                                "layout": "horizontal",
-                                "spacing": "sm",
-                                "contents": [
-                                    {
-                                        "type": "image",
-                                        "url": "https://airvisual.com/images/{0}.png".format(aqi_raw_data['current_weather']['ic']),
-                                        "flex": 0,
-                                        "size": "xxs"
-                                    },
-                                    {
-                                        "type": "text",
-                                        "text": "{0} °".format(aqi_raw_data['current_weather']['tp']),
-                                        "size": "md",
-                                        "gravity": "center",
-                                        "color": "#AAAAAA"
-                                    }
-                                ]
-                            },
-                            {
-                                "type": "box",
-                                "layout": "horizontal",
-                                "contents": [
-                                    {
-                                        "type": "image",
-                                        "url": "https://i.imgur.com/e8ZIslf.png",
-                                        "flex": 0,
-                                        "size": "xxs"
-                                    },
-                                    {
-                                        "type": "text",
-                                        "text": "{0}%".format(aqi_raw_data['current_weather']['hu']),
-                                        "size": "md",
-                                        "gravity": "center",
-                                        "color": "#AAAAAA"
-                                    }
-                                ]
+                                "type": "image",
+                                "url": "https://i.imgur.com/e8ZIslf.png",
+                                "flex": 0,
+                                "size": "xxs"
                             },
                             {
-                                "type": "box",
-                                "layout": "horizontal",
-                                "contents": [
-                                    {
-                                        "type": "image",
-                                        "url": "https://i.imgur.com/1qlbadb.png",
-                                        "align": "start",
-                                        "size": "xxs"
-                                    },
-                                    {
-                                        "type": "text",
-                                        "text": "{0} km/h".format(aqi_raw_data['current_weather']['ws']*3.6),
-                                        "size": "sm",
-                                        "gravity": "center",
-                                        "color": "#AAAAAA",
-                                        "wrap": True
-                                    }
-                                ]
+                                "type": "text",
+                                "text": Slot('humidity'),
+                                "size": "md",
+                                "gravity": "center",
+                                "color": "#AAAAAA"
                             }
                         ]
                     },
                     {
-                        "type": "separator"
-                    },
-                    {
-                        "type": "button",
-                        "action": {
-                            "type": "postback",
-                            "label": "Today Forecast",
-                            "text": "Today Forecast",
-                            "data": "aqi_today_forecast?station_id={0}".format(aqi_raw_data['_id'])
-                        },
-                        "color": "#D6D6D6",
-                        "height": "sm",
-                        "style": "secondary"
-                    },
-                    {
-                        "type": "button",
-                        "action": {
-                            "type": "postback",
-                            "label": "Daily Forecast",
-                            "text": "Daily Forecast",
-                            "data": "aqi_daily_forecast?station_id={0}".format(aqi_raw_data['_id'])
-                        },
-                        "color": "#D6D6D6",
-                        "height": "sm",
-                        "style": "secondary"
+                        "type": "box",
+                        "layout": "horizontal",
+                        "contents": [
+                            {
+                                "type": "image",
+                                "url": "https://i.imgur.com/1qlbadb.png",
+                                "align": "start",
+                                "size": "xxs"
+                            },
+                            {
+                                "type": "text",
+                                "text": Slot('wind_speed'),
+                                "size": "sm",
+                                "gravity": "center",
+                                "color": "#AAAAAA",
+                                "wrap": True
+                            }
+                        ]
                     }
                 ]
             },
-            "styles": {
-                "header": {
-                    "backgroundColor": "#033C5A"
+            {
+                "type": "separator"
+            },
+            {
+                "type": "button",
+                "action": {
+                    "type": "postback",
+                    "label": "Today Forecast",
+                    "text": "Today Forecast",
+                    "data": Slot('today_data')
+                },
+                "color": "#D6D6D6",
+                "height": "sm",
+                "style": "secondary"
+            },
+            {
+                "type": "button",
+                "action": {
+                    "type": "postback",
+                    "label": "Daily Forecast",
+                    "text": "Daily Forecast",
+                    "data": Slot('daily_data')
                 },
-                "body": {
-                    "backgroundColor": styles["background_color"]
-                }
+                "color": "#D6D6D6",
+                "height": "sm",
+                "style": "secondary"
             }
+        ]
+    },
+    "styles": {
+        "header": {
+            "backgroundColor": "#033C5A"
+        },
+        "body": {
+            "backgroundColor": Slot('background_color')
         }
-        return BubbleContainer.new_from_json_dict(bubble)
+    }
+})
 
-    def _convert_str_to_date(self, date_str, tz_str, output_date_format='%-I%p'):
-        dt = dateutil.parser.parse(date_str)
-        local_dt = dt.astimezone(gettz(tz_str))
-        return local_dt.strftime(output_date_format)
+aqi_separator = {
+    "type": "separator",
+    "color": "#EAEAEA"
+}
 
-    def get_aqi_today_message(self, aqi_raw_data, limit=7):
-        local_timezone = aqi_raw_data['timezone']
-        today_date_str = self._convert_str_to_date(aqi_raw_data['current_weather']['ts'], tz_str=local_timezone, output_date_format='%A %-d %B %Y')
-        forecasts = aqi_raw_data['forecasts']
-        bubble = {
-            "type": "bubble",
-            "direction": "ltr",
-            "body": {
+aqi_today_bubble = Template({
+    "type": "bubble",
+    "direction": "ltr",
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "sm",
+        "contents": [
+            {
+                "type": "text",
+                "text": Slot('date'),
+                "align": "center",
+                "size": "sm"
+            },
+            aqi_separator,
+            Splice('forecast_rows')
+        ]
+    }
+})
+
+aqi_today_row = Template({
+    "type": "box",
+    "layout": "horizontal",
+    "contents": [
+        {
+            "type": "text",
+            "text": Slot('time'),
+            "size": "sm",
+            "gravity": "center"
+        },
+        {
+            "type": "image",
+            "url": Slot('weather_icon_url'),
+            "flex": 0,
+            "gravity": "center",
+            "size": "xs",
+            "aspectRatio": "2:1"
+        },
+        {
+            "type": "text",
+            "text": Slot('temperature'),
+            "size": "sm",
+            "gravity": "center"
+        },
+        {
+            "type": "image",
+            "url": Slot('level_image_url'),
+            "align": "end",
+            "gravity": "center",
+            "size": "xs",
+            "aspectRatio": "2:1"
+        }
+    ]
+})
+
+aqi_daily_bubble = Template({
+    "type": "bubble",
+    "direction": "ltr",
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "sm",
+        "contents": [
+            {
+                "type": "text",
+                "text": Slot('date'),
+                "size": "sm",
+                "align": "center",
+                "color": Slot('text_color')
+            },
+            {
+                "type": "separator",
+                "color": Slot('text_color')
+            },
+            {
                 "type": "box",
-                "layout": "vertical",
-                "spacing": "sm",
+                "layout": "horizontal",
                 "contents": [
                     {
-                        "type": "text",
-                        "text": today_date_str,
-                        "align": "center",
-                        "size": "sm"
+                        "type": "image",
+                        "url": Slot('icon_url'),
+                        "aspectRatio": "1:1",
+                        "flex": 0
                     },
-                    {
-                        "type": "separator",
-                        "color": "#EAEAEA"
-                    }
-                ]
-            }
-        }
-        added_item = 0
-        for index in range(0, len(forecasts)):
-            if added_item > limit:
-                break
-            timestamp = forecasts[index]['ts']
-            if 'ic' not in forecasts[index]:
-                continue
-            if timestamp is not None: 
-                bubble['body']['contents'].append(
                     {
                         "type": "box",
-                        "layout": "horizontal",
+                        "layout": "vertical",
                         "contents": [
                             {
                                 "type": "text",
-                                "text": self._convert_str_to_date(timestamp, tz_str=local_timezone),
-                                "size": "sm",
-                                "gravity": "center"
+                                "text": Slot('aqi'),
+                                "size": 'xxl',
+                                "align": "center",
+                                "weight": "bold",
+                                "color": Slot('text_color')
                             },
                             {
-                                "type": "image",
-                                "url": "https://airvisual.com/images/{0}.png".format(forecasts[index]['ic']),
-                                "flex": 0,
-                                "gravity": "center",
+                                "type": "text",
+                                "text": "US AQI",
                                 "size": "xs",
-                                "aspectRatio": "2:1"
+                                "align": "center",
+                                "color": Slot('text_color')
                             },
                             {
                                 "type": "text",
-                                "text": "{0} °C".format(forecasts[index]['tp']),
-                                "size": "sm",
-                                "gravity": "center"
-                            },
-                            {
-                                "type": "image",
-                                "url": self._get_aqi_message_style(forecasts[index]['aqius'])['level_image_url'],
-                                "align": "end",
+                                "text": Slot('level_text'),
+                                "size": Slot('text_size'),
+                                "align": "center",
                                 "gravity": "center",
-                                "size": "xs",
-                                "aspectRatio": "2:1"
+                                "weight": "bold",
+                                "color": Slot('text_color'),
+                                "wrap": True
                             }
                         ]
                     }
-                )
-                bubble['body']['contents'].append(
-                    {
-                        "type": "separator",
-                        "color": "#EAEAEA"
-                    }
-                )
-                added_item += 1
-        return BubbleContainer.new_from_json_dict(bubble)
+                ]
+            }
+        ]
+    },
+    "styles": {
+        "body": {
+            "backgroundColor": Slot('background_color')
+        }
+    }
+})
+
+
+class WeatherAQI(object):
+
+    def __init__(self, http=None):
+        self.http = http or default_client
+
+    def get_nearest_station(self, lat, lng):
+        station_id, cache_key = self._local_nearest_station(lat, lng)
+        if station_id is not None:
+            return station_id
+        return nearest_station_cache.get_or_refresh(cache_key, lambda: self._fetch_nearest_station(lat, lng))
+
+    def _local_nearest_station(self, lat, lng):
+        # a known station close enough answers without a call; otherwise the
+        # nearest_station_cache key of the grid cell
+        station_id = station_catalogue.nearest(lat, lng, local_station_max_km)
+        if station_id is not None:
+            return station_id, None
+        return None, '{0},{1}'.format(*snap_to_grid(lat, lng, station_grid_degrees))
+
+    def _fetch_nearest_station(self, lat, lng):
+        url, req_body = self._nearest_station_request(lat, lng)
+        response = self.http.post(url, headers=headers, json=req_body)
+        return self._parse_nearest_station(response.json())
+
+    def _nearest_station_request(self, lat, lng):
+        req_body = {
+            'lat': lat,
+            'lon': lng
+        }
+        return '{0}/api/v4/nearest'.format(api_host), req_body
+
+    def _parse_nearest_station(self, resp_json):
+        data = self._parse_station_response(resp_json)
+        return data['id'] if data is not None else None
+    
+    def get_aqi_data(self, station_id):
+        cache_key = str(station_id)
+        return station_data_cache.get_or_refresh(
+            cache_key,
+            lambda: upstream_calls.do('aqi_data:{0}'.format(cache_key), self._fetch_aqi_data, station_id),
+            ttl=_station_data_ttl)
+
+    def _fetch_aqi_data(self, station_id):
+        url = '{0}/api/v3/station/id?id={1}'.format(api_host, station_id)
+        response = self.http.get(url, headers=headers)
+        return self._parse_station_response(response.json())
+
+    def _parse_station_response(self, resp_json):
+        if resp_json['status'] == 'success':
+            station_catalogue.add_from_payload(resp_json['data'])
+            return resp_json['data']
+        return None
+    
+    def get_aqi_message(self, aqi_raw_data):
+        return rendered_replies.get_or_render('aqi', aqi_raw_data['_id'], _reading_version(aqi_raw_data),
+                                              lambda: self._render_aqi_message(aqi_raw_data))
+
+    def _render_aqi_message(self, aqi_raw_data):
+        styles = style_for(airvisual_styles, aqi_raw_data['current_measurement']['aqius'])
+        current_weather = aqi_raw_data['current_weather']
+        return aqi_bubble(
+            station="{0}, {1}".format(aqi_raw_data['name'], aqi_raw_data['city']),
+            aqi=str(aqi_raw_data['current_measurement']['aqius']),
+            icon_url=styles.icon_url,
+            text_color=styles.text_color,
+            text_size=styles.text_size,
+            level_text=styles.text,
+            background_color=styles.background_color,
+            weather_icon_url="https://airvisual.com/images/{0}.png".format(current_weather['ic']),
+            temperature="{0} °".format(current_weather['tp']),
+            humidity="{0}%".format(current_weather['hu']),
+            wind_speed="{0} km/h".format(current_weather['ws']*3.6),
+            today_data="aqi_today_forecast?station_id={0}".format(aqi_raw_data['_id']),
+            daily_data="aqi_daily_forecast?station_id={0}".format(aqi_raw_data['_id'])
+        )
+
+    def _convert_str_to_date(self, date_str, tz_str, output_date_format='%-I%p'):
+        return format_iso_local(date_str, tz_str, output_date_format)
+
+    def get_aqi_today_message(self, aqi_raw_data, limit=7):
+        return rendered_replies.get_or_render('aqi_today:{0}'.format(limit), aqi_raw_data['_id'],
+                                              _reading_version(aqi_raw_data),
+                                              lambda: self._render_aqi_today_message(aqi_raw_data, limit))
+
+    def _render_aqi_today_message(self, aqi_raw_data, limit):
+        local_timezone = aqi_raw_data['timezone']
+        today_date_str = self._convert_str_to_date(aqi_raw_data['current_weather']['ts'], tz_str=local_timezone, output_date_format='%A %-d %B %Y')
+        forecasts = [forecast for forecast in aqi_raw_data['forecasts']
+                     if 'ic' in forecast and forecast['ts'] is not None][:limit + 1]
+        level_styles = styles_for(airvisual_styles, [forecast['aqius'] for forecast in forecasts])
+        forecast_rows = []
+        for forecast, styles in zip(forecasts, level_styles):
+            forecast_rows.append(aqi_today_row(
+                time=self._convert_str_to_date(forecast['ts'], tz_str=local_timezone),
+                weather_icon_url="https://airvisual.com/images/{0}.png".format(forecast['ic']),
+                temperature="{0} °C".format(forecast['tp']),
+                level_image_url=styles.level_image_url
+            ))
+            forecast_rows.append(aqi_separator)
+        return aqi_today_bubble(date=today_date_str, forecast_rows=forecast_rows)
+
+    def _daily_from_hourly(self, aqi_raw_data):
+        """Daily forecasts averaged from the hourly ones, for stations that publish no daily forecast."""
+        local_timezone = aqi_raw_data['timezone']
+        forecasts = [forecast for forecast in aqi_raw_data.get('forecasts') or [] if forecast.get('aqius') is not None]
+        first_ts = {}
+        points = []
+        for forecast in forecasts:
+            date_str = format_iso_local(forecast['ts'], local_timezone, '%Y-%m-%d')
+            first_ts.setdefault(date_str, forecast['ts'])
+            points.append((date_str, forecast['aqius'], forecast['aqius']))
+        return [
+            {
+                'ts': first_ts[day.date],
+                'aqius': int(round(day.mean))
+            } for day in aggregate_daily(points)
+        ]
 
     def get_aqi_daily_message(self, aqi_raw_data, limit=7):
+        return rendered_replies.get_or_render('aqi_daily:{0}'.format(limit), aqi_raw_data['_id'],
+                                              _reading_version(aqi_raw_data),
+                                              lambda: self._render_aqi_daily_message(aqi_raw_data, limit))
+
+    def _render_aqi_daily_message(self, aqi_raw_data, limit):
         local_timezone = aqi_raw_data['timezone']
-        daily_forecasts = aqi_raw_data['forecasts_daily']
-        added_item = 0
+        daily_forecasts = aqi_raw_data.get('forecasts_daily') or self._daily_from_hourly(aqi_raw_data)
+        daily_forecasts = daily_forecasts[:limit + 1]
+        level_styles = styles_for(airvisual_styles, [forecast['aqius'] for forecast in daily_forecasts])
         flex_carousel = {
             "type": "carousel",
             "contents": []
         }
-        for index in range(0, len(daily_forecasts)):
-            if added_item > limit:
-                break
-            bubble = {
-                "type": "bubble",
-                "direction": "ltr",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "spacing": "sm",
-                    "contents": []
-                }
-            }
-            aqi = daily_forecasts[index]['aqius']
-            styles = self._get_aqi_message_style(aqi)
-            date_str = self._convert_str_to_date(daily_forecasts[index]['ts'], tz_str=local_timezone, output_date_format='%A %-d %B %Y')
-            if date_str is not None:
-                bubble['body']['contents'].extend(
-                    [
-                        {
-                            "type": "text",
-                            "text": date_str,
-                            "size": "sm",
-                            "align": "center",
-                            "color": styles['text_color']
-                        },
-                        {
-                            "type": "separator",
-                            "color": styles['text_color']
-                        },
-                        {
-                            "type": "box",
-                            "layout": "horizontal",
-                            "contents": [
-                                {
-                                    "type": "image",
-                                    "url": styles['icon_url'],
-                                    "aspectRatio": "1:1",
-                                    "flex": 0
-                                },
-                                {
-                                    "type": "box",
-                                    "layout": "vertical",
-                                    "contents": [
-                                        {
-                                            "type": "text",
-                                            "text": "{0}".format(aqi),
-                                            "size": 'xxl',
-                                            "align": "center",
-                                            "weight": "bold",
-                                            "color": styles['text_color']
-                                        },
-                                        {
-                                            "type": "text",
-                                            "text": "US AQI",
-                                            "size": "xs",
-                                            "align": "center",
-                                            "color": styles['text_color']
-                                        },
-                                        {
-                                            "type": "text",
-                                            "text": styles['text'],
-                                            "size": styles['text_size'],
-                                            "align": "center",
-                                            "gravity": "center",
-                                            "weight": "bold",
-                                            "color": styles['text_color'],
-                                            "wrap": True
-                                        }
-                                    ]
-                                }
-                            ]
-                        }
-                    ]
-                )
-                bubble['styles'] = {
-                    "body": {
-                        "backgroundColor": styles['background_color']
-                    }
-                }
-                added_item += 1
-                bubble_container = BubbleContainer.new_from_json_dict(bubble)
-                flex_carousel['contents'].append(bubble_container)
-        carousel_container = CarouselContainer.new_from_json_dict(flex_carousel)
-        return carousel_container
\ No newline at end of file
+        for forecast, styles in zip(daily_forecasts, level_styles):
+            date_str = self._convert_str_to_date(forecast['ts'], tz_str=local_timezone, output_date_format='%A %-d %B %Y')
+            flex_carousel['contents'].append(aqi_daily_bubble(
+                date=date_str,
+                aqi="{0}".format(forecast['aqius']),
+                icon_url=styles.icon_url,
+                text_color=styles.text_color,
+                text_size=styles.text_size,
+                level_text=styles.text,
+                background_color=styles.background_color
+            ))
+        return flex_carousel
\ No newline at end of file
@@ -0,0 +1,83 @@
+from bisect import bisect_left
+from collections import namedtuple
+from functools import partial
+
+# US AQI categories. A reading belongs to the first category whose upper
+# bound it does not exceed, so 50 is Good and 50.5 is Moderate; anything
+# above the last bound is Hazardous. Each style table below has one entry
+# per category, in this order, built once at import and never modified.
+upper_bounds = (50, 100, 150, 200, 300)
+level_names = ('Good', 'Moderate', 'Unhealthy for Sensitive Groups', 'Unhealthy', 'Very Unhealthy', 'Hazardous')
+
+# AirVisual station messages (aqi.py)
+AirVisualStyle = namedtuple('AirVisualStyle', 'text background_color text_color text_size icon_url level_image_url')
+airvisual_styles = (
+    AirVisualStyle('Good', '#a8e05f', '#718B3C', 'xxl',
+                   'https://i.imgur.com/3uysQp6.png', 'https://i.imgur.com/nETuKgV.png'),
+    AirVisualStyle('Moderate', '#FDD74B', '#A57F23', 'xxl',
+                   'https://i.imgur.com/jT8N7QZ.png', 'https://i.imgur.com/S8flXXh.png'),
+    AirVisualStyle('Unhealthy for Sensitive Groups', '#fe9b57', '#b25826', 'sm',
+                   'https://i.imgur.com/ivh1pqK.png', 'https://i.imgur.com/D0vyXVx.png'),
+    AirVisualStyle('Unhealthy', '#fe6a69', '#af2c3b', 'xxl',
+                   'https://i.imgur.com/8tXR9wV.png', 'https://i.imgur.com/Rbi6wIW.png'),
+    AirVisualStyle('Very Unhealthy', '#A97ABE', '#946AA9', 'xxl',
+                   'https://i.imgur.com/rEfasQc.png', 'https://i.imgur.com/eibuQO2.png'),
+    AirVisualStyle('Hazardous', '#7E4D51', '#5D3B39', 'xxl',
+                   'https://i.imgur.com/DhQWeMe.png', 'https://i.imgur.com/qXm1PmD.png')
+)
+
+# waqi.info bubbles (weather.py); level is the cautionary statement number
+WaqiStyle = namedtuple('WaqiStyle', 'level text background_color text_color')
+waqi_styles = (
+    WaqiStyle(1, 'Good', '#009966', '#ffffff'),
+    WaqiStyle(2, 'Moderate', '#ffde33', '#000000'),
+    WaqiStyle(3, 'Unhealthy for Sensitive Groups', '#ff9933', '#000000'),
+    WaqiStyle(4, 'Unhealthy', '#cc0033', '#ffffff'),
+    WaqiStyle(5, 'Very Unhealthy', '#660099', '#ffffff'),
+    WaqiStyle(6, 'Hazardous', '#7e0023', '#ffffff')
+)
+
+# waqi.info detail bubble (weather.py)
+WaqiDetail = namedtuple('WaqiDetail', 'level level_text level_text_color level_image outdoor_text mask_text')
+waqi_details = (
+    WaqiDetail('1', 'Good', '#1ABC9C', 'https://i.imgur.com/SD87jjB.png',
+               'No Risk', 'Not Needed'),
+    WaqiDetail('2', 'Moderate', '#f1c40f', 'https://i.imgur.com/vxX2nVF.png',
+               'People with respiratory disease should limit outdoor exertion',
+               'Recommended for People with respiratory disease'),
+    WaqiDetail('3', 'Unhealthy for Sensitive Groups', '#e67e22', 'https://i.imgur.com/y7O7bvz.png',
+               'People with respiratory disease should limit outdoor exertion', 'Recommended'),
+    WaqiDetail('4', 'Unhealthy', '#e74c3c', 'https://i.imgur.com/DQE2DOJ.png',
+               'Everyone should limit outdoor exertion', 'Recommended'),
+    WaqiDetail('5', 'Very Unhealthy', '#9b59b6', 'https://i.imgur.com/YHQoI3i.png',
+               'Everyone, esp children should limit outdoor exertion', 'A Must'),
+    WaqiDetail('6', 'Hazardous', '#902E46', 'https://i.imgur.com/VLAKdFj.png',
+               'Everyone should avoid all outdoor exertion', 'A Must')
+)
+unknown_waqi_detail = WaqiDetail('-1', 'Unknown', '#ffffff', 'https://i.imgur.com/SD87jjB.png', 'Unknown', 'Unknown')
+
+_level_of = partial(bisect_left, upper_bounds)
+
+
+def level_index(aqi):
+    """Category index of one reading, or None when it is negative (no valid reading)."""
+    if aqi < 0:
+        return None
+    return _level_of(aqi)
+
+
+def style_for(styles, aqi, default=None):
+    """Entry of a style table for one reading; default when the reading is negative."""
+    if aqi < 0:
+        return default
+    return styles[_level_of(aqi)]
+
+
+def styles_for(styles, values):
+    """Entries of a style table for a whole forecast series of valid (non-negative) readings.
+
+    Both the category lookup and the table lookup are mapped at C level, so a
+    series costs no Python-level branching or allocation per reading beyond
+    the result list.
+    """
+    return list(map(styles.__getitem__, map(_level_of, values)))
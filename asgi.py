@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+
+# asyncio deployment of the bot: uvicorn asgi:app --workers $WEB_CONCURRENCY
+# Each worker runs one event loop; every webhook event becomes a task and all
+# upstream calls go through aiohttp, so a worker keeps hundreds of them open
+# where a gunicorn sync worker holds one.
+
+import os
+import sys
+import json
+import time
+import asyncio
+import mimetypes
+from urllib.parse import parse_qsl
+from linebot.exceptions import InvalidSignatureError
+from linebot.models import (
+    MessageEvent, TextMessage, PostbackEvent, LocationMessage,
+    TextSendMessage, TemplateSendMessage, ImageCarouselTemplate, ImageCarouselColumn,
+    MessageAction, QuickReply, QuickReplyButton, PostbackAction, LocationAction
+)
+from async_http import async_default_client
+from async_clients import AsyncWeather, AsyncWeatherAQI, AsyncFlightApi, AsyncPlaces
+from singleflight import async_upstream_calls
+from weather import geocode_cache, forecast_cache, weather_timeout_text
+from aqi import nearest_station_cache, station_data_cache
+from flight_api import route_cache, airport_board_cache
+from cache import rendered_replies
+from webhook import EventDispatcher, group_by_source
+from router import PostbackRouter
+from intents import IntentClassifier
+from geo import parse_latlng
+from flex import FlexMessage
+
+channel_secret = os.getenv('LINE_CHANNEL_SECRET', None)
+channel_access_token = os.getenv('LINE_CHANNEL_ACCESS_TOKEN', None)
+
+if channel_secret is None:
+    print('Specify LINE_CHANNEL_SECRET as environment variable.')
+    sys.exit(1)
+if channel_access_token is None:
+    print('Specify LINE_CHANNEL_ACCESS_TOKEN as environment variable.')
+    sys.exit(1)
+
+reply_deadline = float(os.getenv('REPLY_DEADLINE_SECONDS', '8'))
+
+weather = AsyncWeather(http=async_default_client)
+places = AsyncPlaces(http=async_default_client)
+flight_api = AsyncFlightApi(http=async_default_client)
+weather_aqi = AsyncWeatherAQI(http=async_default_client)
+handler = EventDispatcher(channel_secret)
+postback_router = PostbackRouter()
+text_intents = IntentClassifier()
+# base URL for links to files under static/: PUBLIC_URL or else the webhook request's host
+public_url = os.getenv('PUBLIC_URL', None)
+static_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# tasks are referenced here until they finish so the loop cannot drop them
+event_tasks = set()
+
+
+class AsyncLineBotApi(object):
+
+    def __init__(self, channel_access_token, endpoint='https://api.line.me', http=None):
+        self.endpoint = endpoint
+        self.headers = {
+            'Authorization': 'Bearer ' + channel_access_token,
+            'Content-Type': 'application/json'
+        }
+        self.http = http or async_default_client
+
+    async def _post(self, path, body):
+        response = await self.http.post(self.endpoint + path, headers=self.headers, data=json.dumps(body))
+        if response.status_code != 200:
+            print("Got exception from LINE Messaging API: %s\n" % response.text)
+
+    async def reply_message(self, reply_token, messages):
+        if not isinstance(messages, (list, tuple)):
+            messages = [messages]
+        await self._post('/v2/bot/message/reply', {
+            'replyToken': reply_token,
+            'messages': [message.as_json_dict() for message in messages]
+        })
+
+    async def push_message(self, to, messages):
+        if not isinstance(messages, (list, tuple)):
+            messages = [messages]
+        await self._post('/v2/bot/message/push', {
+            'to': to,
+            'messages': [message.as_json_dict() for message in messages]
+        })
+
+
+line_bot_api = AsyncLineBotApi(channel_access_token, http=async_default_client)
+
+
+async def gather_reply_parts(*coroutines):
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    done, not_done = await asyncio.wait(tasks, timeout=reply_deadline)
+    parts = []
+    for task in tasks:
+        if task not in done:
+            task.cancel()
+            print('====== REPLY PART MISSED DEADLINE ======')
+        elif task.exception() is not None:
+            print('====== REPLY PART FAILED: {0} ======'.format(task.exception()))
+        elif task.result() is not None:
+            parts.append(task.result())
+    return parts
+
+
+async def get_weather_reply(place_name_or_latlng):
+    weather_data = await weather.get_weather_data(place_name_or_latlng)
+    weather_message = weather.get_weather_message(weather_data)
+    return FlexMessage(alt_text="Weather Forecast", contents=weather_message)
+
+
+async def get_aqi_reply(lat, lng):
+    aqi_station_id = await weather_aqi.get_nearest_station(lat, lng)
+    if aqi_station_id is None:
+        return None
+    weather_aqi_data = await weather_aqi.get_aqi_data(aqi_station_id)
+    if weather_aqi_data is None:
+        return None
+    weather_aqi_msg = weather_aqi.get_aqi_message(weather_aqi_data)
+    return FlexMessage(alt_text='Air Quality Index', contents=weather_aqi_msg)
+
+
+@handler.add(MessageEvent, message=LocationMessage)
+async def handle_location_message(event):
+    latlng = '{0} {1}'.format(event.message.latitude, event.message.longitude)
+    messages = await gather_reply_parts(
+        get_weather_reply(latlng),
+        get_aqi_reply(event.message.latitude, event.message.longitude)
+    )
+    if len(messages) == 0:
+        messages.append(TextSendMessage(text='Sorry, I couldn\'t get the weather for your location right now'))
+    nearest_airports = flight_api.get_nearest_airports(event.message.latitude, event.message.longitude)
+    if len(nearest_airports) > 0:
+        messages[-1].quick_reply = QuickReply(items=[
+            QuickReplyButton(
+                action=PostbackAction(label='{0} {1}'.format(airport['iata'], airport['city'])[:20],
+                                      data='airport={0}'.format(airport['iata']),
+                                      display_text='{0} Airport'.format(airport['iata']))
+            ) for airport in nearest_airports
+        ])
+    await line_bot_api.reply_message(event.reply_token, messages=messages)
+
+
+@handler.add(PostbackEvent)
+def handle_postback_event(event):
+    data = event.postback.data
+    print('postback data:{}'.format(data))
+    # returns the routed handler's coroutine for handle_events_in_order to await
+    return postback_router.dispatch(event, data)
+
+
+@postback_router.add('place_search', lat=float, lng=float, type=str)
+async def handle_place_search(event, lat, lng, type):
+    places_data = await places.get_nearby_places(lat, lng, None if type == 'all' else type, host_url=public_url)
+    if isinstance(places_data, str):
+        await line_bot_api.reply_message(event.reply_token, TextSendMessage(text=places_data))
+    else:
+        await line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text='Places', contents=places_data))
+
+
+@postback_router.add('weather', place=str)
+async def handle_weather_postback(event, place):
+    try:
+        reply = await get_weather_reply(place)
+    except TimeoutError as e:
+        print('====== {0} ======'.format(e))
+        reply = TextSendMessage(text=weather_timeout_text)
+    await line_bot_api.reply_message(event.reply_token, reply)
+
+
+@postback_router.add('weather_hourly', lat=float, lng=float)
+async def handle_weather_hourly_postback(event, lat, lng):
+    forecast_hourly_data = await weather.get_weather_forcast_hourly(lat, lng)
+    bubble_container = weather.get_weather_forecast_hourly_data(forecast_hourly_data)
+    await line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text="Weather Forecast Hourly",
+                                                                        contents=bubble_container))
+
+
+@postback_router.add('flight_info', flight_no=str)
+async def handle_flight_info_postback(event, flight_no):
+    flight_message = await get_flight_reply(flight_no)
+    if flight_message is not None:
+        await line_bot_api.reply_message(event.reply_token, flight_message)
+
+
+@postback_router.add('airport', airport_code=str)
+async def handle_airport_postback(event, airport_code):
+    airport_name = flight_api.get_airport_name_from_code(airport_code)
+    airport_data = await flight_api.get_airport_data(airport_code)
+    if airport_data is not None:
+        airport_message = flight_api.create_airport_message(airport_data)
+        await line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text="Airport Information",
+                                                                            contents=airport_message))
+    else:
+        await line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Sorry, there is no airport information for \"{0}\"'.format(airport_name)))
+
+
+@postback_router.add('aqi_today_forecast', station_id=str)
+async def handle_aqi_today_postback(event, station_id):
+    weather_aqi_data = await weather_aqi.get_aqi_data(station_id)
+    if weather_aqi_data is not None:
+        bubble_msg = weather_aqi.get_aqi_today_message(weather_aqi_data)
+        await line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text='Today Air Quality', contents=bubble_msg))
+
+
+@postback_router.add('aqi_daily_forecast', station_id=str)
+async def handle_aqi_daily_postback(event, station_id):
+    weather_aqi_data = await weather_aqi.get_aqi_data(station_id)
+    if weather_aqi_data is not None:
+        carousel_container = weather_aqi.get_aqi_daily_message(weather_aqi_data)
+        await line_bot_api.reply_message(event.reply_token, FlexMessage(alt_text='Daily Air Quality', contents=carousel_container))
+
+
+async def get_flight_reply(flight_no):
+    latest_flight = await flight_api.get_latest_flight(flight_no)
+    if latest_flight is None:
+        return None
+    flight_metadata = await flight_api.get_flight_metadata(latest_flight['flight_number'], latest_flight['adshex'])
+    if flight_metadata['success'] is not True:
+        return None
+    payload = flight_metadata['payload']
+    flight_schedule = None
+    if flight_api.needs_flight_schedule(payload):
+        flight_schedule = await flight_api.get_flight_schedule(latest_flight['flight_number'])
+    flight_bubble = flight_api.create_flight_message(latest_flight['flight_number'], latest_flight['adshex'], payload, flight_schedule)
+    return FlexMessage(alt_text="Flight Information", contents=flight_bubble)
+
+
+@handler.add(MessageEvent, message=TextMessage)
+def handle_text_message(event):
+    return text_intents.dispatch(event, event.message.text)
+
+
+@text_intents.add('aqi', r'aqi\Z')
+async def handle_aqi_text(event):
+    await line_bot_api.reply_message(event.reply_token, TextSendMessage(
+        text='Please share your location to get an accurate AQI krub',
+        quick_reply=QuickReply(items=[QuickReplyButton(action=LocationAction(label='Share Location'))])))
+
+
+@text_intents.add('look_up', r'(?s:.*?)มองบน')
+async def handle_look_up_text(event):
+    image_carousel_template = ImageCarouselTemplate(columns=[
+        ImageCarouselColumn(image_url='https://media.giphy.com/media/5Wi5ydRYRM28q9Gvyv/giphy.gif',
+                            action=MessageAction(label='มองบน', text='มองบน'))
+    ])
+    await line_bot_api.reply_message(event.reply_token, TemplateSendMessage(alt_text='มองบนเรยจ้า', template=image_carousel_template))
+
+
+@text_intents.add('lineqa', r'(?s:.*?)lineqa')
+async def handle_lineqa_text(event):
+    image_carousel_template = ImageCarouselTemplate(columns=[
+        ImageCarouselColumn(image_url='https://media.giphy.com/media/4VUugEkI9a9DsKTmW1/giphy.gif',
+                            action=MessageAction(label='Daebak', text='대박!'))
+    ])
+    await line_bot_api.reply_message(event.reply_token, TemplateSendMessage(alt_text='대박!', template=image_carousel_template))
+
+
+@text_intents.add('weather_menu', r'(?:อากาศ|weather)\Z')
+async def handle_weather_menu_text(event):
+    quick_reply = QuickReply(items=[
+        QuickReplyButton(action=LocationAction(label='Send Location')),
+        QuickReplyButton(action=PostbackAction(label='Tokyo Weather', data='weather=tokyo', display_text='Tokyo Weather')),
+        QuickReplyButton(action=PostbackAction(label='Seoul Weather', data='weather=seoul', display_text='Seoul Weather')),
+        QuickReplyButton(action=PostbackAction(label='London Weather', data='weather=london', display_text='London Weather'))
+    ])
+    await line_bot_api.reply_message(event.reply_token, TextSendMessage(text="Let me know your location or place",
+                                                                        quick_reply=quick_reply))
+
+
+@text_intents.add('weather_in', r'weather in (.*)')
+async def handle_weather_in_text(event, place_name):
+    location = await weather.get_latlng_from_place_name(place_name)
+    if isinstance(location, str):
+        await line_bot_api.reply_message(event.reply_token, TextSendMessage(text=location))
+        return
+    latlng_data, address = location
+    messages = await gather_reply_parts(
+        get_weather_reply(place_name),
+        get_aqi_reply(latlng_data['lat'], latlng_data['lng'])
+    )
+    if len(messages) == 0:
+        messages.append(TextSendMessage(text='Sorry, I couldn\'t get the weather for {0} right now'.format(place_name)))
+    await line_bot_api.reply_message(event.reply_token, messages=messages)
+
+
+@text_intents.add('flight', r'flight (.*)')
+async def handle_flight_text(event, flight_no):
+    flight_message = await get_flight_reply(flight_no.upper())
+    if flight_message is None:
+        flight_message = TextSendMessage(text='Sorry, I can\'t find your flight: {}. Please try another flight number'.format(flight_no.upper()))
+    await line_bot_api.reply_message(event.reply_token, flight_message)
+
+
+@text_intents.add('route', r'([a-z]{3}-[a-z]{3})$')
+async def handle_route_text(event, route):
+    text = route.upper()
+    origin, destination = text.split('-')
+    flight_route_data = await flight_api.get_flight_by_route(origin, destination)
+    if flight_route_data is not None:
+        carousel_container = flight_api.create_flight_route_message(flight_route_data)
+        route_message = FlexMessage(alt_text="Flight {0} Route Info".format(text), contents=carousel_container)
+    else:
+        route_message = TextSendMessage(text='Sorry, There is no flight for "{}" route.'.format(text))
+    await line_bot_api.reply_message(event.reply_token, route_message)
+
+
+@text_intents.add('airport', r'airport (.*)')
+async def handle_airport_text(event, query):
+    airports = await flight_api.get_airport_code(query)
+    if airports is not None:
+        quick_reply_items = []
+        for airport in airports:
+            code = airport['url'].split('/')[-1]
+            airport_name = (airport['title'][:14] if len(airport['title']) > 14 else airport['title']) + ' ({0})'.format(code)
+            quick_reply_items.append(QuickReplyButton(action=PostbackAction(label=airport_name, data='airport={0}'.format(code))))
+        await line_bot_api.reply_message(event.reply_token, TextSendMessage(text='Here are possible airports',
+                                                                            quick_reply=QuickReply(items=quick_reply_items)))
+
+
+async def handle_events_in_order(events, deadline):
+    # one sender's events, in delivery order; different senders run as separate tasks
+    for event in events:
+        if time.time() > deadline:
+            print('====== SKIPPED {0} PAST WEBHOOK BUDGET ======'.format(event.__class__.__name__))
+            continue
+        try:
+            result = handler.dispatch(event)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            print('====== EVENT HANDLER FAILED: {0!r} ======'.format(e))
+
+
+def callback(headers, body):
+    global public_url
+    if public_url is None and 'host' in headers:
+        public_url = 'http://{0}/'.format(headers['host'])
+    try:
+        events = handler.parser.parse(body.decode('utf-8'), headers.get('x-line-signature', ''))
+    except InvalidSignatureError:
+        return 400, 'Bad Request'
+    deadline = time.time() + handler.budget
+    for group in group_by_source(events):
+        task = asyncio.ensure_future(handle_events_in_order(group, deadline))
+        event_tasks.add(task)
+        task.add_done_callback(event_tasks.discard)
+    return 200, 'OK'
+
+
+def stats():
+    return 200, {
+        'http': async_default_client.pool_stats(),
+        'geocode_cache': geocode_cache.stats(),
+        'forecast_cache': forecast_cache.stats(),
+        'aqi_station_cache': nearest_station_cache.stats(),
+        'aqi_data_cache': station_data_cache.stats(),
+        'route_cache': route_cache.stats(),
+        'airport_board_cache': airport_board_cache.stats(),
+        'rendered_replies': rendered_replies.stats(),
+        'singleflight': async_upstream_calls.stats(),
+        'event_tasks': len(event_tasks)
+    }
+
+
+async def push_aqi(query):
+    to = query.get('id')
+    lat = query.get('lat')
+    lng = query.get('lng')
+    print('====== PUSH AQI TO: {} ======='.format(to))
+    try:
+        if not to:
+            raise ValueError('id is required')
+        lat, lng = parse_latlng(lat, lng)
+    except ValueError as e:
+        return 400, {'status': 'error', 'message': str(e)}
+    aqi_station_id = await weather_aqi.get_nearest_station(lat, lng)
+    if aqi_station_id is not None:
+        weather_aqi_data = await weather_aqi.get_aqi_data(aqi_station_id)
+        if weather_aqi_data is not None:
+            weather_aqi_msg = weather_aqi.get_aqi_message(weather_aqi_data)
+            await line_bot_api.push_message(to=to, messages=[FlexMessage(alt_text='Air Quality Index', contents=weather_aqi_msg)])
+    return 200, {'status': 'ok'}
+
+
+def read_static(path):
+    # the files Flask serves from static/, e.g. place photos in static/tmp
+    file_name = os.path.abspath(os.path.join(static_path, path[len('/static/'):]))
+    if not file_name.startswith(static_path + os.sep) or not os.path.isfile(file_name):
+        return None
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def send_response(send, status, payload, content_type=None):
+    if isinstance(payload, bytes):
+        body = payload
+    elif isinstance(payload, str):
+        body, content_type = payload.encode('utf-8'), b'text/html; charset=utf-8'
+    else:
+        body, content_type = json.dumps(payload).encode('utf-8'), b'application/json'
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_default_client.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    body = await read_body(receive)
+    route = (scope['method'], scope['path'])
+    if route == ('POST', '/callback'):
+        headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope['headers']}
+        status, payload = callback(headers, body)
+    elif route == ('GET', '/'):
+        status, payload = 200, {'status': 'UP'}
+    elif route == ('GET', '/stats'):
+        status, payload = stats()
+    elif route == ('GET', '/aqi'):
+        status, payload = await push_aqi(dict(parse_qsl(scope['query_string'].decode('latin-1'))))
+    elif scope['method'] == 'GET' and scope['path'].startswith('/static/'):
+        loop = asyncio.get_event_loop()
+        content = await loop.run_in_executor(None, read_static, scope['path'])
+        if content is not None:
+            content_type = (mimetypes.guess_type(scope['path'])[0] or 'application/octet-stream').encode('latin-1')
+            await send_response(send, 200, content, content_type)
+            return
+        status, payload = 404, 'Not Found'
+    else:
+        status, payload = 404, 'Not Found'
+    await send_response(send, status, payload)
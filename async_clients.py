@@ -0,0 +1,215 @@
+import asyncio
+import time
+import random
+import string
+import weather
+import aqi
+import flight_api
+import places
+from async_http import async_default_client
+from http_client import default_client
+from singleflight import async_upstream_calls
+
+# asyncio versions of the upstream clients. Only the methods that do I/O are
+# overridden; caches, response parsing and the Flex builders are inherited
+# from the sync clients so both modes render identical messages.
+
+
+class AsyncWeather(weather.Weather):
+
+    def __init__(self, http=None):
+        self.http = http or async_default_client
+
+    async def _resolve_location_latlng(self, location_or_latlng):
+        cache_key = self._geocode_cache_key(location_or_latlng)
+        result = weather.geocode_cache.get(cache_key)
+        if result is not None:
+            return result
+        response = await self.http.get(weather.geocode_api_url, params=self._geocode_params(location_or_latlng))
+        return self._store_geocode_result(cache_key, response.json())
+
+    async def _get_forecast(self, endpoint, lat, lng):
+        cache_key, url, params = self._forecast_request(endpoint, lat, lng)
+        data = weather.forecast_cache.get(cache_key)
+        if data is not None:
+            return data
+        try:
+            response = await self.http.get(url, params=params)
+            data = response.json()
+        except Exception as e:
+            return self._stale_forecast(cache_key, e)
+        return self._store_forecast(endpoint, cache_key, response.status_code, data)
+
+    async def get_current_weather(self, lat, lng):
+        return await self._get_forecast('current', lat, lng)
+
+    async def get_weather_forecast_daily(self, lat, lng):
+        return await self._get_forecast('forecast/daily', lat, lng)
+
+    async def get_weather_forcast_hourly(self, lat, lng):
+        return await self._get_forecast('forecast/hourly', lat, lng)
+
+    async def get_weather(self, lat, lng, timeout=weather.weather_timeout):
+        current_task = asyncio.ensure_future(self.get_current_weather(lat, lng))
+        daily_task = asyncio.ensure_future(self.get_weather_forecast_daily(lat, lng))
+        done, not_done = await asyncio.wait([current_task, daily_task], timeout=timeout)
+        for task in not_done:
+            task.cancel()
+        daily = None
+        if daily_task in done and daily_task.exception() is None:
+            daily = daily_task.result()
+        if current_task not in done:
+            return self._combine_weather(lat, lng, self._stale_current_weather(lat, lng, timeout), daily)
+        return self._combine_weather(lat, lng, current_task.result(), daily)
+
+    async def get_latlng_from_place_name(self, place_name):
+        result = await self._resolve_location_latlng(place_name)
+        if len(result['results']) == 0:
+            return "I couldn't find weather from your place or lat/lng: {}".format(place_name)
+        geometry = result['results'][0]['geometry']
+        address = result['results'][0]
+        return geometry, address
+
+    async def get_weather_data(self, place_name_or_latlng):
+        cache_key = 'weather:{0}'.format(self._geocode_cache_key(place_name_or_latlng))
+        return await async_upstream_calls.do(cache_key, self._get_weather_data, place_name_or_latlng)
+
+    async def _get_weather_data(self, place_name_or_latlng):
+        geometry, address = await self.get_latlng_from_place_name(place_name_or_latlng)
+        weather_data = await self.get_weather(geometry['lat'], geometry['lng'])
+        weather_data['address'] = address
+        return weather_data
+
+
+class AsyncWeatherAQI(aqi.WeatherAQI):
+
+    def __init__(self, http=None):
+        self.http = http or async_default_client
+
+    async def get_nearest_station(self, lat, lng):
+        station_id, cache_key = self._local_nearest_station(lat, lng)
+        if station_id is not None:
+            return station_id
+        return await aqi.nearest_station_cache.get_or_refresh_async(
+            cache_key, lambda: self._fetch_nearest_station(lat, lng))
+
+    async def _fetch_nearest_station(self, lat, lng):
+        url, req_body = self._nearest_station_request(lat, lng)
+        response = await self.http.post(url, headers=aqi.headers, json=req_body)
+        return self._parse_nearest_station(response.json())
+
+    async def get_aqi_data(self, station_id):
+        cache_key = str(station_id)
+        return await aqi.station_data_cache.get_or_refresh_async(
+            cache_key,
+            lambda: async_upstream_calls.do('aqi_data:{0}'.format(cache_key), self._fetch_aqi_data, station_id),
+            ttl=aqi._station_data_ttl)
+
+    async def _fetch_aqi_data(self, station_id):
+        url = '{0}/api/v3/station/id?id={1}'.format(aqi.api_host, station_id)
+        response = await self.http.get(url, headers=aqi.headers)
+        return self._parse_station_response(response.json())
+
+
+class AsyncFlightApi(flight_api.FlightApi):
+
+    def __init__(self, http=None):
+        self.http = http or async_default_client
+
+    async def get_aircraft_photo(self, registration_no):
+        url = '{0}/api/json/quicksearch.php?term={1}'.format(flight_api.aircraft_photo_api, registration_no.upper())
+        cookies = {
+            'JPSESSID': 'cadodtaha6lskd338n48vk5u82'
+        }
+        try:
+            response = await self.http.get(url, headers=flight_api.headers, cookies=cookies)
+            resp_json = response.json()
+            if len(resp_json) > 0:
+                return '{0}/{1}'.format(flight_api.aircraft_cdn, resp_json[0]['filename'])
+        except Exception:
+            pass
+        return None
+
+    async def get_latest_flight(self, flight_no):
+        return await async_upstream_calls.do('latest_flight:{0}'.format(flight_no.upper()),
+                                             self._fetch_latest_flight, flight_no)
+
+    async def _fetch_latest_flight(self, flight_no):
+        url = '{0}/api/aircraft/historic/flights/flightNo/{1}'.format(flight_api.api_host, flight_no)
+        response = await self.http.get(url, headers=flight_api.headers)
+        resp_json = response.json()
+        if resp_json['success'] is True and len(resp_json['payload']) > 0:
+            return resp_json['payload'][0]
+        return None
+
+    async def get_flight_metadata(self, flight_no, adshex):
+        url = '{0}/api/aircraft/historic/data/0/{1}/{2}'.format(flight_api.api_host, adshex, flight_no)
+        response = await self.http.get(url, headers=flight_api.headers)
+        return response.json()
+
+    async def get_flight_schedule(self, flight_no):
+        url = '{0}/v2/api/search/structured-search'.format(flight_api.flight_route_api_host)
+        params = {
+            'rqid': ''.join(random.choices(string.ascii_lowercase + string.digits, k=11))
+        }
+        body = {
+            'value': flight_no
+        }
+        response = await self.http.post(url, params=params, json=body, headers=flight_api.headers)
+        return self._parse_flight_schedule(flight_no, response.json())
+
+    async def get_aircraft_by_flight_no(self, flight_no):
+        result = await self.get_latest_flight(flight_no)
+        if result is not None:
+            return result['type']
+        return 'N/A'
+
+    async def get_airport_code(self, query):
+        local_airports = self._local_airport_code(query)
+        if local_airports is not None:
+            return local_airports
+        url, params = self._airport_code_request(query)
+        response = await self.http.get(url, headers=flight_api.headers, params=params)
+        return self._parse_airport_code(response.json())
+
+    async def get_flight_by_route(self, origin, destination):
+        (cache_key, local_date, ttl), prefetch = self._route_prefetch_plan(origin, destination, time.time())
+        if prefetch is not None:
+            next_key, next_date, next_ttl = prefetch
+            flight_api.route_cache.prefetch_async(
+                next_key,
+                lambda: async_upstream_calls.do('route:{0}'.format(next_key), self._fetch_flight_route, origin, destination, next_date),
+                ttl=next_ttl)
+        return await flight_api.route_cache.get_or_refresh_async(
+            cache_key,
+            lambda: async_upstream_calls.do('route:{0}'.format(cache_key), self._fetch_flight_route, origin, destination, local_date),
+            ttl=ttl)
+
+    async def _fetch_flight_route(self, origin, destination, local_date):
+        url, params = self._flight_route_request(origin, destination, local_date)
+        response = await self.http.get(url, params=params)
+        return self._parse_flight_route(response.json()['data'])
+
+    async def get_airport_data(self, airport_iata, limit=15):
+        cache_key = self._airport_board_key(airport_iata, limit)
+        return await flight_api.airport_board_cache.get_or_refresh_async(
+            cache_key,
+            lambda: async_upstream_calls.do('airport_board:{0}'.format(cache_key), self._fetch_airport_data, airport_iata, limit))
+
+    async def _fetch_airport_data(self, airport_iata, limit):
+        url = '{0}/api/airport/times/{1}'.format(flight_api.api_host, airport_iata)
+        response = await self.http.get(url, headers=flight_api.headers)
+        return self._parse_airport_data(airport_iata, response.json()['payload'], limit)
+
+
+class AsyncPlaces(places.Places):
+    """googlemaps has no asyncio client, so its calls run on the loop's default executor."""
+
+    def __init__(self, http=None):
+        self.http = http or async_default_client
+        # the blocking googlemaps calls keep using the sync client's pool
+        self.gmaps = places.create_gmaps_client(default_client)
+
+    async def get_nearby_places(self, lat, lng, type=None, host_url=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, places.Places.get_nearby_places, self, lat, lng, type, host_url)
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import asyncio
+from urllib.parse import urlsplit
+import aiohttp
+
+# asyncio counterpart of http_client.HttpClient: one aiohttp session per event
+# loop whose connector keeps up to ASYNC_HTTP_LIMIT upstream connections open,
+# so a single process can have hundreds of upstream calls in flight.
+
+connection_limit = int(os.getenv('ASYNC_HTTP_LIMIT', '500'))
+connection_limit_per_host = int(os.getenv('ASYNC_HTTP_LIMIT_PER_HOST', '100'))
+connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+read_timeout = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+
+
+class AsyncResponse(object):
+    """Fully read upstream response with the requests.Response attributes the clients use."""
+
+    def __init__(self, status_code, content, encoding='utf-8'):
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncHttpClient(object):
+
+    def __init__(self, limit=connection_limit, limit_per_host=connection_limit_per_host,
+                 timeout=(connect_timeout, read_timeout)):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(connect=timeout[0], sock_read=timeout[1])
+        self._session = None
+        self._host_stats = {}
+
+    @property
+    def session(self):
+        # created lazily so it binds to the loop the server runs
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    def _record(self, host, key, value=1):
+        stats = self._host_stats.setdefault(host, {
+            'requests': 0,
+            'errors': 0,
+            'in_flight': 0,
+            'peak_in_flight': 0,
+            'total_ms': 0.0
+        })
+        stats[key] += value
+        if key == 'in_flight':
+            stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+
+    async def request(self, method, url, **kwargs):
+        host = urlsplit(url).netloc
+        if kwargs.get('params'):
+            # yarl only takes str and int query values
+            kwargs['params'] = {key: str(value) for key, value in kwargs['params'].items()}
+        self._record(host, 'in_flight')
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, url, **kwargs) as response:
+                content = await response.read()
+                return AsyncResponse(response.status, content, response.charset)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            self._record(host, 'errors')
+            raise
+        finally:
+            self._record(host, 'in_flight', -1)
+            self._record(host, 'requests')
+            self._record(host, 'total_ms', (time.perf_counter() - start) * 1000)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def pool_stats(self):
+        result = {host: dict(stats) for host, stats in self._host_stats.items()}
+        for stats in result.values():
+            if stats['requests']:
+                stats['avg_ms'] = round(stats['total_ms'] / stats['requests'], 2)
+                stats['total_ms'] = round(stats['total_ms'], 2)
+        if self._session is not None and not self._session.closed:
+            connector = self._session.connector
+            result['connector'] = {
+                'limit': connector.limit,
+                'limit_per_host': connector.limit_per_host,
+                'acquired': len(connector._acquired)
+            }
+        return result
+
+
+async_default_client = AsyncHttpClient()
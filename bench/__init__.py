@@ -0,0 +1,2 @@
+# Benchmarks for the bot's hot paths; not deployed code. Run each one from the
+# repository root, e.g. python -m bench.flex_builders
@@ -0,0 +1,29 @@
+# Airport data at startup: json.load of airports.json against opening the compiled airports.bin.
+# Run from the repository root: python -m bench.airport_db_open
+
+import os
+import json
+import time
+import tracemalloc
+
+from airport_db import AirportDatabase, compile_airports, source_path, db_path
+
+compile_airports()
+tracemalloc.start()
+start = time.perf_counter()
+with open(source_path) as ap:
+    airports = json.load(ap)
+json_time = time.perf_counter() - start
+json_bytes = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+
+tracemalloc.start()
+start = time.perf_counter()
+db = AirportDatabase(db_path)
+mmap_time = time.perf_counter() - start
+mmap_bytes = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+print('json.load: {0:.1f} ms, {1:.0f} KB of python objects'.format(json_time * 1e3, json_bytes / 1024))
+print('mmap open: {0:.3f} ms, {1:.0f} KB of python objects ({2} KB mapped, shared)'.format(
+    mmap_time * 1e3, mmap_bytes / 1024, os.path.getsize(db_path) // 1024))
+print(dict(db['BKK']))
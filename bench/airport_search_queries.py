@@ -0,0 +1,22 @@
+# Local airport search latency over typical queries.
+# Run from the repository root: python -m bench.airport_search_queries
+
+import time
+
+from airport_db import AirportDatabase
+from airport_search import AirportSearchIndex
+
+index = AirportSearchIndex(AirportDatabase.open().records())
+queries = ['bkk', 'bangkok', 'suvarn', 'suvarnabumi', 'narita', 'tokyo', 'new york', 'londn heathrow',
+           'vtbs', 'chiang mai', 'charles de gaulle', 'sydney', 'incheon', 'seoul', 'frankfurt', 'kansai']
+for query in queries[:6]:
+    print('{0:14} -> {1}'.format(query, ', '.join(a['iata'] for a in index.search(query, 5))))
+timings = []
+for _ in range(50):
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query)
+        timings.append(time.perf_counter() - start)
+timings.sort()
+print('{0} searches: p50 {1:.0f} us, p99 {2:.0f} us'.format(
+    len(timings), timings[len(timings) // 2] * 1e6, timings[int(len(timings) * 0.99)] * 1e6))
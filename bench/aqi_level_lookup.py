@@ -0,0 +1,71 @@
+# AQI categories: the shared breakpoint table against the old per-reading if-ladder.
+# Run from the repository root: python -m bench.aqi_level_lookup
+
+import time
+
+from aqi_levels import airvisual_styles, style_for, styles_for
+
+def if_ladder(aqi_level):
+    # what WeatherAQI._get_aqi_message_style did for every reading
+    styles = dict()
+    if aqi_level > 0 and aqi_level <= 50:
+        styles['text'] = 'Good'
+        styles['background_color'] = '#a8e05f'
+        styles['text_color'] = '#718B3C'
+        styles['text_size'] = 'xxl'
+        styles['icon_url'] = 'https://i.imgur.com/3uysQp6.png'
+        styles['level_image_url'] = 'https://i.imgur.com/nETuKgV.png'
+    elif aqi_level > 50 and aqi_level <= 100:
+        styles['text'] = 'Moderate'
+        styles['background_color'] = '#FDD74B'
+        styles['text_color'] = '#A57F23'
+        styles['text_size'] = 'xxl'
+        styles['icon_url'] = 'https://i.imgur.com/jT8N7QZ.png'
+        styles['level_image_url'] = 'https://i.imgur.com/S8flXXh.png'
+    elif aqi_level > 100 and aqi_level <= 150:
+        styles['text'] = 'Unhealthy for Sensitive Groups'
+        styles['background_color'] = '#fe9b57'
+        styles['text_color'] = '#b25826'
+        styles['text_size'] = 'sm'
+        styles['icon_url'] = 'https://i.imgur.com/ivh1pqK.png'
+        styles['level_image_url'] = 'https://i.imgur.com/D0vyXVx.png'
+    elif aqi_level > 150 and aqi_level <= 200:
+        styles['text'] = 'Unhealthy'
+        styles['background_color'] = '#fe6a69'
+        styles['text_color'] = '#af2c3b'
+        styles['text_size'] = 'xxl'
+        styles['icon_url'] = 'https://i.imgur.com/8tXR9wV.png'
+        styles['level_image_url'] = 'https://i.imgur.com/Rbi6wIW.png'
+    elif aqi_level > 200 and aqi_level <= 300:
+        styles['text'] = 'Very Unhealthy'
+        styles['background_color'] = '#A97ABE'
+        styles['text_color'] = '#946AA9'
+        styles['text_size'] = 'xxl'
+        styles['icon_url'] = 'https://i.imgur.com/rEfasQc.png'
+        styles['level_image_url'] = 'https://i.imgur.com/eibuQO2.png'
+    elif aqi_level > 300:
+        styles['text'] = 'Hazardous'
+        styles['background_color'] = '#7E4D51'
+        styles['text_color'] = '#5D3B39'
+        styles['text_size'] = 'xxl'
+        styles['icon_url'] = 'https://i.imgur.com/DhQWeMe.png'
+        styles['level_image_url'] = 'https://i.imgur.com/qXm1PmD.png'
+    return styles
+
+# a 48 reading hourly series that climbs through every category
+series = [1 + (index * 37) % 420 for index in range(48)]
+for aqi in series:
+    assert if_ladder(aqi) == style_for(airvisual_styles, aqi)._asdict(), aqi
+
+rounds = 2000
+for name, func in [('if-ladder', lambda values: [if_ladder(aqi) for aqi in values]),
+                   ('table, per reading', lambda values: [style_for(airvisual_styles, aqi) for aqi in values]),
+                   ('table, series', lambda values: styles_for(airvisual_styles, values))]:
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func(series)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('{0:19} {1:.3f} us/reading'.format(name, best / rounds / len(series) * 1e6))
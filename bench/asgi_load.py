@@ -0,0 +1,89 @@
+# Load benchmark: the same burst of location lookups against a stub
+# upstream with fixed latency, served by N sync workers (one call chain
+# at a time each, as under gunicorn) and by one event loop.
+# Run from the repository root: python -m bench.asgi_load
+
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from concurrent.futures import ThreadPoolExecutor
+
+import weather as weather_module
+from weather import Weather
+from http_client import HttpClient
+from async_http import async_default_client
+from async_clients import AsyncWeather
+
+latency = float(os.getenv('BENCH_UPSTREAM_LATENCY', '0.1'))
+sync_workers = int(os.getenv('BENCH_SYNC_WORKERS', '4'))
+count = int(os.getenv('BENCH_REQUESTS', '200'))
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        time.sleep(latency)
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/geocode':
+            lat, lng = query['q'][0].split()
+            payload = {'status': {'code': 200}, 'results': [{'geometry': {'lat': float(lat), 'lng': float(lng)}}]}
+        else:
+            payload = {'data': [{'temp': 30}]}
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+server = StubServer(('127.0.0.1', 0), StubHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+stub_url = 'http://127.0.0.1:{0}'.format(server.server_port)
+weather_module.geocode_api_url = stub_url + '/geocode'
+weather_module.weather_forecast_url = stub_url + '/v2.0'
+
+def locations(offset):
+    # one forecast grid cell per request so nothing is served from cache
+    return ['{0:.2f} {1:.2f}'.format(offset + index // 100, (index % 100) * 0.1) for index in range(count)]
+
+sync_weather = Weather(http=HttpClient(pool_maxsize=sync_workers * 2))
+start = time.perf_counter()
+with ThreadPoolExecutor(max_workers=sync_workers) as workers:
+    list(workers.map(sync_weather.get_weather_data, locations(0)))
+sync_elapsed = time.perf_counter() - start
+
+async_weather = AsyncWeather(http=async_default_client)
+
+async def run_async():
+    start = time.perf_counter()
+    await asyncio.gather(*[async_weather.get_weather_data(latlng) for latlng in locations(20)])
+    elapsed = time.perf_counter() - start
+    await async_default_client.close()
+    return elapsed
+
+async_elapsed = asyncio.get_event_loop().run_until_complete(run_async())
+peak = max(stats['peak_in_flight'] for host, stats in async_default_client.pool_stats().items()
+           if host != 'connector')
+print('{0} location lookups, {1:.0f} ms upstream latency, 3 upstream calls each'.format(count, latency * 1000))
+print('sync, {0} workers: {1:.2f}s ({2:.0f} lookups/s)'.format(sync_workers, sync_elapsed, count / sync_elapsed))
+print('asyncio, 1 loop:   {0:.2f}s ({1:.0f} lookups/s, peak {2} upstream calls in flight)'.format(
+    async_elapsed, count / async_elapsed, peak))
+server.shutdown()
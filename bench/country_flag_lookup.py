@@ -0,0 +1,23 @@
+# Country flags: the name/alias/code index against the old substring scan over emoji_flags.json.
+# Run from the repository root: python -m bench.country_flag_lookup
+
+import json
+import timeit
+
+from country_flags import country_code, get_country_flag
+
+def substring_scan(name):
+    for country in country_code:
+        if name.lower() in country['name'].lower():
+            return country['emoji']
+
+with open('airports.json') as ap:
+    names = [data['country'] for data in json.load(ap).values()]
+number = 5
+scan = timeit.timeit(lambda: [substring_scan(n) for n in names], number=number)
+index = timeit.timeit(lambda: [get_country_flag(n) for n in names], number=number)
+print('{0} lookups x {1}'.format(len(names), number))
+print('substring scan: {0:.1f} us/lookup'.format(scan / number / len(names) * 1e6))
+print('flag index:     {0:.2f} us/lookup ({1:.0f}x)'.format(index / number / len(names) * 1e6, scan / index))
+for name in ('Niger', 'Guinea', 'Ireland', 'Congo (Kinshasa)', "Cote d'Ivoire", 'Myanmar', 'TH'):
+    print('{0}: {1}'.format(name, get_country_flag(name)))
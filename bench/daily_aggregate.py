@@ -0,0 +1,39 @@
+# Daily forecast rows: one pass over the hourly points against rescanning the day list per point.
+# Run from the repository root: python -m bench.daily_aggregate
+
+import time
+
+from daily import aggregate_daily
+
+def rescan(points):
+    # what Weather._normalize_aqi_forecast_data did: look the date up in the list for every point
+    aqi_forecast = []
+    for date_str, low, high in points:
+        if not any(d['date'] == date_str for d in aqi_forecast):
+            aqi_forecast.append({'date': date_str, 'min': low, 'max': high})
+        else:
+            for d in aqi_forecast:
+                if d['date'] == date_str and low < d['min']:
+                    d['min'] = low
+                if d['date'] == date_str and high > d['max']:
+                    d['max'] = high
+    return aqi_forecast
+
+def hourly_points(weeks):
+    return [('2019-{0:02d}-{1:02d}'.format(1 + hour // 24 // 28, 1 + hour // 24 % 28),
+             (hour * 7) % 180, (hour * 7) % 180 + 40) for hour in range(weeks * 7 * 24)]
+
+for weeks in (1, 2, 4, 8, 16):
+    points = hourly_points(weeks)
+    timings = []
+    for func in (rescan, aggregate_daily):
+        best = None
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(20):
+                func(points)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best / 20 * 1e6)
+    print('{0:2} weeks ({1:4} points): rescan {2:9.1f} us  one pass {3:7.1f} us'.format(
+        weeks, len(points), timings[0], timings[1]))
@@ -0,0 +1,130 @@
+# Flex builders: time and peak allocation of every reply builder on a sample
+# payload, and what sending the result costs as plain JSON (FlexMessage)
+# against the linebot model round trip FlexSendMessage used to do.
+# Run from the repository root: python -m bench.flex_builders
+
+import os
+import json
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from linebot.models import FlexSendMessage, BubbleContainer, CarouselContainer
+
+from flex import FlexMessage
+from weather import Weather
+from aqi import WeatherAQI
+from flight_api import FlightApi
+from places import Places
+
+weather_data = {
+    'address': {'formatted': 'Bangkok, Thailand', 'annotations': {'flag': 'TH'},
+                'geometry': {'lat': 13.75, 'lng': 100.5}},
+    'current': {'ob_time': '2019-01-01 10:00', 'timezone': 'Asia/Bangkok', 'temp': 31.2,
+                'weather': {'description': 'Clear sky', 'icon': 'c01d'}, 'app_temp': 33.1, 'rh': 60,
+                'sunrise': '23:30', 'sunset': '11:05'},
+    'daily': [{'datetime': '2019-01-0{0}'.format(day + 1), 'min_temp': 24.5 + day, 'max_temp': 33.2 + day,
+               'weather': {'description': 'Sunny', 'icon': 'c0{0}d'.format(day % 4 + 1)}} for day in range(7)]
+}
+hourly_data = {
+    'city_name': 'Bangkok', 'country_code': 'TH',
+    'data': [{'timestamp_local': '2019-01-01T{0:02d}:00:00'.format(10 + hour), 'temp': 30.4 + hour,
+              'app_temp': 32.9 + hour, 'weather': {'description': 'Cloudy', 'icon': 'c02d'}} for hour in range(12)]
+}
+aqi_raw_data = {
+    'name': 'Din Daeng', 'city': 'Bangkok', '_id': 'st123', 'timezone': 'Asia/Bangkok',
+    'current_measurement': {'aqius': 75, 'ts': '2019-01-01T03:00:00.000Z'},
+    'current_weather': {'ic': '01d', 'tp': 31, 'hu': 60, 'ws': 2.5, 'ts': '2019-01-01T03:00:00.000Z'},
+    'forecasts': [{'ts': '2019-01-{0:02d}T{1:02d}:00:00.000Z'.format(1 + hour // 24, hour % 24), 'tp': 30,
+                   'aqius': 20 + (hour * 37) % 300, 'ic': '0{0}d'.format(hour % 4 + 1)} for hour in range(48)],
+    'forecasts_daily': [{'ts': '2019-01-{0:02d}T00:00:00.000Z'.format(day + 1), 'aqius': 30 + 40 * day}
+                        for day in range(10)]
+}
+flight_payload = {
+    'aircraft': {'aircraftOperator': 'Thai Airways', 'aircraftFullType': 'Boeing 777-300',
+                 'aircraftAgeString': '10 years'},
+    'static': {'departureApt': 'BKK', 'arrivalApt': 'NRT', 'arrivalDay': 'Next day', 'seats': 364,
+               'journeyTime': '6h 5m', 'codeshares': ['NH5956', 'AC6312']},
+    'photos': [{'url': 'https://example.com/a.jpg'}],
+    'status': {'depSchdLOC': 1546300800, 'arrSchdLOC': 1546322700, 'depOffset': '+0700', 'arrOffset': '+0900',
+               'departureTerminal': None, 'departureGate': 'C1'}
+}
+route_data = {
+    'title': 'Up To 23 Flights Per Day', 'description': 'Bangkok (BKK) to Tokyo (NRT)',
+    'flights': [{'time': '0{0}:00 AM → 0{0}:00 PM'.format(index % 10), 'flight_no': 'TG{0}'.format(600 + index),
+                 'carrier_name': 'Thai Airways'} for index in range(23)]
+}
+airport_data = {
+    'departure_title': 'Suvarnabhumi, Bangkok, Thailand (BKK)',
+    'arrival_title': 'Suvarnabhumi, Bangkok, Thailand (BKK)',
+    'departures': [{'time': '10:{0:02d}'.format(index), 'destination': 'TOKYO', 'destination_code': 'NRT',
+                    'flight_no': 'TG{0}'.format(index)} for index in range(14)],
+    'arrivals': [{'time': '11:{0:02d}'.format(index), 'origin': 'SEOUL', 'origin_code': 'ICN',
+                  'flight_no': 'KE{0}'.format(index)} for index in range(14)]
+}
+places = [{'photo_url': 'https://example.com/p.jpg', 'icon': 'https://example.com/i.png',
+           'name': 'Cafe {0}'.format(index), 'rating': [4, None, 2][index % 3], 'address': 'Road {0}'.format(index),
+           'address_url': 'https://maps.example/{0}'.format(index), 'operating_hours': '08:00 - 20:00',
+           'website': [None, 'https://cafe.example'][index % 2]} for index in range(5)]
+
+weather = Weather()
+weather_aqi = WeatherAQI()
+flight_api = FlightApi()
+place_search = Places()
+builders = [
+    ('weather', lambda: weather._render_weather_message(weather_data)),
+    ('weather hourly', lambda: weather.get_weather_forecast_hourly_data(hourly_data)),
+    ('aqi', lambda: weather_aqi._render_aqi_message(aqi_raw_data)),
+    ('aqi today', lambda: weather_aqi._render_aqi_today_message(aqi_raw_data, 7)),
+    ('aqi daily', lambda: weather_aqi._render_aqi_daily_message(aqi_raw_data, 7)),
+    ('flight', lambda: flight_api.create_flight_message('TG676', '8851F1', flight_payload)),
+    ('flight route', lambda: flight_api.create_flight_route_message(route_data)),
+    ('airport board', lambda: flight_api.create_airport_message(airport_data)),
+    ('places', lambda: place_search.create_place_flex_message(places))
+]
+containers = {'bubble': BubbleContainer, 'carousel': CarouselContainer}
+
+
+def best_of(func, rounds, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / rounds * 1e6
+
+
+def peak_kib(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def send_as_json(contents):
+    return json.dumps(FlexMessage(alt_text='x', contents=contents).as_json_dict())
+
+
+def send_via_models(contents):
+    container = containers[contents['type']].new_from_json_dict(contents)
+    return json.dumps(FlexSendMessage(alt_text='x', contents=container).as_json_dict())
+
+
+rounds = int(os.getenv('BENCH_ROUNDS', '200'))
+print('build: the builder on a sample payload; json: FlexMessage as sent now; '
+      'models: the same contents through BubbleContainer/CarouselContainer and FlexSendMessage')
+print('{0:14} {1:>9} {2:>9} | {3:>10} {4:>9} | {5:>10} {6:>9}'.format(
+    'builder', 'build us', 'peak KiB', 'json us', 'peak KiB', 'models us', 'peak KiB'))
+# create_flight_message prints its payload, as it does when serving a reply
+with open(os.devnull, 'w') as devnull:
+    for name, build in builders:
+        with redirect_stdout(devnull):
+            contents = build()
+            assert json.loads(send_as_json(contents)) == json.loads(send_via_models(contents)), name
+            row = [best_of(build, rounds), peak_kib(build),
+                   best_of(lambda: send_as_json(contents), rounds), peak_kib(lambda: send_as_json(contents)),
+                   best_of(lambda: send_via_models(contents), rounds), peak_kib(lambda: send_via_models(contents))]
+        print('{0:14} {1:9.1f} {2:9.1f} | {3:10.1f} {4:9.1f} | {5:10.1f} {6:9.1f}'.format(name, *row))
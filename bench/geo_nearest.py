@@ -0,0 +1,25 @@
+# Nearest airports: GeoIndex k-d tree against a brute-force haversine scan.
+# Run from the repository root: python -m bench.geo_nearest
+
+import random
+import timeit
+
+from airport_db import AirportDatabase
+from geo import GeoIndex, haversine_km
+
+db = AirportDatabase.open()
+points = list(db.coordinates())
+index = GeoIndex(points)
+
+def brute_force(lat, lng, n=5):
+    return sorted((haversine_km(lat, lng, p_lat, p_lng), key) for key, p_lat, p_lng in points)[:n]
+
+random.seed(1)
+queries = [(random.uniform(-60, 70), random.uniform(-180, 180)) for _ in range(200)]
+kd = timeit.timeit(lambda: [index.nearest(lat, lng) for lat, lng in queries], number=5) / (5 * len(queries))
+brute = timeit.timeit(lambda: [brute_force(lat, lng) for lat, lng in queries], number=1) / len(queries)
+print('{0} airports, nearest 5'.format(len(index)))
+print('k-d tree:    {0:8.0f} queries/s ({1:.0f} us/query)'.format(1 / kd, kd * 1e6))
+print('brute force: {0:8.0f} queries/s ({1:.0f} us/query)'.format(1 / brute, brute * 1e6))
+for distance, key in index.nearest(13.7563, 100.5018, 3):
+    print('{0:6.1f} km  {1}'.format(distance, db.record(key)['name']))
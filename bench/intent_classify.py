@@ -0,0 +1,63 @@
+# Text intents: one compiled alternation against the if-chain handle_text_message used to run.
+# Run from the repository root: python -m bench.intent_classify
+
+import re
+import time
+
+from intents import IntentClassifier
+
+classifier = IntentClassifier()
+for name, pattern in [
+    ('aqi', r'aqi\Z'),
+    ('look_up', r'(?s:.*?)มองบน'),
+    ('lineqa', r'(?s:.*?)lineqa'),
+    ('weather_menu', r'(?:อากาศ|weather)\Z'),
+    ('weather_in', r'weather in (.*)'),
+    ('flight', r'flight (.*)'),
+    ('route', r'([a-z]{3}-[a-z]{3})$'),
+    ('airport', r'airport (.*)')
+]:
+    classifier.add(name, pattern)(lambda event, *groups: groups)
+
+def if_chain(text):
+    # the checks handle_text_message used to run on every message
+    matched = []
+    if 'aqi' == text.lower():
+        matched.append('aqi')
+    if 'มองบน' in text.lower():
+        matched.append('look_up')
+    if 'lineqa' in text.lower():
+        matched.append('lineqa')
+    if 'อากาศ' == text or 'weather' == text.lower():
+        matched.append('weather_menu')
+    m = re.match('weather in (.*)', text.lower())
+    if m is not None:
+        matched.append('weather_in')
+    n = re.match('flight (.*)', text.lower())
+    if n is not None:
+        matched.append('flight')
+    p = re.match('(^[A-Z]{3}-[A-Z]{3}$)', text.upper())
+    if p is not None:
+        matched.append('route')
+    q = re.match('airport (.*)', text.lower())
+    if q is not None:
+        matched.append('airport')
+    return matched
+
+messages = ['AQI', 'มองบน', 'so lineqa', 'Weather', 'อากาศ', 'weather in Tokyo', 'flight tg676',
+            'BKK-NRT', 'airport narita', 'hello there, how are you today?', 'weather in lineqa']
+for text in messages:
+    intent = classifier.classify(text)
+    print('{0:34} -> {1:24} (if-chain matched {2})'.format(
+        text, '{0} {1}'.format(*intent[:2]) if intent else '-', if_chain(text)))
+
+samples = messages * 2000
+for name, func in [('if-chain', if_chain), ('classifier', classifier.classify)]:
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        for text in samples:
+            func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('{0:11} {1:.2f} us/message'.format(name, best / len(samples) * 1e6))
@@ -0,0 +1,71 @@
+# Postback routing: PostbackRouter against the substring chain handle_postback_event used to run.
+# Run from the repository root: python -m bench.postback_routing
+
+import time
+
+from router import PostbackRouter
+
+router = PostbackRouter()
+for action, params in [
+    ('place_search', {'lat': float, 'lng': float, 'type': str}),
+    ('weather', {'place': str}),
+    ('weather_hourly', {'lat': float, 'lng': float}),
+    ('flight_info', {'flight_no': str}),
+    ('airport', {'code': str}),
+    ('aqi_today_forecast', {'station_id': str}),
+    ('aqi_daily_forecast', {'station_id': str})
+]:
+    router.add(action, **params)(lambda event, **kwargs: kwargs)
+
+payloads = {
+    'place_search?lat=13.75&lng=100.5&type=cafe': 'place_search',
+    'weather=tokyo': 'weather',
+    'weather=heathrow airport': 'weather',
+    'weather_hourly?lat=13.75&lng=100.5': 'weather_hourly',
+    'flight_info=TG676': 'flight_info',
+    'airport=BKK': 'airport',
+    'aqi_today_forecast?station_id=5a0d2b1a': 'aqi_today_forecast',
+    'aqi_daily_forecast?station_id=5a0d2b1a': 'aqi_daily_forecast'
+}
+substring_tests = ['place_search?', 'weather=', 'weather_hourly?', 'flight_info', 'airport',
+                   'aqi_today_forecast', 'aqi_daily_forecast']
+
+for data, action in payloads.items():
+    func, kwargs = router.resolve(data)
+    matched = [token for token in substring_tests if token in data]
+    print('{0:42} -> {1:18} {2}  (substring chain ran {3})'.format(data, action, kwargs, matched))
+
+def substring_chain(data):
+    # the checks handle_postback_event used to run on every postback
+    result = None
+    if 'place_search?' in data:
+        query_params = data.split('?')[1]
+        result = (float(query_params.split('&')[0].split('=')[1]),
+                  float(query_params.split('&')[1].split('=')[1]),
+                  query_params.split('&')[2].split('=')[1])
+    if 'weather=' in data:
+        result = data.split('=')[1]
+    if 'weather_hourly?' in data:
+        lat, lng = data.split('?')[1].split('&')
+        result = (lat.split('=')[1], lng.split('=')[1])
+    if 'flight_info' in data:
+        result = data.split('=')[1]
+    if 'airport' in data:
+        result = data.split('=')[1]
+    if 'aqi_today_forecast' in data:
+        result = data.split('=')[1]
+    if 'aqi_daily_forecast' in data:
+        result = data.split('=')[1]
+    return result
+
+samples = list(payloads) * 5000
+for name, func in [('substring chain', substring_chain), ('router, uncached', router._resolve),
+                   ('router', router.resolve)]:
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        for data in samples:
+            func(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('{0:17} {1:.2f} us/postback'.format(name, best / len(samples) * 1e6))
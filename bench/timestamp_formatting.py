@@ -0,0 +1,85 @@
+# Timestamp parsing and formatting: timeutil against dateutil/strptime on the shapes the builders format.
+# Run from the repository root: python -m bench.timestamp_formatting
+
+import time
+from datetime import datetime, timezone
+
+import pytz
+import dateutil.parser
+from dateutil.tz import gettz
+
+from timeutil import parse_iso, reformat, format_iso_local, format_utc_local
+
+# an hourly AQI carousel: 48 readings, one time zone, plus the daily dates
+hourly = ['2019-01-{0:02d}T{1:02d}:00:00.000Z'.format(1 + hour // 24, hour % 24) for hour in range(48)]
+daily = ['2019-01-{0:02d}T00:00:00.000Z'.format(day) for day in range(1, 9)]
+
+def old_carousel():
+    rows = [dateutil.parser.parse(ts).astimezone(gettz('Asia/Bangkok')).strftime('%-I%p') for ts in hourly]
+    rows += [dateutil.parser.parse(ts).astimezone(gettz('Asia/Bangkok')).strftime('%A %-d %B %Y') for ts in daily]
+    return rows
+
+def new_carousel():
+    rows = [format_iso_local(ts, 'Asia/Bangkok', '%-I%p') for ts in hourly]
+    rows += [format_iso_local(ts, 'Asia/Bangkok', '%A %-d %B %Y') for ts in daily]
+    return rows
+
+# a weather bubble: observation time, sunrise/sunset and five daily dates
+def old_weather():
+    def convert_time(dt_str, tz_str, from_format, to_format):
+        dt = pytz.utc.localize(datetime.strptime(dt_str, from_format))
+        return dt.astimezone(pytz.timezone(tz_str)).strftime(to_format)
+    rows = [convert_time('2019-01-01 10:00', 'Asia/Tokyo', '%Y-%m-%d %H:%M', '%a, %d %B %H:%M %p %z'),
+            convert_time('21:30', 'Asia/Tokyo', '%H:%M', '%I:%M %p'),
+            convert_time('08:05', 'Asia/Tokyo', '%H:%M', '%I:%M %p')]
+    return rows + [datetime.strptime('2019-01-0{0}'.format(day), '%Y-%m-%d').strftime('%a, %-d %b') for day in range(2, 7)]
+
+def new_weather():
+    rows = [format_utc_local('2019-01-01 10:00', 'Asia/Tokyo', '%Y-%m-%d %H:%M', '%a, %d %B %H:%M %p %z'),
+            format_utc_local('21:30', 'Asia/Tokyo', '%H:%M', '%I:%M %p'),
+            format_utc_local('08:05', 'Asia/Tokyo', '%H:%M', '%I:%M %p')]
+    return rows + [reformat('2019-01-0{0}'.format(day), '%Y-%m-%d', '%a, %-d %b') for day in range(2, 7)]
+
+# a flight schedule search result: 20 legs, epoch + offset + next-day for each
+legs = [('2019-01-{0:02d}T23:{1:02d}:00+07:00'.format(day, day), '2019-01-{0:02d}T07:{1:02d}:00+09:00'.format(day + 1, day))
+        for day in range(1, 21)]
+
+def old_schedule():
+    result = []
+    for departure, arrival in legs:
+        result.append((dateutil.parser.parse(departure).replace(tzinfo=timezone.utc).timestamp(),
+                       dateutil.parser.parse(departure).strftime('%z'),
+                       dateutil.parser.parse(arrival).replace(tzinfo=timezone.utc).timestamp(),
+                       dateutil.parser.parse(arrival).strftime('%z'),
+                       dateutil.parser.parse(arrival).day != dateutil.parser.parse(departure).day))
+    return result
+
+def new_schedule():
+    result = []
+    for departure, arrival in legs:
+        departure, arrival = parse_iso(departure), parse_iso(arrival)
+        result.append((departure.local_epoch, departure.offset, arrival.local_epoch, arrival.offset,
+                       arrival.local_date != departure.local_date))
+    return result
+
+for name, old, new in [('aqi carousel', old_carousel, new_carousel), ('weather bubble', old_weather, new_weather),
+                       ('flight schedule', old_schedule, new_schedule)]:
+    assert old() == new(), name
+    timings = []
+    for func, rounds in [(old, 200), (new, 200)]:
+        best = None
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best / rounds * 1e6)
+    # cold: every timestamp is parsed and formatted again, as on a new reading
+    start = time.perf_counter()
+    for _ in range(200):
+        for cached in (parse_iso, reformat, format_iso_local, format_utc_local):
+            cached.cache_clear()
+        new()
+    cold = (time.perf_counter() - start) / 200 * 1e6
+    print('{0:15} old {1:8.1f} us  new {2:7.1f} us (cold {3:7.1f} us)'.format(name, timings[0], timings[1], cold))
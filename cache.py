@@ -0,0 +1,342 @@
+import os
+import json
+import time
+import fcntl
+import atexit
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+refresh_executor = ThreadPoolExecutor(max_workers=int(os.getenv('CACHE_REFRESH_WORKERS', '4')))
+
+
+class TTLCache(object):
+    """Thread-safe LRU cache whose entries expire after a per-entry TTL.
+
+    With stale_ttl set, expired entries are kept that much longer so callers
+    can fall back to them through get_stale() when the upstream is failing.
+
+    With persist_path set, entries are written to that JSON file (at most
+    every persist_interval seconds, in the background, and at exit) and
+    loaded back on start, so keys must be strings and values JSON-serializable.
+    Each save merges in the entries other processes wrote to the same file.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, stale_ttl=0, persist_path=None, persist_interval=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.persist_path = persist_path
+        self.persist_interval = persist_interval
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.RLock()
+        self._last_saved = 0
+        self._dirty = False
+        self._saving = False
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.prefetches = 0
+        self._refreshing = set()
+        if persist_path is not None:
+            self.load()
+            atexit.register(self.save)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            now = time.time()
+            if entry is None or entry[0] <= now:
+                if entry is not None and entry[0] + self.stale_ttl <= now:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, key, default=None):
+        """Return an entry even if expired, as long as it is within stale_ttl."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] + self.stale_ttl <= time.time():
+                return default
+            self.stale_hits += 1
+            return entry[1]
+
+    def get_or_refresh(self, key, loader, ttl=None):
+        """Stale-while-revalidate read.
+
+        A fresh entry is returned as is. An expired entry still within
+        stale_ttl is returned immediately while one background refresh per key
+        runs loader(). Only a missing entry makes the caller wait for loader().
+        ttl may be a number or a function of the loaded value; loaded values
+        of None are returned but not cached.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            now = time.time()
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None and entry[0] + self.stale_ttl > now:
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    refresh_executor.submit(self._refresh, key, loader, ttl)
+                return entry[1]
+            self.misses += 1
+        return self._load(key, loader, ttl)
+
+    async def get_or_refresh_async(self, key, loader, ttl=None):
+        """get_or_refresh() for coroutine loaders; the refresh runs as a task on the running loop."""
+        with self._lock:
+            entry = self._data.get(key)
+            now = time.time()
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None and entry[0] + self.stale_ttl > now:
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    asyncio.ensure_future(self._refresh_async(key, loader, ttl))
+                return entry[1]
+            self.misses += 1
+        return await self._load_async(key, loader, ttl)
+
+    def prefetch(self, key, loader, ttl=None):
+        """Load key in the background unless it is fresh or already loading.
+
+        For entries a caller knows it will need soon; returns whether a load
+        was started.
+        """
+        if not self._start_prefetch(key):
+            return False
+        refresh_executor.submit(self._refresh, key, loader, ttl)
+        return True
+
+    def prefetch_async(self, key, loader, ttl=None):
+        """prefetch() for coroutine loaders; the load runs as a task on the running loop."""
+        if not self._start_prefetch(key):
+            return False
+        asyncio.ensure_future(self._refresh_async(key, loader, ttl))
+        return True
+
+    def _start_prefetch(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if (entry is not None and entry[0] > time.time()) or key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.prefetches += 1
+            return True
+
+    async def _load_async(self, key, loader, ttl):
+        value = await loader()
+        if value is not None:
+            self.set(key, value, ttl=ttl(value) if callable(ttl) else ttl)
+        return value
+
+    async def _refresh_async(self, key, loader, ttl):
+        failed = False
+        try:
+            await self._load_async(key, loader, ttl)
+        except Exception as e:
+            failed = True
+            print('====== CACHE REFRESH FAILED {0}: {1} ======'.format(key, e))
+        with self._lock:
+            self._refreshing.discard(key)
+            if failed:
+                self.refresh_errors += 1
+            else:
+                self.refreshes += 1
+
+    def _load(self, key, loader, ttl):
+        value = loader()
+        if value is not None:
+            self.set(key, value, ttl=ttl(value) if callable(ttl) else ttl)
+        return value
+
+    def _refresh(self, key, loader, ttl):
+        failed = False
+        try:
+            self._load(key, loader, ttl)
+        except Exception as e:
+            failed = True
+            print('====== CACHE REFRESH FAILED {0}: {1} ======'.format(key, e))
+        with self._lock:
+            self._refreshing.discard(key)
+            if failed:
+                self.refresh_errors += 1
+            else:
+                self.refreshes += 1
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            self._dirty = True
+        if self.persist_path is not None and time.time() - self._last_saved >= self.persist_interval:
+            self._schedule_save()
+
+    def _schedule_save(self):
+        # on the refresh pool, so neither a request thread nor the event loop waits on the file
+        with self._lock:
+            if self._saving:
+                return
+            self._saving = True
+            self._last_saved = time.time()
+        refresh_executor.submit(self._background_save)
+
+    def _background_save(self):
+        try:
+            self.save()
+        finally:
+            with self._lock:
+                self._saving = False
+
+    def __len__(self):
+        return len(self._data)
+
+    def items(self):
+        """Snapshot of the (key, value) pairs that have not expired."""
+        now = time.time()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def _read_file(self):
+        try:
+            with open(self.persist_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return []
+
+    def load(self):
+        now = time.time()
+        with self._lock:
+            for key, expires_at, value in self._read_file()[-self.maxsize:]:
+                if expires_at > now:
+                    self._data[key] = (expires_at, value)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            merged = dict(self._data)
+            self._dirty = False
+            self._last_saved = time.time()
+        tmp_path = '{0}.{1}.{2}.tmp'.format(self.persist_path, os.getpid(), threading.get_ident())
+        try:
+            # the lock file serializes the read-merge-write of every worker sharing the path
+            with open(self.persist_path + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                # keep what other workers saved; for a key both have, the later expiry wins
+                now = time.time()
+                for key, expires_at, value in self._read_file():
+                    if expires_at > now and (key not in merged or merged[key][0] < expires_at):
+                        merged[key] = (expires_at, value)
+                # the file is read back oldest first, so the latest expiries survive the maxsize cut
+                entries = sorted(([key, expires_at, value] for key, (expires_at, value) in merged.items()),
+                                 key=lambda entry: entry[1])[-self.maxsize:]
+                with open(tmp_path, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.persist_path)
+        except (IOError, TypeError, ValueError) as e:
+            print('====== CACHE SAVE FAILED {0}: {1} ======'.format(self.persist_path, e))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'prefetches': self.prefetches,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None
+            }
+
+
+class RenderCache(object):
+    """Thread-safe LRU cache of rendered Flex contents.
+
+    Entries are keyed by (message type, entity id, data version), where the
+    version identifies the upstream reading the message was rendered from, so
+    a new reading is a new key and the old entry simply falls out of the LRU.
+    Memory is bounded by max_bytes, counting each payload by its JSON size.
+    Cached payloads are shared between replies and must not be modified.
+    """
+
+    def __init__(self, maxsize=2048, max_bytes=8 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (size, payload)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_render(self, kind, entity_id, version, render):
+        """Return the payload rendered for this version, calling render() only on a miss.
+
+        A version of None means the data cannot be identified, so it is
+        rendered every time and not cached.
+        """
+        if version is None:
+            return render()
+        key = (kind, entity_id, version)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        payload = render()
+        size = len(json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        if size > self.max_bytes:
+            return payload
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[0]
+            self._data[key] = (size, payload)
+            self.bytes += size
+            while len(self._data) > self.maxsize or self.bytes > self.max_bytes:
+                evicted_size, _ = self._data.popitem(last=False)[1]
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return payload
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None
+            }
+
+
+rendered_replies = RenderCache(maxsize=int(os.getenv('RENDER_CACHE_SIZE', '2048')),
+                               max_bytes=int(os.getenv('RENDER_CACHE_MAX_BYTES', str(8 * 1024 * 1024))))
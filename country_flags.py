@@ -0,0 +1,89 @@
+import json
+import re
+import difflib
+import unicodedata
+from functools import lru_cache
+from types import MappingProxyType
+
+with open('emoji_flags.json') as cc:
+    country_code = json.load(cc)
+
+# country names used by airports.json (and upstream APIs) that don't match
+# any name or title in emoji_flags.json
+aliases = {
+    'falkland islands': 'FK',
+    'ireland': 'IE',
+    'congo brazzaville': 'CG',
+    'congo kinshasa': 'CD',
+    'saint helena': 'SH',
+    'macedonia': 'MK',
+    'syria': 'SY',
+    'midway islands': 'UM',
+    'johnston atoll': 'UM',
+    'wake island': 'UM',
+    'virgin islands': 'VI',
+    'brunei': 'BN',
+    'east timor': 'TL',
+    'palestine': 'PS',
+    'uk': 'GB',
+    'usa': 'US'
+}
+
+_non_alnum = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_country_name(name):
+    decomposed = unicodedata.normalize('NFKD', name)
+    ascii_name = ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    return _non_alnum.sub(' ', ascii_name.replace('’', '').replace("'", '')).strip()
+
+
+def _build_flag_indexes(countries):
+    by_code = {}
+    by_name = {}
+    for country in countries:
+        by_code.setdefault(country['code'].upper(), country['emoji'])
+    for country in countries:
+        title = country['title']
+        if title.startswith('flag for '):
+            by_name.setdefault(normalize_country_name(title[len('flag for '):]), country['emoji'])
+    # names win over titles, e.g. "Congo DR" and "Congo" share the title "Congo"
+    for country in countries:
+        by_name[normalize_country_name(country['name'])] = country['emoji']
+    for alias, code in aliases.items():
+        by_name.setdefault(alias, by_code[code])
+    return MappingProxyType(by_code), MappingProxyType(by_name)
+
+flags_by_code, flags_by_name = _build_flag_indexes(country_code)
+_name_tokens = [(frozenset(name.split()), name) for name in flags_by_name]
+
+
+def _fuzzy_country_flag(normalized):
+    # whole-word match first: the shortest known name containing every query
+    # word, so "Guinea" can never resolve to "Papua New Guinea" by accident
+    tokens = frozenset(normalized.split())
+    candidates = [(len(name_tokens), name) for name_tokens, name in _name_tokens if tokens <= name_tokens]
+    if candidates:
+        return flags_by_name[min(candidates)[1]]
+    close = difflib.get_close_matches(normalized, flags_by_name.keys(), n=1, cutoff=0.85)
+    if close:
+        return flags_by_name[close[0]]
+    return None
+
+
+@lru_cache(maxsize=1024)
+def get_country_flag(name):
+    """Return the emoji flag for a country name or ISO code, or None.
+
+    Lookup order: exact normalized name/alias, ISO 3166 code, then fuzzy match.
+    """
+    if not name:
+        return None
+    normalized = normalize_country_name(name)
+    flag = flags_by_name.get(normalized)
+    if flag is not None:
+        return flag
+    flag = flags_by_code.get(name.strip().upper())
+    if flag is not None:
+        return flag
+    return _fuzzy_country_flag(normalized)
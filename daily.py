@@ -0,0 +1,30 @@
+from collections import OrderedDict, namedtuple
+
+# Hourly forecasts are folded into one row per local date in a single pass:
+# each point updates its day's running min, max and sum, so the cost grows
+# linearly with the forecast length however many weeks it covers.
+
+# mean is the mean of the points' midpoints, (low + high) / 2
+DailyAggregate = namedtuple('DailyAggregate', 'date min max mean count')
+
+
+def aggregate_daily(points):
+    """Fold (date, low, high) points into DailyAggregate rows, in order of first appearance.
+
+    points may be any iterable, e.g. a generator over the upstream payload;
+    for single readings pass the value as both low and high.
+    """
+    days = OrderedDict()
+    for date, low, high in points:
+        stats = days.get(date)
+        if stats is None:
+            days[date] = [low, high, (low + high) / 2, 1]
+            continue
+        if low < stats[0]:
+            stats[0] = low
+        if high > stats[1]:
+            stats[1] = high
+        stats[2] += (low + high) / 2
+        stats[3] += 1
+    return [DailyAggregate(date, low, high, total / count, count)
+            for date, (low, high, total, count) in days.items()]
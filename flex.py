@@ -0,0 +1,116 @@
+from linebot.models import SendMessage
+
+# Flex layouts are written once as plain JSON-shaped literals with Slot,
+# Splice and Optional markers where the per-request values go. Template compiles such a
+# layout into a single Python expression at import: subtrees without markers
+# become shared constants, so a render only allocates the dicts and lists on
+# the path to a slot. The result is already the JSON structure LINE expects
+# and is sent through FlexMessage without the linebot model round trip.
+
+
+class Slot(object):
+    """A value filled in at render time."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Slot({0!r})'.format(self.name)
+
+
+class Splice(Slot):
+    """A list of components spliced into the enclosing contents list."""
+
+    def __repr__(self):
+        return 'Splice({0!r})'.format(self.name)
+
+
+class Optional(Slot):
+    """A dict value whose key is left out when it renders as None."""
+
+    def __repr__(self):
+        return 'Optional({0!r})'.format(self.name)
+
+
+def _drop_none(data, keys):
+    for key in keys:
+        if data[key] is None:
+            del data[key]
+    return data
+
+
+def _has_slot(node):
+    if isinstance(node, Slot):
+        return True
+    if isinstance(node, dict):
+        return any(_has_slot(value) for value in node.values())
+    if isinstance(node, list):
+        return any(_has_slot(item) for item in node)
+    return False
+
+
+class Template(object):
+
+    def __init__(self, layout):
+        self.slots = set()
+        self._constants = []
+        source = 'lambda values: ' + self._emit(layout)
+        self.render = eval(source, {'_constants': self._constants, '_drop_none': _drop_none})
+
+    def _constant(self, node):
+        self._constants.append(node)
+        return '_constants[{0}]'.format(len(self._constants) - 1)
+
+    def _emit(self, node):
+        if isinstance(node, Splice):
+            raise ValueError('{0!r} must be an item of a list'.format(node))
+        if isinstance(node, Slot):
+            self.slots.add(node.name)
+            return 'values[{0!r}]'.format(node.name)
+        if isinstance(node, (str, int, float, bool)) or node is None:
+            return repr(node)
+        if not _has_slot(node):
+            return self._constant(node)
+        if isinstance(node, dict):
+            source = '{' + ', '.join('{0!r}: {1}'.format(key, self._emit(value)) for key, value in node.items()) + '}'
+            optional = tuple(key for key, value in node.items() if isinstance(value, Optional))
+            if optional:
+                source = '_drop_none({0}, {1!r})'.format(source, optional)
+            return source
+        items = []
+        for item in node:
+            if isinstance(item, Splice):
+                self.slots.add(item.name)
+                items.append('*values[{0!r}]'.format(item.name))
+            else:
+                items.append(self._emit(item))
+        return '[' + ', '.join(items) + ']'
+
+    def __call__(self, **values):
+        """Render the layout; every slot must be given a value."""
+        return self.render(values)
+
+
+class FlexMessage(SendMessage):
+    """Flex message whose contents are sent as the given JSON structure.
+
+    Unlike FlexSendMessage the contents are not converted into linebot model
+    objects; quick_reply can still be set as usual.
+    """
+
+    def __init__(self, alt_text=None, contents=None, quick_reply=None, **kwargs):
+        super(FlexMessage, self).__init__(quick_reply=quick_reply, **kwargs)
+        self.type = 'flex'
+        self.alt_text = alt_text
+        self.contents = contents
+
+    def as_json_dict(self):
+        data = {
+            'type': self.type,
+            'altText': self.alt_text,
+            'contents': self.contents
+        }
+        if self.quick_reply is not None:
+            data['quickReply'] = self.quick_reply.as_json_dict()
+        return data
+
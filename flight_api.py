@@ -1,17 +1,20 @@
-import requests
 import time
 import os
 import datetime
 import string
 import random
 import json
-from datetime import timezone
-import dateutil.parser
+import math
 from datetime import timedelta
-from linebot.models import (
-    BubbleContainer,
-    CarouselContainer
-)
+from cache import TTLCache
+from http_client import default_client
+from country_flags import get_country_flag
+from airport_db import AirportDatabase
+from geo import GeoIndex
+from airport_search import AirportSearchIndex
+from singleflight import upstream_calls
+from timeutil import parse_iso
+from flex import Template, Slot, Splice, Optional
 
 api_host = os.getenv('FLIGHT_API_HOST', None)
 flight_route_api_host = os.getenv('FLIGHT_ROUTE_API', None)
@@ -21,25 +24,517 @@ aircraft_cdn = os.getenv('AIRCRAFT_CDN', None)
 hmp_format = '%H:%M %p'
 hm_format = '%H:%M'
 
-with open('emoji_flags.json') as cc:
-    country_code = json.load(cc)
+airport_db = AirportDatabase.open()
+_airport_geo_index = None
+_airport_search_index = None
 
-with open('airports.json') as ap:
-    airports = json.load(ap)
+# route schedules, one entry per (origin, destination, date at the origin): fresh for
+# ROUTE_CACHE_TTL but never past the origin's local midnight, when lookups move on
+# to the next day's key; stale entries are served while a background refresh runs
+route_cache = TTLCache(maxsize=int(os.getenv('ROUTE_CACHE_SIZE', '1024')),
+                       ttl=int(os.getenv('ROUTE_CACHE_TTL', str(3 * 3600))),
+                       stale_ttl=int(os.getenv('ROUTE_CACHE_STALE_TTL', str(24 * 3600))))
+# a route looked up this close to the origin's midnight also loads the next day's
+# schedule in the background, so the first lookup after midnight is not a cold fetch
+route_prefetch_window = int(os.getenv('ROUTE_PREFETCH_WINDOW', '1800'))
+# airport departure/arrival boards: a busy hub costs one upstream call per TTL
+# window, and a board up to AIRPORT_BOARD_STALE_TTL old is shown while it refreshes
+airport_board_cache = TTLCache(maxsize=int(os.getenv('AIRPORT_BOARD_CACHE_SIZE', '512')),
+                               ttl=int(os.getenv('AIRPORT_BOARD_TTL', '45')),
+                               stale_ttl=int(os.getenv('AIRPORT_BOARD_STALE_TTL', '300')))
+
+
+# built on first use so workers that never see a location message skip the cost
+def get_airport_geo_index():
+    global _airport_geo_index
+    if _airport_geo_index is None:
+        _airport_geo_index = GeoIndex(airport_db.coordinates())
+    return _airport_geo_index
+
+
+def get_airport_search_index():
+    global _airport_search_index
+    if _airport_search_index is None:
+        _airport_search_index = AirportSearchIndex(airport_db.records())
+    return _airport_search_index
 
 headers = {
     'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_13_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.110 Safari/537.36'
 }
 
+separator = {
+    "type": "separator"
+}
+
+flight_bubble = Template({
+    "type": "bubble",
+    "direction": "ltr",
+    "header": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "text",
+                "text": Slot('title'),
+                "size": "sm",
+                "wrap": True,
+                "align": "center",
+                "weight": "bold",
+                "color": "#383838"
+            }
+        ]
+    },
+    "hero": Optional('hero'),
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "box",
+                "layout": "vertical",
+                "spacing": "md",
+                "contents": [
+                    {
+                        "type": "box",
+                        "layout": "horizontal",
+                        "contents": [
+                            {
+                                "type": "box",
+                                "layout": "vertical",
+                                "flex": 1,
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": Slot('departure_city'),
+                                        "align": "start",
+                                        "gravity": "top",
+                                        "wrap": True
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": Slot('departure_airport'),
+                                        "size": "xxl",
+                                        "action": {
+                                            "type": "postback",
+                                            "data": Slot('departure_data')
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                "type": "image",
+                                "url": "https://i.ibb.co/mvg5f11/travel-icon-38032.png",
+                                "size": "xs",
+                                "backgroundColor": "#FFFFFF"
+                            },
+                            {
+                                "type": "box",
+                                "layout": "vertical",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": Slot('arrival_city'),
+                                        "align": "end",
+                                        "gravity": "top",
+                                        "wrap": True
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": Slot('arrival_airport'),
+                                        "size": "xxl",
+                                        "align": "end",
+                                        "weight": "regular",
+                                        "wrap": True,
+                                        "action": {
+                                            "type": "postback",
+                                            "data": Slot('arrival_data')
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    separator,
+                    Splice('schedule'),
+                    {
+                        "type": "box",
+                        "layout": "horizontal",
+                        "contents": [
+                            {
+                                "type": "box",
+                                "layout": "vertical",
+                                "flex": 5,
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": "Aircraft Type",
+                                        "size": "xs"
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": Slot('aircraft_type'),
+                                        "size": "xs",
+                                        "color": "#545454"
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": Slot('seats'),
+                                        "size": "xs",
+                                        "color": "#545454"
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    separator,
+                    {
+                        "type": "box",
+                        "layout": "horizontal",
+                        "contents": [
+                            {
+                                "type": "box",
+                                "layout": "vertical",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": "Terminal",
+                                        "size": "xs"
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": Slot('terminal'),
+                                        "size": "xs",
+                                        "color": "#545454"
+                                    }
+                                ]
+                            },
+                            {
+                                "type": "box",
+                                "layout": "vertical",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": "Gate",
+                                        "size": "xs"
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": Slot('gate'),
+                                        "size": "xs",
+                                        "color": "#545454"
+                                    }
+                                ]
+                            },
+                            {
+                                "type": "box",
+                                "layout": "vertical",
+                                "contents": [
+                                    {
+                                        "type": "text",
+                                        "text": "Travel Time",
+                                        "size": "xs"
+                                    },
+                                    {
+                                        "type": "text",
+                                        "text": Slot('journey_time'),
+                                        "size": "xs",
+                                        "color": "#545454"
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    separator,
+                    {
+                        "type": "box",
+                        "layout": "vertical",
+                        "contents": [
+                            {
+                                "type": "text",
+                                "text": "Code Share",
+                                "size": "xs"
+                            },
+                            {
+                                "type": "text",
+                                "text": Slot('codeshares'),
+                                "size": "xs",
+                                "color": "#545454",
+                                "wrap": True
+                            }
+                        ]
+                    }
+                ]
+            }
+        ]
+    }
+})
+
+flight_hero = Template({
+    "type": "image",
+    "url": Slot('url'),
+    "size": "full",
+    "aspectRatio": "1.51:1",
+    "aspectMode": "cover"
+})
+
+flight_schedule_box = Template({
+    "type": "box",
+    "layout": "vertical",
+    "contents": [
+        {
+            "type": "box",
+            "layout": "horizontal",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": "Departure",
+                    "flex": 1,
+                    "size": "xs"
+                },
+                {
+                    "type": "text",
+                    "text": "Arrival",
+                    "size": "xs",
+                    "align": "end"
+                }
+            ]
+        },
+        {
+            "type": "box",
+            "layout": "horizontal",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": Slot('departure_time'),
+                    "size": "xs",
+                    "weight": "bold"
+                },
+                {
+                    "type": "text",
+                    "text": Slot('arrival_time'),
+                    "size": "xs",
+                    "align": "end",
+                    "weight": "bold"
+                }
+            ]
+        },
+        {
+            "type": "box",
+            "layout": "horizontal",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": Slot('departure_offset'),
+                    "size": "xs"
+                },
+                {
+                    "type": "text",
+                    "text": Slot('arrival_offset'),
+                    "size": "xs",
+                    "align": "end"
+                }
+            ]
+        }
+    ]
+})
+
+flight_route_bubble = Template({
+    "type": "bubble",
+    "direction": "ltr",
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "sm",
+        "contents": [
+            {
+                "type": "box",
+                "layout": "vertical",
+                "contents": [
+                    {
+                        "type": "text",
+                        "text": Slot('title'),
+                        "size": "sm",
+                        "align": "start",
+                        "weight": "bold",
+                        "color": "#000000"
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('description'),
+                        "size": "xs",
+                        "color": "#929292",
+                        "wrap": True
+                    }
+                ]
+            },
+            separator,
+            Splice('flight_rows')
+        ]
+    }
+})
+
+flight_route_row = Template({
+    "type": "box",
+    "layout": "horizontal",
+    "contents": [
+        {
+            "type": "box",
+            "layout": "vertical",
+            "flex": 2,
+            "contents": [
+                {
+                    "type": "text",
+                    "text": Slot('time'),
+                    "size": "xs",
+                    "gravity": "top",
+                    "color": "#000000",
+                    "action": Slot('action')
+                },
+                {
+                    "type": "text",
+                    "text": Slot('carrier_name'),
+                    "size": "xs",
+                    "color": "#878787",
+                    "wrap": True,
+                    "action": Slot('action')
+                }
+            ]
+        },
+        {
+            "type": "text",
+            "text": Slot('flight_no'),
+            "size": "lg",
+            "align": "center",
+            "color": "#269CB0",
+            "gravity": "center",
+            "action": Slot('action')
+        }
+    ]
+})
+
+airport_board_bubble = Template({
+    "type": "bubble",
+    "styles": {
+        "header": {
+            "backgroundColor": Slot('header_color')
+        },
+        "body": {
+            "backgroundColor": "#000000"
+        }
+    },
+    "direction": "ltr",
+    "header": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "text",
+                "text": Slot('heading'),
+                "align": "start",
+                "size": "xl",
+                "weight": "bold"
+            },
+            {
+                "type": "text",
+                "text": Slot('title'),
+                "size": "xs",
+                "align": "start",
+                "wrap": True
+            }
+        ]
+    },
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "sm",
+        "contents": [
+            {
+                "type": "box",
+                "layout": "horizontal",
+                "contents": [
+                    {
+                        "type": "text",
+                        "text": "Time",
+                        "flex": 1,
+                        "size": "xs",
+                        "align": "start",
+                        "color": "#FFFFFF"
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('place_label'),
+                        "flex": 2,
+                        "size": "xs",
+                        "align": "start",
+                        "color": "#FFFFFF"
+                    },
+                    {
+                        "type": "text",
+                        "text": "Flight",
+                        "size": "xs",
+                        "align": "end",
+                        "color": "#FFFFFF"
+                    }
+                ]
+            },
+            separator,
+            Splice('flight_rows')
+        ]
+    }
+})
+
+airport_board_row = Template({
+    "type": "box",
+    "layout": "horizontal",
+    "contents": [
+        {
+            "type": "text",
+            "text": Slot('time'),
+            "flex": 1,
+            "size": "xs",
+            "align": "start",
+            "color": "#FFFFFF"
+        },
+        {
+            "type": "text",
+            "text": Slot('place'),
+            "flex": 2,
+            "size": "xs",
+            "align": "start",
+            "color": "#FFFFFF",
+            "wrap": True,
+            "action": {
+                "type": "postback",
+                "data": Slot('place_data')
+            }
+        },
+        {
+            "type": "text",
+            "text": Slot('flight_no'),
+            "size": "xs",
+            "align": "end",
+            "color": "#FFFFFF",
+            "action": {
+                "type": "postback",
+                "data": Slot('flight_data')
+            }
+        }
+    ]
+})
+
+
 class FlightApi(object):
 
+    def __init__(self, http=None):
+        self.http = http or default_client
+
     def get_aircraft_photo(self, registration_no):
         url = '{0}/api/json/quicksearch.php?term={1}'.format(aircraft_photo_api, registration_no.upper())
         cookies = {
             'JPSESSID': 'cadodtaha6lskd338n48vk5u82'
         }
         try:
-            response = requests.get(url, headers=headers, cookies=cookies)
+            response = self.http.get(url, headers=headers, cookies=cookies)
             print('get_aircraf_photo: {}'.format(response.text))
             resp_json = response.json()
             if len(resp_json) > 0:
@@ -50,25 +545,24 @@ class FlightApi(object):
         return None
 
     def get_latest_flight(self, flight_no):
+        return upstream_calls.do('latest_flight:{0}'.format(flight_no.upper()), self._fetch_latest_flight, flight_no)
+
+    def _fetch_latest_flight(self, flight_no):
         # current_milli_time = int(round(time.time() * 1000))
         url = '{0}/api/aircraft/historic/flights/flightNo/{1}'.format(api_host, flight_no)
-        response = requests.get(url, headers=headers)
+        response = self.http.get(url, headers=headers)
         resp_json = response.json()
         if resp_json['success'] is True and len(resp_json['payload']) > 0:
             return resp_json['payload'][0]
         return None
 
     def get_country_code_flag(self, name):
-        for country in country_code:
-            if name.lower() in country['name'].lower():
-                return country['emoji']
+        return get_country_flag(name)
 
     def get_airport_name_from_code(self, iata):
-        for code, data in airports.items():
-            if code == iata:
-                country_flag = self.get_country_code_flag(data['country'])
-                data['country_flag'] = country_flag
-                return data
+        airport = airport_db.get(iata)
+        if airport is not None:
+            return airport
         return {
             "name": iata,
             "city": iata,
@@ -78,9 +572,17 @@ class FlightApi(object):
             "country_flag": None
         }
     
+    def get_nearest_airports(self, lat, lng, limit=4, max_km=200):
+        result = []
+        for distance, number in get_airport_geo_index().nearest(float(lat), float(lng), limit * 2, max_km):
+            airport = airport_db.record(number)
+            if airport['iata']:
+                result.append(airport)
+        return result[:limit]
+
     def get_flight_metadata(self, flight_no, adshex):
         url = '{0}/api/aircraft/historic/data/0/{1}/{2}'.format(api_host, adshex, flight_no)
-        response = requests.get(url, headers=headers)
+        response = self.http.get(url, headers=headers)
         return response.json()
 
     def _convert_epoch_to_hm(self, format, epoch, next_day=False):
@@ -96,21 +598,6 @@ class FlightApi(object):
         convert_time = time.strftime(format, _time)
         return convert_time
     
-    def _convert_iso_to_epoch(self, iso_dt):
-        dt = dateutil.parser.parse(iso_dt)
-        return dt.replace(tzinfo=timezone.utc).timestamp()
-    
-    def _get_timezone_offset(self, iso_dt):
-        dt = dateutil.parser.parse(iso_dt)
-        return dt.strftime('%z')
-    
-    def _is_next_day(self, departure_iso, arrival_iso):
-        departure = dateutil.parser.parse(departure_iso)
-        arrival = dateutil.parser.parse(arrival_iso)
-        if arrival.day != departure.day:
-            return True
-        return False
-
     def get_flight_schedule(self, flight_no):
         url = '{0}/v2/api/search/structured-search'.format(flight_route_api_host)
         params = {
@@ -119,134 +606,42 @@ class FlightApi(object):
         body = {
             'value': flight_no
         }
-        response = requests.post(url, params=params, json=body, headers=headers)
-        flights = response.json()
+        response = self.http.post(url, params=params, json=body, headers=headers)
+        return self._parse_flight_schedule(flight_no, response.json())
+
+    def _parse_flight_schedule(self, flight_no, flights):
         for flight in flights:
             flight_name = '{0}{1}'.format(flight['_source']['carrierIata'], flight['_source']['flightNumber'])
             if flight_name == flight_no:
+                departure = parse_iso(flight['_source']['departureDateTime'])
+                arrival = parse_iso(flight['_source']['arrivalDateTime'])
                 result = {}
-                result['departureTime'] = self._convert_iso_to_epoch(flight['_source']['departureDateTime'])
-                result['departureTZOffset'] = self._get_timezone_offset(flight['_source']['departureDateTime'])
-                result['arrivalTime'] = self._convert_iso_to_epoch(flight['_source']['arrivalDateTime'])
-                result['arrivalTZOffset'] = self._get_timezone_offset(flight['_source']['arrivalDateTime'])
-                result['isNextDay'] = self._is_next_day(flight['_source']['departureDateTime'], flight['_source']['arrivalDateTime'])
+                result['departureTime'] = departure.local_epoch
+                result['departureTZOffset'] = departure.offset
+                result['arrivalTime'] = arrival.local_epoch
+                result['arrivalTZOffset'] = arrival.offset
+                result['isNextDay'] = arrival.local_date != departure.local_date
                 return result
         return None
     
 
-    def create_flight_message(self, flight_no, adshex, payload):
+    def needs_flight_schedule(self, payload):
+        """True when the flight's scheduled times have to come from get_flight_schedule."""
+        return payload['status']['depSchdLOC'] is None
+
+    def create_flight_message(self, flight_no, adshex, payload, flight_schedule=None):
+        # flight_schedule: get_flight_schedule(flight_no), fetched by the caller when
+        # needs_flight_schedule(payload), so the builder does no I/O in either mode
         departure_airport = payload['static']['departureApt']
         arrival_airport = payload['static']['arrivalApt']
         print(json.dumps(payload))
-        bubble = {
-            "type": "bubble",
-            "direction": "ltr",
-            "header": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": "{0} - {1}".format(flight_no, payload['aircraft']['aircraftOperator']).upper(),
-                        "size": "sm",
-                        "wrap": True,
-                        "align": "center",
-                        "weight": "bold",
-                        "color": "#383838"
-                    }
-                ]
-            },
-            "body": {    
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                    "type": "box",
-                    "layout": "vertical",
-                    "spacing": "md",
-                    "contents": [
-                        {
-                        "type": "box",
-                        "layout": "horizontal",
-                        "contents": [
-                            {
-                            "type": "box",
-                            "layout": "vertical",
-                            "flex": 1,
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": self.get_airport_name_from_code(payload['static']['departureApt'])['city'],
-                                    "align": "start",
-                                    "gravity": "top",
-                                    "wrap": True
-                                },
-                                {
-                                "type": "text",
-                                "text": departure_airport,
-                                "size": "xxl",
-                                "action": {
-                                    "type": "postback",
-                                    "data": "airport={0}".format(departure_airport)
-                                }
-                                }
-                            ]
-                            },
-                            {
-                                "type": "image",
-                                "url": "https://i.ibb.co/mvg5f11/travel-icon-38032.png",
-                                "size": "xs",
-                                "backgroundColor": "#FFFFFF"
-                            },
-                            {
-                            "type": "box",
-                            "layout": "vertical",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": self.get_airport_name_from_code(payload['static']['arrivalApt'])['city'],
-                                    "align": "end",
-                                    "gravity": "top",
-                                    "wrap": True
-                                },
-                                {
-                                "type": "text",
-                                "text": arrival_airport,
-                                "size": "xxl",
-                                "align": "end",
-                                "weight": "regular",
-                                "wrap": True,
-                                "action": {
-                                    "type": "postback",
-                                    "data": "airport={0}".format(arrival_airport)
-                                }
-                                }
-                            ]
-                            }
-                        ]
-                        },
-                        {
-                        "type": "separator"
-                        }
-                    ]
-                    }
-                ]
-            }
-        }
-
+        hero = None
         if len(payload['photos']) > 0:
             aircraft_photo_url = payload['photos'][0]['url']
             if aircraft_photo_url is not None:
-                bubble['hero'] = {
-                    "type": "image",
-                    "url": aircraft_photo_url,
-                    "size": "full",
-                    "aspectRatio": "1.51:1",
-                    "aspectMode": "cover"
-                }
+                hero = flight_hero(url=aircraft_photo_url)
         
         if payload['status']['depSchdLOC'] is None:
-            flight_schedule = self.get_flight_schedule(flight_no)
             if flight_schedule is not None:
                 payload['status']['depSchdLOC'] = flight_schedule['departureTime']
                 payload['status']['depOffset'] = flight_schedule['departureTZOffset']
@@ -254,193 +649,35 @@ class FlightApi(object):
                 payload['status']['arrOffset'] = flight_schedule['arrivalTZOffset']
                 next_day = flight_schedule['isNextDay']
 
+        schedule = []
         if payload['status']['depSchdLOC'] is not None:
             next_day = False
             if payload['static']['arrivalDay'] == 'Next day':
                 next_day = True
-            bubble['body']['contents'][0]['contents'].extend(
-                (
-                {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                        "type": "box",
-                        "layout": "horizontal",
-                        "contents": [
-                            {
-                            "type": "text",
-                            "text": "Departure",
-                            "flex": 1,
-                            "size": "xs"
-                            },
-                            {
-                            "type": "text",
-                            "text": "Arrival",
-                            "size": "xs",
-                            "align": "end"
-                            }
-                        ]
-                        },
-                        {
-                        "type": "box",
-                        "layout": "horizontal",
-                        "contents": [
-                            {
-                            "type": "text",
-                            "text": self._convert_epoch_to_hm(hmp_format, payload['status']['depSchdLOC'], False),
-                            "size": "xs",
-                            "weight": "bold"
-                            },
-                            {
-                            "type": "text",
-                            "text": self._convert_epoch_to_hm(hmp_format, payload['status']['arrSchdLOC'], next_day),
-                            "size": "xs",
-                            "align": "end",
-                            "weight": "bold"
-                            }
-                        ]
-                        },
-                        {
-                        "type": "box",
-                        "layout": "horizontal",
-                        "contents": [
-                            {
-                            "type": "text",
-                            "text": 'UTC{0}'.format(payload['status']['depOffset']),
-                            "size": "xs"
-                            },
-                            {
-                            "type": "text",
-                            "text": "UTC{0}".format(payload['status']['arrOffset']),
-                            "size": "xs",
-                            "align": "end"
-                            }
-                        ]
-                        }
-                    ]
-            },
-            {
-                "type": "separator"
-            }
-            )
-            )
-        bubble['body']['contents'][0]['contents'].extend(
-            (
-            {
-                "type": "box",
-                "layout": "horizontal",
-                "contents": [
-                    {
-                    "type": "box",
-                    "layout": "vertical",
-                    "flex": 5,
-                    "contents": [
-                        {
-                        "type": "text",
-                        "text": "Aircraft Type",
-                        "size": "xs"
-                        },
-                        {
-                        "type": "text",
-                        "text": "{0} ({1})".format(payload['aircraft']['aircraftFullType'], payload['aircraft']['aircraftAgeString']),
-                        "size": "xs",
-                        "color": "#545454"
-                        },
-                        {
-                            "type": "text",
-                            "text": "Seats: {0}".format(payload['static']['seats']),
-                            "size": "xs",
-                            "color": "#545454"
-                        }
-                    ]
-                    }
-                ]
-            },
-            {
-                "type": "separator"
-            },
-            {
-                "type": "box",
-                "layout": "horizontal",
-                "contents": [
-                    {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                        "type": "text",
-                        "text": "Terminal",
-                        "size": "xs"
-                        },
-                        {
-                        "type": "text",
-                        "text": payload['status']['departureTerminal'] if payload['status']['departureTerminal'] is not None else "N/A",
-                        "size": "xs",
-                        "color": "#545454"
-                        }
-                    ]
-                    },
-                    {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                        "type": "text",
-                        "text": "Gate",
-                        "size": "xs"
-                        },
-                        {
-                        "type": "text",
-                        "text": payload['status']['departureGate'] if payload['status']['departureGate'] is not None else "N/A",
-                        "size": "xs",
-                        "color": "#545454"
-                        }
-                    ]
-                    },
-                    {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                        "type": "text",
-                        "text": "Travel Time",
-                        "size": "xs"
-                        },
-                        {
-                        "type": "text",
-                        "text": payload['static']['journeyTime'],
-                        "size": "xs",
-                        "color": "#545454"
-                        }
-                    ]
-                    }
-                ]
-                },
-                {
-                "type": "separator"
-                },
-                {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                        "type": "text",
-                        "text": "Code Share",
-                        "size": "xs"
-                        },
-                        {
-                        "type": "text",
-                        "text": " / ".join(payload['static']['codeshares']) if payload['static']['codeshares'] is not None else 'N/A',
-                        "size": "xs",
-                        "color": "#545454",
-                        "wrap": True
-                        }
-                    ]
-                }
-            )
+            schedule.append(flight_schedule_box(
+                departure_time=self._convert_epoch_to_hm(hmp_format, payload['status']['depSchdLOC'], False),
+                arrival_time=self._convert_epoch_to_hm(hmp_format, payload['status']['arrSchdLOC'], next_day),
+                departure_offset='UTC{0}'.format(payload['status']['depOffset']),
+                arrival_offset="UTC{0}".format(payload['status']['arrOffset'])
+            ))
+            schedule.append(separator)
+        return flight_bubble(
+            title="{0} - {1}".format(flight_no, payload['aircraft']['aircraftOperator']).upper(),
+            hero=hero,
+            departure_city=self.get_airport_name_from_code(payload['static']['departureApt'])['city'],
+            departure_airport=departure_airport,
+            departure_data="airport={0}".format(departure_airport),
+            arrival_city=self.get_airport_name_from_code(payload['static']['arrivalApt'])['city'],
+            arrival_airport=arrival_airport,
+            arrival_data="airport={0}".format(arrival_airport),
+            schedule=schedule,
+            aircraft_type="{0} ({1})".format(payload['aircraft']['aircraftFullType'], payload['aircraft']['aircraftAgeString']),
+            seats="Seats: {0}".format(payload['static']['seats']),
+            terminal=payload['status']['departureTerminal'] if payload['status']['departureTerminal'] is not None else "N/A",
+            gate=payload['status']['departureGate'] if payload['status']['departureGate'] is not None else "N/A",
+            journey_time=payload['static']['journeyTime'],
+            codeshares=" / ".join(payload['static']['codeshares']) if payload['static']['codeshares'] is not None else 'N/A'
         )
-        return BubbleContainer.new_from_json_dict(bubble)
 
     def get_aircraft_by_flight_no(self, flight_no):
         result = self.get_latest_flight(flight_no)
@@ -449,26 +686,89 @@ class FlightApi(object):
         return 'N/A'
     
     def get_airport_code(self, query):
-        url = '{0}/data/endpoints/search_ajax.php'.format(api_host)
+        local_airports = self._local_airport_code(query)
+        if local_airports is not None:
+            return local_airports
+        url, params = self._airport_code_request(query)
+        response = self.http.get(url, headers=headers, params=params)
+        return self._parse_airport_code(response.json())
+
+    def _local_airport_code(self, query):
+        # same title/url shape as search_ajax, answered from airports.json when possible
+        local_airports = get_airport_search_index().search(query)
+        if len(local_airports) == 0:
+            return None
+        return [
+            {
+                'title': airport['name'],
+                'url': '/data/airports/{0}'.format(airport['iata'])
+            } for airport in local_airports
+        ]
+
+    def _airport_code_request(self, query):
         params = {
             'searchText': query,
             'key': 'PF2202'
         }
-        response = requests.get(url, headers=headers, params=params)
-        resp_json = response.json()
+        return '{0}/data/endpoints/search_ajax.php'.format(api_host), params
+
+    def _parse_airport_code(self, resp_json):
         return resp_json['airports'] if len(resp_json['airports']) > 0 else None
 
     def get_flight_by_route(self, origin, destination):
         print('ORIGIN: {0}, DESTINATION: {1}'.format(origin, destination))
-        today = datetime.datetime.today()
-        url = '{0}/v2/api-next/flight-tracker/route/{1}/{2}/{3}/{4}/{5}'.format(flight_route_api_host, origin, destination, today.year, today.month, today.day)
+        (cache_key, local_date, ttl), prefetch = self._route_prefetch_plan(origin, destination, time.time())
+        if prefetch is not None:
+            next_key, next_date, next_ttl = prefetch
+            route_cache.prefetch(
+                next_key,
+                lambda: upstream_calls.do('route:{0}'.format(next_key), self._fetch_flight_route, origin, destination, next_date),
+                ttl=next_ttl)
+        return route_cache.get_or_refresh(
+            cache_key,
+            lambda: upstream_calls.do('route:{0}'.format(cache_key), self._fetch_flight_route, origin, destination, local_date),
+            ttl=ttl)
+
+    def _fetch_flight_route(self, origin, destination, local_date):
+        url, params = self._flight_route_request(origin, destination, local_date)
+        response = self.http.get(url, params=params)
+        return self._parse_flight_route(response.json()['data'])
+
+    def _route_cache_entry(self, origin, destination, now):
+        # airports.json only has the standard UTC offset, so the origin's midnight
+        # ignores DST; airports without one fall back to UTC
+        airport = airport_db.get(origin)
+        offset = airport['timezone'] if airport is not None else None
+        offset = 0 if offset is None or math.isnan(offset) else int(offset * 3600)
+        local_now = now + offset
+        local_date = datetime.date(1970, 1, 1) + timedelta(days=local_now // 86400)
+        next_midnight = local_now - local_now % 86400 + 86400 - offset
+        cache_key = '{0}-{1}:{2}'.format(origin, destination, local_date.isoformat())
+        return cache_key, local_date, next_midnight
+
+    def _route_ttl(self, next_midnight):
+        return lambda value: max(0, min(route_cache.ttl, next_midnight - time.time()))
+
+    def _route_prefetch_plan(self, origin, destination, now):
+        # (cache key, origin-local date, ttl) of the entry to serve, and of the next
+        # day's entry to prefetch once now is within route_prefetch_window of midnight
+        cache_key, local_date, next_midnight = self._route_cache_entry(origin, destination, now)
+        entry = (cache_key, local_date, self._route_ttl(next_midnight))
+        if next_midnight - now >= route_prefetch_window:
+            return entry, None
+        next_key, next_date, following_midnight = self._route_cache_entry(origin, destination, next_midnight)
+        return entry, (next_key, next_date, self._route_ttl(following_midnight))
+
+    def _flight_route_request(self, origin, destination, local_date):
+        url = '{0}/v2/api-next/flight-tracker/route/{1}/{2}/{3}/{4}/{5}'.format(flight_route_api_host, origin, destination, local_date.year, local_date.month, local_date.day)
         params = {
             'numHours': '24',
             'rqid': ''.join(random.choices(string.ascii_lowercase + string.digits, k=11)),
             'hour': '0'
         }
-        response = requests.get(url, params=params)
-        resp_json = response.json()['data']
+        return url, params
+
+    def _parse_flight_route(self, resp_json):
         result = {}
         if len(resp_json['flights']) > 0:
             flights = []
@@ -490,113 +790,50 @@ class FlightApi(object):
         return None
     
     def create_flight_route_message(self, data, paging=10):
-        carousel_container = CarouselContainer()
+        carousel = {
+            "type": "carousel",
+            "contents": []
+        }
         pages = [data['flights'][i: i+paging] for i in range(0, len(data['flights']), paging)]
         for page in pages:
-            bubble = {
-                "type": "bubble",
-                "direction": "ltr",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "spacing": "sm",
-                    "contents": [
-                        {
-                            "type": "box",
-                            "layout": "vertical",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": data['title'],
-                                    "size": "sm",
-                                    "align": "start",
-                                    "weight": "bold",
-                                    "color": "#000000"
-                                },
-                                {
-                                    "type": "text",
-                                    "text": data['description'],
-                                    "size": "xs",
-                                    "color": "#929292",
-                                    "wrap": True
-                                }
-                            ]
-                        },
-                        {
-                            "type": "separator"
-                        }
-                    ]
-                }
-            }
+            flight_rows = []
             for flight in page:
-                bubble_contents = bubble['body']['contents'].extend(
-                    (
-                        {
-                            "type": "box",
-                            "layout": "horizontal",
-                            "contents": [
-                                {
-                                    "type": "box",
-                                    "layout": "vertical",
-                                    "flex": 2,
-                                    "contents": [
-                                        {
-                                            "type": "text",
-                                            "text": flight['time'],
-                                            "size": "xs",
-                                            "gravity": "top",
-                                            "color": "#000000",
-                                            "action": {
-                                                "type": "postback",
-                                                "label": "flight_info={0}".format(flight['flight_no']),
-                                                "data": "flight_info={0}".format(flight['flight_no'])
-                                            }
-                                        },
-                                        {
-                                            "type": "text",
-                                            "text": flight['carrier_name'],
-                                            "size": "xs",
-                                            "color": "#878787",
-                                            "wrap": True,
-                                            "action": {
-                                                "type": "postback",
-                                                "label": "flight_info={0}".format(flight['flight_no']),
-                                                "data": "flight_info={0}".format(flight['flight_no'])
-                                            }
-                                        }
-                                    ]
-                                },
-                                {
-                                    "type": "text",
-                                    "text": flight['flight_no'],
-                                    "size": "lg",
-                                    "align": "center",
-                                    "color": "#269CB0",
-                                    "align": "center",
-                                    "gravity": "center",
-                                    "action": {
-                                        "type": "postback",
-                                        "label": "flight_info={0}".format(flight['flight_no']),
-                                        "data": "flight_info={0}".format(flight['flight_no'])
-                                    }
-                                }
-                            ]
-                        },
-                        {
-                            "type": "separator"
-                        }
-                    )
-                )
-            bubble_container = BubbleContainer.new_from_json_dict(bubble)
-            carousel_container.contents.append(bubble)
-            if len(carousel_container.contents) == 7:
+                flight_info = "flight_info={0}".format(flight['flight_no'])
+                flight_rows.append(flight_route_row(
+                    time=flight['time'],
+                    carrier_name=flight['carrier_name'],
+                    flight_no=flight['flight_no'],
+                    action={
+                        "type": "postback",
+                        "label": flight_info,
+                        "data": flight_info
+                    }
+                ))
+                flight_rows.append(separator)
+            carousel['contents'].append(flight_route_bubble(
+                title=data['title'],
+                description=data['description'],
+                flight_rows=flight_rows
+            ))
+            if len(carousel['contents']) == 7:
                 break 
-        return carousel_container
+        return carousel
     
     def get_airport_data(self, airport_iata, limit=15):
+        cache_key = self._airport_board_key(airport_iata, limit)
+        return airport_board_cache.get_or_refresh(
+            cache_key,
+            lambda: upstream_calls.do('airport_board:{0}'.format(cache_key), self._fetch_airport_data, airport_iata, limit))
+
+    def _airport_board_key(self, airport_iata, limit):
+        return '{0}:{1}'.format(airport_iata.upper(), limit)
+
+    def _fetch_airport_data(self, airport_iata, limit):
         url = '{0}/api/airport/times/{1}'.format(api_host, airport_iata)
-        response = requests.get(url, headers=headers)
-        resp_json = response.json()['payload']
+        response = self.http.get(url, headers=headers)
+        return self._parse_airport_data(airport_iata, response.json()['payload'], limit)
+
+    def _parse_airport_data(self, airport_iata, resp_json, limit):
         if resp_json['departures'] is not None and resp_json['arrivals'] is not None:
             result = {}
             airport = self.get_airport_name_from_code(airport_iata)
@@ -637,236 +874,33 @@ class FlightApi(object):
         return None
         
     def create_airport_message(self, airport_data):
-        carousel_container = CarouselContainer()
-        departures_bubble = {
-            "type": "bubble",
-            "styles": {
-                "header": {
-                    "backgroundColor": "#FFF800"
-                },
-                "body": {
-                    "backgroundColor": "#000000"
-                }
-            },
-            "direction": "ltr",
-            "header": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": 'DEPARTURES',
-                        "align": "start",
-                        "size": "xl",
-                        "weight": "bold"
-                    },
-                    {
-                        "type": "text",
-                        "text": airport_data['departure_title'],
-                        "size": "xs",
-                        "align": "start",
-                        "wrap": True
-                    }
-                ]
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "spacing": "sm",
-                "contents": [
-                    {
-                        "type": "box",
-                        "layout": "horizontal",
-                        "contents": [
-                            {
-                                "type": "text",
-                                "text": "Time",
-                                "flex": 1,
-                                "size": "xs",
-                                "align": "start",
-                                "color": "#FFFFFF"
-                            },
-                            {
-                                "type": "text",
-                                "text": "Destination",
-                                "flex": 2,
-                                "size": "xs",
-                                "align": "start",
-                                "color": "#FFFFFF"
-                            },
-                            {
-                                "type": "text",
-                                "text": "Flight",
-                                "size": "xs",
-                                "align": "end",
-                                "color": "#FFFFFF"
-                            }
-                        ]
-                    },
-                    {
-                        "type": "separator"
-                    }
-                ]
-            }
-        }
-        for departure in airport_data['departures']:
-            departures_bubble['body']['contents'].append(
-                {
-                    "type": "box",
-                    "layout": "horizontal",
-                    "contents": [
-                        {
-                            "type": "text",
-                            "text": departure['time'],
-                            "flex": 1,
-                            "size": "xs",
-                            "align": "start",
-                            "color": "#FFFFFF"
-                        },
-                        {
-                            "type": "text",
-                            "text": departure['destination'],
-                            "flex": 2,
-                            "size": "xs",
-                            "align": "start",
-                            "color": "#FFFFFF",
-                            "wrap": True,
-                            "action": {
-                                "type": "postback",
-                                "data": "airport={0}".format(departure['destination_code'])
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": departure['flight_no'],
-                            "size": "xs",
-                            "align": "end",
-                            "color": "#FFFFFF",
-                            "action": {
-                                "type": "postback",
-                                "data": "flight_info={0}".format(departure['flight_no'])
-                            }
-                        }
-                    ]
-                }
-            )
-        arrivals_bubble = {
-            "type": "bubble",
-            "styles": {
-                "header": {
-                    "backgroundColor": "#9FE9FF"
-                },
-                "body": {
-                    "backgroundColor": "#000000"
-                }
-            },
-            "direction": "ltr",
-            "header": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {
-                        "type": "text",
-                        "text": "ARRIVALS",
-                        "align": "start",
-                        "size": "xl",
-                        "weight": "bold"
-                    },
-                    {
-                        "type": "text",
-                        "text": airport_data['arrival_title'],
-                        "align": "start",
-                        "size": "xs",
-                        "wrap": True
-                    }
-                ]
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "spacing": "sm",
-                "contents": [
-                    {
-                        "type": "box",
-                        "layout": "horizontal",
-                        "contents": [
-                            {
-                                "type": "text",
-                                "text": "Time",
-                                "flex": 1,
-                                "size": "xs",
-                                "align": "start",
-                                "color": "#FFFFFF"
-                            },
-                            {
-                                "type": "text",
-                                "text": "Origin",
-                                "flex": 2,
-                                "size": "xs",
-                                "align": "start",
-                                "color": "#FFFFFF"
-                            },
-                            {
-                                "type": "text",
-                                "text": "Flight",
-                                "size": "xs",
-                                "align": "end",
-                                "color": "#FFFFFF"
-                            }
-                        ]
-                    },
-                    {
-                        "type": "separator"
-                    }
-                ]
-            }
+        departure_rows = [
+            airport_board_row(
+                time=departure['time'],
+                place=departure['destination'],
+                place_data="airport={0}".format(departure['destination_code']),
+                flight_no=departure['flight_no'],
+                flight_data="flight_info={0}".format(departure['flight_no'])
+            ) for departure in airport_data['departures']
+        ]
+        arrival_rows = [
+            airport_board_row(
+                time=arrival['time'],
+                place=arrival['origin'],
+                place_data="airport={0}".format(arrival['origin_code']),
+                flight_no=arrival['flight_no'],
+                flight_data="flight_info={0}".format(arrival['flight_no'])
+            ) for arrival in airport_data['arrivals']
+        ]
+        return {
+            "type": "carousel",
+            "contents": [
+                airport_board_bubble(header_color="#FFF800", heading="DEPARTURES", title=airport_data['departure_title'],
+                                     place_label="Destination", flight_rows=departure_rows),
+                airport_board_bubble(header_color="#9FE9FF", heading="ARRIVALS", title=airport_data['arrival_title'],
+                                     place_label="Origin", flight_rows=arrival_rows)
+            ]
         }
-        for arrival in airport_data['arrivals']:
-            arrivals_bubble['body']['contents'].append(
-                {
-                    "type": "box",
-                    "layout": "horizontal",
-                    "contents": [
-                        {
-                            "type": "text",
-                            "text": arrival['time'],
-                            "flex": 1,
-                            "size": "xs",
-                            "align": "start",
-                            "color": "#FFFFFF"
-                        },
-                        {
-                            "type": "text",
-                            "text": arrival['origin'],
-                            "flex": 2,
-                            "size": "xs",
-                            "align": "start",
-                            "color": "#FFFFFF",
-                            "wrap": True,
-                            "action": {
-                                "type": "postback",
-                                "data": "airport={0}".format(arrival['origin_code'])
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": arrival['flight_no'],
-                            "size": "xs",
-                            "align": "end",
-                            "color": "#FFFFFF",
-                            "action": {
-                                "type": "postback",
-                                "data": "flight_info={0}".format(arrival['flight_no'])
-                            }
-                        }
-                    ]
-                }
-            )
-        departure_container = BubbleContainer.new_from_json_dict(departures_bubble)
-        arrival_container = BubbleContainer.new_from_json_dict(arrivals_bubble)
-        carousel_container.contents.append(departure_container)
-        carousel_container.contents.append(arrival_container)
-        return carousel_container
 
 if __name__ == "__main__":
     flight_api = FlightApi()
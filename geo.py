@@ -0,0 +1,121 @@
+import math
+import heapq
+
+earth_radius_km = 6371.0088
+leaf_size = 8
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * earth_radius_km * math.asin(min(1.0, math.sqrt(a)))
+
+
+def snap_to_grid(lat, lng, grid):
+    """Round a coordinate to the centre of its grid cell, grid given in degrees."""
+    return (round(round(float(lat) / grid) * grid, 6),
+            round(round(float(lng) / grid) * grid, 6))
+
+
+def parse_latlng(lat, lng):
+    """Parse query string coordinates; ValueError when missing, not numbers or out of range."""
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError('lat and lng must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('lat must be within [-90, 90] and lng within [-180, 180]')
+    return lat, lng
+
+
+def _to_xyz(lat, lng):
+    lat, lng = math.radians(lat), math.radians(lng)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lng), cos_lat * math.sin(lng), math.sin(lat))
+
+
+def _chord_to_km(chord):
+    return 2 * earth_radius_km * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(km):
+    return 2 * math.sin(min(math.pi / 2, km / (2 * earth_radius_km)))
+
+
+class GeoIndex(object):
+    """Static k-d tree over points on the unit sphere.
+
+    Points are stored as 3d unit vectors, where straight-line (chord) distance
+    grows monotonically with great-circle distance, so nearest-neighbour
+    answers are exact everywhere, including across the antimeridian and poles.
+    """
+
+    def __init__(self, points):
+        # points: iterable of (key, latitude, longitude)
+        self.keys = []
+        self.xyz = []
+        for key, lat, lng in points:
+            if math.isnan(lat) or math.isnan(lng):
+                continue
+            self.keys.append(key)
+            self.xyz.append(_to_xyz(lat, lng))
+        # inner node: (split point index, split axis, left child, right child)
+        # leaf node: (point indices, -1, -1, -1); -1 also marks a missing child
+        self.nodes = []
+        self.root = self._build(list(range(len(self.xyz))))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _build(self, indices):
+        if not indices:
+            return -1
+        node_id = len(self.nodes)
+        if len(indices) <= leaf_size:
+            self.nodes.append((tuple(indices), -1, -1, -1))
+            return node_id
+        # split on the axis with the widest spread
+        spreads = [max(self.xyz[i][a] for i in indices) - min(self.xyz[i][a] for i in indices) for a in range(3)]
+        axis = spreads.index(max(spreads))
+        indices.sort(key=lambda i: self.xyz[i][axis])
+        median = len(indices) // 2
+        self.nodes.append(None)
+        left = self._build(indices[:median])
+        right = self._build(indices[median:])
+        self.nodes[node_id] = (indices[median], axis, left, right)
+        return node_id
+
+    def nearest(self, lat, lng, n=5, max_km=None):
+        """Return up to n (distance_km, key) pairs, closest first."""
+        target = _to_xyz(lat, lng)
+        tx, ty, tz = target
+        max_d2 = _km_to_chord(max_km) ** 2 if max_km is not None else float('inf')
+        best = []  # max-heap of (-squared chord, point index)
+        stack = [self.root]
+        xyz = self.xyz
+        nodes = self.nodes
+        while stack:
+            node_id = stack.pop()
+            if node_id < 0:
+                continue
+            split, axis, left, right = nodes[node_id]
+            worst = -best[0][0] if len(best) == n else max_d2
+            if axis < 0:
+                for point in split:
+                    px, py, pz = xyz[point]
+                    d2 = (px - tx) * (px - tx) + (py - ty) * (py - ty) + (pz - tz) * (pz - tz)
+                    if d2 < worst:
+                        if len(best) == n:
+                            heapq.heapreplace(best, (-d2, point))
+                        else:
+                            heapq.heappush(best, (-d2, point))
+                        worst = -best[0][0] if len(best) == n else max_d2
+                continue
+            diff = target[axis] - xyz[split][axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # the far side can only hold closer points if the split plane is
+            # nearer than the current worst candidate
+            if diff * diff < worst:
+                stack.append(far)
+            stack.append(near)
+        return sorted((_chord_to_km(math.sqrt(-d2)), self.keys[point]) for d2, point in best)
@@ -0,0 +1,124 @@
+import os
+import time
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+
+# One keep-alive session per worker, shared by every upstream client, so
+# repeated calls to the same API reuse pooled TCP/TLS connections.
+
+pool_connections = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+pool_maxsize = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+read_timeout = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+max_retries = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+backoff_factor = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.3'))
+
+
+class HttpClient(object):
+
+    def __init__(self, pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                 timeout=(connect_timeout, read_timeout), max_retries=max_retries,
+                 backoff_factor=backoff_factor):
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        # idempotent methods only: a retried POST could be applied twice upstream
+        retry = Retry(total=max_retries, connect=max_retries, read=max_retries,
+                      backoff_factor=backoff_factor, status_forcelist=(502, 503, 504),
+                      raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self._lock = threading.Lock()
+        self._host_stats = {}
+
+    def _record(self, host, key, value=1):
+        with self._lock:
+            stats = self._host_stats.setdefault(host, {
+                'requests': 0,
+                'errors': 0,
+                'in_flight': 0,
+                'peak_in_flight': 0,
+                'total_ms': 0.0
+            })
+            stats[key] += value
+            if key == 'in_flight':
+                stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+        self._record(host, 'in_flight')
+        start = time.perf_counter()
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record(host, 'errors')
+            raise
+        finally:
+            self._record(host, 'in_flight', -1)
+            self._record(host, 'requests')
+            self._record(host, 'total_ms', (time.perf_counter() - start) * 1000)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def pool_stats(self):
+        """Per-host request counters merged with urllib3 connection pool state."""
+        with self._lock:
+            result = {host: dict(stats) for host, stats in self._host_stats.items()}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else '{0}:{1}'.format(pool.host, pool.port)
+            stats = result.setdefault(host, {})
+            stats['connections_opened'] = pool.num_connections
+            # the pool queue is pre-filled with None placeholders for unopened slots
+            stats['idle_connections'] = sum(1 for conn in list(pool.pool.queue) if conn is not None) \
+                if pool.pool is not None else 0
+            stats['pool_maxsize'] = self.pool_maxsize
+        for stats in result.values():
+            if stats.get('requests'):
+                stats['avg_ms'] = round(stats['total_ms'] / stats['requests'], 2)
+                stats['total_ms'] = round(stats['total_ms'], 2)
+        return result
+
+
+class LineHttpClient(RequestsHttpClient):
+    """line-bot-sdk http client that sends through the shared pooled session.
+
+    LineBotApi instantiates the class itself, so pass the class, not an instance.
+    """
+
+    def __init__(self, timeout=RequestsHttpClient.DEFAULT_TIMEOUT, http=None):
+        super(LineHttpClient, self).__init__(timeout)
+        self.http = http or default_client
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        response = self.http.get(url, headers=headers, params=params, stream=stream,
+                                 timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        response = self.http.post(url, headers=headers, data=data, timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        response = self.http.delete(url, headers=headers, data=data, timeout=timeout or self.timeout)
+        return RequestsHttpResponse(response)
+
+
+default_client = HttpClient()
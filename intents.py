@@ -0,0 +1,54 @@
+import re
+
+# Text messages are lowercased once and matched against every registered
+# intent in a single compiled alternation. Alternatives are tried in
+# registration order, so the first intent registered that matches wins and
+# exactly one handler runs per message.
+
+
+class IntentClassifier(object):
+
+    def __init__(self):
+        self._intents = []
+        self._pattern = None
+
+    def add(self, name, pattern):
+        """Register func(event, *groups) for messages whose lowercased text matches pattern.
+
+        pattern is anchored at the start of the text; its capturing groups are
+        passed to func.
+        """
+        def decorator(func):
+            if any(intent[0] == name for intent in self._intents):
+                raise ValueError('intent {0!r} is already registered'.format(name))
+            self._intents.append((name, pattern, re.compile(pattern).groups, func))
+            self._compile()
+            return func
+        return decorator
+
+    def _compile(self):
+        parts = []
+        self._slots = {}
+        offset = 0
+        for name, pattern, groups, func in self._intents:
+            parts.append('(?P<{0}>{1})'.format(name, pattern))
+            # group numbers of this intent's own captures inside the alternation
+            self._slots[name] = (offset + 2, offset + 2 + groups, func)
+            offset += groups + 1
+        self._pattern = re.compile('|'.join(parts))
+
+    def classify(self, text):
+        """Return (intent name, groups, handler) for text, or None."""
+        m = self._pattern.match(text.lower())
+        if m is None:
+            return None
+        name = m.lastgroup
+        start, end, func = self._slots[name]
+        return name, tuple(m.group(index) for index in range(start, end)), func
+
+    def dispatch(self, event, text):
+        intent = self.classify(text)
+        if intent is None:
+            return None
+        name, groups, func = intent
+        return func(event, *groups)
@@ -3,35 +3,173 @@ import sys
 from datetime import datetime
 
 import googlemaps
-from flask import request
-from linebot.models import (
-    CarouselContainer, BubbleContainer
-)
-
-# gmaps_api_key = os.getenv('GMAPS_API_KEY', None)
-# if gmaps_api_key is None:
-#     print('Specify GMAPS_API_KEY as environment variable')
-#     sys.exit(1)
-#
-# gmaps = googlemaps.Client(key=gmaps_api_key)
+from http_client import default_client
+from flex import Template, Slot, Splice, Optional
+
+gmaps_api_key = os.getenv('GMAPS_API_KEY', None)
+if gmaps_api_key is None:
+    print('Specify GMAPS_API_KEY as environment variable')
 static_tmp_path = os.path.join(os.path.dirname(__file__), 'static', 'tmp')
 
 lang = 'en'
 
 
+gold_star = {
+    "type": "icon",
+    "size": "sm",
+    "url": "https://scdn.line-apps.com/n/channel_devcenter/img/fx/review_gold_star_28.png"
+}
+
+place_bubble = Template({
+    "type": "bubble",
+    "hero": {
+        "type": "image",
+        "url": Slot('photo_url'),
+        "size": "full",
+        "aspectRatio": "20:13",
+        "aspectMode": "cover"
+    },
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "box",
+                "layout": "baseline",
+                "spacing": "md",
+                "contents": [
+                    {
+                        "type": "icon",
+                        "url": Slot('icon')
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('name'),
+                        "weight": "bold",
+                        "size": "lg",
+                        "wrap": True
+                    }
+                ]
+            },
+            Splice('rating'),
+            {
+                "type": "box",
+                "layout": "baseline",
+                "spacing": "sm",
+                "contents": [
+                    {
+                        "type": "text",
+                        "text": "Place",
+                        "color": "#aaaaaa",
+                        "size": "sm",
+                        "flex": 1
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('address'),
+                        "wrap": True,
+                        "color": "#666666",
+                        "size": "sm",
+                        "flex": 5,
+                        "action": {
+                            "type": "uri",
+                            "uri": Slot('address_url')
+                        }
+                    }
+                ]
+            },
+            {
+                "type": "box",
+                "layout": "baseline",
+                "spacing": "sm",
+                "contents": [
+                    {
+                        "type": "text",
+                        "text": "Time",
+                        "color": "#aaaaaa",
+                        "size": "sm",
+                        "flex": 1
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('operating_hours'),
+                        "wrap": True,
+                        "color": "#666666",
+                        "size": "sm",
+                        "flex": 5
+                    }
+                ]
+            }
+        ]
+    },
+    "footer": Optional('footer')
+})
+
+place_rating = Template({
+    "type": "box",
+    "layout": "baseline",
+    "margin": "md",
+    "contents": [
+        Splice('stars'),
+        {
+            "type": "text",
+            "text": Slot('rating'),
+            "size": "sm",
+            "color": "#999999",
+            "margin": "md",
+            "flex": 0
+        }
+    ]
+})
+
+place_footer = Template({
+    "type": "box",
+    "layout": "vertical",
+    "contents": [
+        {
+            "type": "button",
+            "style": "link",
+            "height": "sm",
+            "action": {
+                "type": "uri",
+                "label": "Website",
+                "uri": Slot('website')
+            }
+        }
+    ]
+})
+
+
+def create_gmaps_client(http):
+    """googlemaps client that sends through the pooled session of http, an HttpClient.
+
+    googlemaps 2.5 has no requests_session argument, so the session it creates is replaced.
+    """
+    if gmaps_api_key is None:
+        return None
+    client = googlemaps.Client(key=gmaps_api_key)
+    client.session = http.session
+    return client
+
+
 class Places:
 
-    def get_photos(self, photo_ref, id):
+    def __init__(self, http=None):
+        self.http = http or default_client
+        self.gmaps = create_gmaps_client(self.http)
+
+    def get_photos(self, photo_ref, id, host_url):
+        # host_url: the bot's public base URL, photos are served from its static/tmp
         ext = 'jpg'
         file_name = static_tmp_path + '/' + id + '.' + ext
         if os.path.isfile(file_name):
-            return request.host_url.replace('http:', 'https:') + os.path.join('static', 'tmp', os.path.basename(file_name))
+            return host_url.replace('http:', 'https:') + os.path.join('static', 'tmp', os.path.basename(file_name))
         with open(file_name, 'wb') as f:
-            for chunk in gmaps.places_photo(photo_ref, max_width=640):
+            for chunk in self.gmaps.places_photo(photo_ref, max_width=640):
                 if chunk:
                     f.write(chunk)
         dist_name = os.path.basename(file_name)
-        photo_url = request.host_url.replace('http:', 'https:') + os.path.join('static', 'tmp', dist_name)
+        photo_url = host_url.replace('http:', 'https:') + os.path.join('static', 'tmp', dist_name)
         return photo_url
 
     def _format_operating_hours(self, operating_hours):
@@ -51,7 +189,7 @@ class Places:
 
     def get_place_detail(self, place_id):
         data = dict()
-        place_detail_result = gmaps.place(place_id, language=lang)['result']
+        place_detail_result = self.gmaps.place(place_id, language=lang)['result']
         data['address'] = place_detail_result['formatted_address']
         data['address_url'] = place_detail_result['url']
         if 'opening_hours' in place_detail_result:
@@ -71,13 +209,13 @@ class Places:
             data['website'] = None
         return data
 
-    def get_nearby_places(self, lat, lng, type=None):
+    def get_nearby_places(self, lat, lng, type=None, host_url=None):
         location = (lat, lng)
         places = []
         if type is not None:
-            nearby_result = gmaps.places_nearby(location=location, radius=100, language=lang, type=type)
+            nearby_result = self.gmaps.places_nearby(location=location, radius=100, language=lang, type=type)
         else:
-            nearby_result = gmaps.places_nearby(location=location, radius=100, language=lang)
+            nearby_result = self.gmaps.places_nearby(location=location, radius=100, language=lang)
         if nearby_result['status'] != 'OK':
             return "I Couldn't Find Any Places From Your Search. So Sorry.."
         for index in range(len(nearby_result["results"])):
@@ -87,147 +225,32 @@ class Places:
             data = self.get_place_detail(result['place_id'])
             if 'photos' in result:
                 photo_ref = result['photos'][0]['photo_reference']
-                data['photo_url'] = self.get_photos(photo_ref, result['id'])
+                data['photo_url'] = self.get_photos(photo_ref, result['id'], host_url)
             else:
                 data['photo_url'] = 'https://s.yimg.com/pw/images/en-us/photo_unavailable.png'
             places.append(data)
         return self.create_place_flex_message(places)
 
     def create_place_flex_message(self, places):
-        carousel = CarouselContainer()
+        carousel = {
+            "type": "carousel",
+            "contents": []
+        }
         for place in places:
-            bubble = {
-                "type": "bubble",
-                "hero": {
-                    "type": "image",
-                    "url": place['photo_url'],
-                    "size": "full",
-                    "aspectRatio": "20:13",
-                    "aspectMode": "cover"
-                },
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "box",
-                            "layout": "baseline",
-                            "spacing": "md",
-                            "contents": [
-                                {
-                                    "type": "icon",
-                                    "url": place['icon']
-                                },
-                                {
-                                    "type": "text",
-                                    "text": place['name'],
-                                    "weight": "bold",
-                                    "size": "lg",
-                                    "wrap": True
-                                }
-                            ]
-                        }
-                    ]
-                }
-            }
-            bubble_body_contents = bubble['body']['contents']
+            rating = []
             if place['rating'] is not None:
-                bubble_body_contents.append(
-                    {
-                        "type": "box",
-                        "layout": "baseline",
-                        "margin": "md",
-                        "contents": []
-                    }
-                )
-                bubble_body_rating_contents = bubble['body']['contents'][1]["contents"]
-                for star_rating in range(0, place['rating']):
-                    bubble_body_rating_contents.append(
-                        {
-                            "type": "icon",
-                            "size": "sm",
-                            "url": "https://scdn.line-apps.com/n/channel_devcenter/img/fx/review_gold_star_28.png"
-                        }
-                    )
-                bubble_body_rating_contents.append(
-                    {
-                        "type": "text",
-                        "text": str(place["rating"]),
-                        "size": "sm",
-                        "color": "#999999",
-                        "margin": "md",
-                        "flex": 0
-                    }
-                )
-            bubble_body_contents.append(
-                {
-                    "type": "box",
-                    "layout": "baseline",
-                    "spacing": "sm",
-                    "contents": [
-                        {
-                            "type": "text",
-                            "text": "Place",
-                            "color": "#aaaaaa",
-                            "size": "sm",
-                            "flex": 1
-                        },
-                        {
-                            "type": "text",
-                            "text": place["address"],
-                            "wrap": True,
-                            "color": "#666666",
-                            "size": "sm",
-                            "flex": 5,
-                            "action": {
-                                "type": "uri",
-                                "uri": place["address_url"]
-                            }
-                        }
-                    ]
-                }
-            )
-            bubble_body_contents.append(
-                {
-                    "type": "box",
-                    "layout": "baseline",
-                    "spacing": "sm",
-                    "contents": [
-                        {
-                            "type": "text",
-                            "text": "Time",
-                            "color": "#aaaaaa",
-                            "size": "sm",
-                            "flex": 1
-                        },
-                        {
-                            "type": "text",
-                            "text": place["operating_hours"],
-                            "wrap": True,
-                            "color": "#666666",
-                            "size": "sm",
-                            "flex": 5
-                        }
-                    ]
-                }
-            )
+                rating.append(place_rating(stars=[gold_star] * place['rating'], rating=str(place["rating"])))
+            footer = None
             if place["website"] is not None:
-                bubble["footer"] = {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "button",
-                            "style": "link",
-                            "height": "sm",
-                            "action": {
-                                "type": "uri",
-                                "label": "Website",
-                                "uri": place["website"]
-                            }
-                        }
-                    ]
-                }
-            bubble_container = BubbleContainer.new_from_json_dict(bubble)
-            carousel.contents.append(bubble_container)
-        return carousel
\ No newline at end of file
+                footer = place_footer(website=place["website"])
+            carousel['contents'].append(place_bubble(
+                photo_url=place['photo_url'],
+                icon=place['icon'],
+                name=place['name'],
+                rating=rating,
+                address=place["address"],
+                address_url=place["address_url"],
+                operating_hours=place["operating_hours"],
+                footer=footer
+            ))
+        return carousel
@@ -0,0 +1,77 @@
+from functools import lru_cache
+
+# Postback data comes in two shapes:
+#   action?key=value&key=value    e.g. weather_hourly?lat=13.7&lng=100.5
+#   action=value                  e.g. airport=BKK
+# Each postback is parsed once and routed by its action name, so a payload can
+# only ever reach the one handler registered for that exact action.
+
+
+def parse_postback(data):
+    """Split postback data into (action, params); a bare action=value gives params {None: value}."""
+    action, sep, query = data.partition('?')
+    if sep:
+        params = {}
+        for pair in query.split('&'):
+            if pair:
+                key, _, value = pair.partition('=')
+                params[key] = value
+        return action, params
+    action, sep, value = data.partition('=')
+    return action, {None: value} if sep else {}
+
+
+class PostbackRouter(object):
+
+    def __init__(self, cache_size=1024):
+        self._routes = {}
+        # buttons send the same few payloads over and over, so resolutions are memoized
+        self._resolve_cached = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def add(self, action, **params):
+        """Register func(event, **params) for action; params maps each name to its type.
+
+        A bare action=value payload is passed as the first declared param.
+        """
+        def decorator(func):
+            if action in self._routes:
+                raise ValueError('postback action {0!r} is already routed to {1}'.format(
+                    action, self._routes[action][0].__name__))
+            self._routes[action] = (func, tuple(params.items()))
+            self._resolve_cached.cache_clear()
+            return func
+        return decorator
+
+    def actions(self):
+        return sorted(self._routes)
+
+    def resolve(self, data):
+        """Return (func, kwargs) for postback data, or None when it has no valid route.
+
+        The kwargs dict is shared between calls with the same data; do not modify it.
+        """
+        return self._resolve_cached(data)
+
+    def _resolve(self, data):
+        action, raw_params = parse_postback(data)
+        route = self._routes.get(action)
+        if route is None:
+            return None
+        func, params = route
+        if None in raw_params and params:
+            raw_params = {params[0][0]: raw_params[None]}
+        kwargs = {}
+        try:
+            for name, convert in params:
+                kwargs[name] = convert(raw_params[name])
+        except (KeyError, ValueError):
+            return None
+        return func, kwargs
+
+    def dispatch(self, event, data):
+        resolved = self.resolve(data)
+        if resolved is None:
+            print('====== NO ROUTE FOR POSTBACK: {0} ======'.format(data))
+            return None
+        func, kwargs = resolved
+        return func(event, **kwargs)
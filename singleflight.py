@@ -0,0 +1,102 @@
+import os
+import asyncio
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent identical calls into one.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and get the same result or exception. Followers give
+    up with TimeoutError after timeout seconds; the leader keeps running.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                call.result = func(*args, **kwargs)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError('waited more than {0}s for in-flight call {1}'.format(self.timeout, key))
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'upstream_calls': self.calls,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts
+            }
+
+
+class AsyncSingleFlight(object):
+    """SingleFlight for coroutines running on one event loop."""
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        future = self._calls.get(key)
+        if future is None:
+            self.calls += 1
+            future = self._calls[key] = asyncio.ensure_future(func(*args, **kwargs))
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        try:
+            # shield so a caller timing out does not cancel the call for the others
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError('waited more than {0}s for in-flight call {1}'.format(self.timeout, key))
+
+    def stats(self):
+        return {
+            'in_flight': len(self._calls),
+            'upstream_calls': self.calls,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts
+        }
+
+
+# shared by the upstream clients; keys are prefixed with the kind of call
+upstream_calls = SingleFlight(timeout=float(os.getenv('SINGLEFLIGHT_TIMEOUT_SECONDS', '15')))
+async_upstream_calls = AsyncSingleFlight(timeout=upstream_calls.timeout)
@@ -0,0 +1,75 @@
+import os
+import json
+import math
+import shutil
+import tempfile
+import unittest
+
+from airport_db import AirportDatabase, compile_airports, header_struct, source_path, VERSION
+
+
+class AirportDatabaseTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(source_path) as ap:
+            cls.airports = list(json.load(ap).values())
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'airports.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertRecordMatches(self, record, data):
+        for field in ('name', 'city', 'country', 'iata', 'icao', 'dst'):
+            self.assertEqual(record[field], data[field], field)
+        self.assertEqual(record['latitude'], float(data['latitude']))
+        self.assertEqual(record['longitude'], float(data['longitude']))
+        self.assertEqual(record['altitude'], int(data['altitude']))
+        try:
+            self.assertAlmostEqual(record['timezone'], float(data['timezone']), places=5)
+        except ValueError:
+            self.assertTrue(math.isnan(record['timezone']))
+
+    def test_round_trip(self):
+        db = AirportDatabase(compile_airports(source_path, self.path))
+        self.assertEqual(sum(1 for _ in db.records()), len(self.airports))
+        for data in self.airports[::97]:
+            if data['iata']:
+                self.assertRecordMatches(db[data['iata']], data)
+                self.assertRecordMatches(db[data['iata'].lower()], data)
+            if data['icao']:
+                self.assertEqual(db[data['icao']]['name'], data['name'])
+        self.assertEqual(db['BKK']['icao'], 'VTBS')
+        self.assertEqual(db['VTBS']['iata'], 'BKK')
+
+    def test_missing_codes(self):
+        db = AirportDatabase(compile_airports(source_path, self.path))
+        for code in ('ZZZ', 'QQQQ', '', 'TOOLONG', 'ÅÅÅ'):
+            self.assertNotIn(code, db)
+            self.assertIsNone(db.get(code))
+            with self.assertRaises(KeyError):
+                db[code]
+
+    def test_other_version_is_rebuilt(self):
+        compile_airports(source_path, self.path)
+        with open(self.path, 'r+b') as f:
+            header = bytearray(f.read(header_struct.size))
+            header[4:6] = (VERSION + 1).to_bytes(2, 'little')
+            f.seek(0)
+            f.write(header)
+        with self.assertRaises(ValueError):
+            AirportDatabase(self.path)
+        db = AirportDatabase.open(self.path, source_path)
+        self.assertEqual(db['BKK']['name'], 'Suvarnabhumi Airport')
+
+    def test_truncated_file_is_rebuilt(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'APDB')
+        self.assertEqual(AirportDatabase.open(self.path, source_path)['NRT']['iata'], 'NRT')
+
+
+if __name__ == '__main__':
+    unittest.main()
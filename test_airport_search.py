@@ -0,0 +1,40 @@
+import unittest
+
+from airport_db import AirportDatabase
+from airport_search import AirportSearchIndex, normalize_text
+
+
+class AirportSearchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.index = AirportSearchIndex(AirportDatabase.open().records())
+
+    def codes(self, query, limit=3):
+        return [airport['iata'] for airport in self.index.search(query, limit)]
+
+    def test_codes(self):
+        self.assertEqual(self.codes('bkk', 1), ['BKK'])
+        self.assertEqual(self.codes('VTBS', 1), ['BKK'])
+
+    def test_words_prefixes_and_typos(self):
+        self.assertIn('BKK', self.codes('suvarn'))
+        self.assertIn('BKK', self.codes('suvarnabumi'))
+        self.assertEqual(self.codes('londn heathrow', 1), ['LHR'])
+        self.assertEqual(self.codes('charles de gaulle', 1), ['CDG'])
+        self.assertEqual(sorted(self.codes('tokyo', 2)), ['HND', 'NRT'])
+
+    def test_short_queries_are_left_to_the_remote_search(self):
+        for query in ['a', 'in', '1', 'lo', '', '  ']:
+            self.assertEqual(self.index.search(query), [], query)
+
+    def test_broad_word_is_bounded(self):
+        self.assertEqual(len(self.index.search('airport')), 10)
+        self.assertIn('BKK', self.codes('bangkok airport'))
+
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text('São Paulo–Guarulhos'), 'sao paulo guarulhos')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import time
+import unittest
+
+from aqi import StationCatalogue
+
+# Bangkok stations, about 1km and 5km apart
+din_daeng = (13.7650, 100.5530)
+pathum_wan = (13.7460, 100.5340)
+bang_na = (13.6680, 100.6050)
+
+
+class StationCatalogueTest(unittest.TestCase):
+
+    def wait_for_rebuild(self, catalogue):
+        for _ in range(500):
+            with catalogue._lock:
+                if not catalogue._rebuilding and not catalogue._pending:
+                    return
+            time.sleep(0.01)
+        self.fail('index was not rebuilt')
+
+    def test_nearest_scans_the_pending_list(self):
+        catalogue = StationCatalogue(rebuild_after=100)
+        catalogue.add('din_daeng', *din_daeng)
+        catalogue.add('bang_na', *bang_na)
+        self.assertEqual(len(catalogue._index), 0)
+        self.assertEqual(catalogue.nearest(13.7640, 100.5520, 3), 'din_daeng')
+        self.assertEqual(catalogue.nearest('13.6690', '100.6040', 3), 'bang_na')
+
+    def test_max_km_cutoff(self):
+        catalogue = StationCatalogue(rebuild_after=1)
+        catalogue.add('din_daeng', *din_daeng)
+        self.wait_for_rebuild(catalogue)
+        catalogue.add('bang_na', *bang_na)
+        # Chiang Mai is far from both, whether indexed or pending
+        self.assertIsNone(catalogue.nearest(18.79, 98.98, 3))
+        self.assertEqual(catalogue.nearest(18.79, 98.98, 1000), 'din_daeng')
+
+    def test_batched_rebuild(self):
+        catalogue = StationCatalogue(rebuild_after=2)
+        catalogue.add('din_daeng', *din_daeng)
+        self.assertEqual((len(catalogue._index), len(catalogue._pending)), (0, 1))
+        catalogue.add('bang_na', *bang_na)
+        self.wait_for_rebuild(catalogue)
+        self.assertEqual(len(catalogue._index), 2)
+        # a closer station that is still pending beats the indexed one
+        catalogue.add('pathum_wan', *pathum_wan)
+        self.assertEqual(len(catalogue._pending), 1)
+        self.assertEqual(catalogue.nearest(13.7470, 100.5350, 3), 'pathum_wan')
+        self.assertEqual(catalogue.nearest(13.7640, 100.5520, 3), 'din_daeng')
+
+    def test_known_station_is_not_queued_again(self):
+        catalogue = StationCatalogue(rebuild_after=100)
+        catalogue.add('din_daeng', *din_daeng)
+        catalogue._pending.clear()
+        catalogue.add('din_daeng', *din_daeng)
+        self.assertEqual(catalogue._pending, {})
+        catalogue.add('din_daeng', 13.7700, 100.5600)
+        self.assertEqual(catalogue._pending, {'din_daeng': [13.77, 100.56]})
+
+    def test_add_from_payload(self):
+        catalogue = StationCatalogue()
+        catalogue.add_from_payload({'_id': 'geojson', 'location': {'type': 'Point', 'coordinates': [100.5530, 13.7650]}})
+        catalogue.add_from_payload({'id': 'flat', 'latitude': 13.6680, 'longitude': 100.6050})
+        catalogue.add_from_payload({'_id': 'nowhere'})
+        self.assertEqual(len(catalogue), 2)
+        self.assertEqual(catalogue.nearest(*din_daeng, max_km=1), 'geojson')
+        self.assertEqual(catalogue.nearest(*bang_na, max_km=1), 'flat')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from aqi_levels import (
+    upper_bounds, level_names, airvisual_styles, waqi_styles, waqi_details, unknown_waqi_detail,
+    level_index, style_for, styles_for
+)
+
+
+class AqiLevelsTest(unittest.TestCase):
+
+    def test_tables_line_up(self):
+        self.assertEqual(len(level_names), len(upper_bounds) + 1)
+        for table in (airvisual_styles, waqi_styles, waqi_details):
+            self.assertEqual(len(table), len(level_names))
+        for index, name in enumerate(level_names):
+            self.assertEqual(airvisual_styles[index].text, name)
+            self.assertEqual(waqi_styles[index].text, name)
+            self.assertEqual(waqi_details[index].level_text, name)
+
+    def test_category_bounds(self):
+        for aqi, name in [(0, 'Good'), (50, 'Good'), (50.5, 'Moderate'), (100, 'Moderate'),
+                          (101, 'Unhealthy for Sensitive Groups'), (150, 'Unhealthy for Sensitive Groups'),
+                          (200, 'Unhealthy'), (300, 'Very Unhealthy'), (301, 'Hazardous'), (999, 'Hazardous')]:
+            self.assertEqual(level_names[level_index(aqi)], name, aqi)
+            self.assertEqual(style_for(airvisual_styles, aqi).text, name, aqi)
+
+    def test_negative_reading(self):
+        self.assertIsNone(level_index(-1))
+        self.assertIsNone(style_for(airvisual_styles, -1))
+        self.assertIs(style_for(waqi_details, -1, unknown_waqi_detail), unknown_waqi_detail)
+
+    def test_series(self):
+        series = [1 + (index * 37) % 420 for index in range(48)]
+        self.assertEqual(styles_for(waqi_styles, series), [style_for(waqi_styles, aqi) for aqi in series])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cache import TTLCache, RenderCache
+
+
+class TTLCacheTest(unittest.TestCase):
+
+    def test_expiry_and_lru(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=-1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        cache.set('c', 3)
+        cache.set('d', 4)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('d'), 4)
+
+    def test_get_or_refresh_serves_stale_while_refreshing(self):
+        cache = TTLCache(ttl=60, stale_ttl=60)
+        refreshed = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            refreshed.set()
+            return len(calls)
+
+        self.assertEqual(cache.get_or_refresh('k', loader), 1)
+        self.assertEqual(cache.get_or_refresh('k', loader), 1)
+        cache.set('k', 1, ttl=-1)
+        self.assertEqual(cache.get_or_refresh('k', loader), 1)
+        self.assertTrue(refreshed.wait(5))
+        for _ in range(100):
+            if cache.stats()['refreshes']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get_or_refresh('k', loader), 2)
+        stats = cache.stats()
+        self.assertEqual((stats['misses'], stats['stale_hits'], stats['refreshes']), (1, 1, 1))
+
+    def test_prefetch_loads_once_in_the_background(self):
+        cache = TTLCache(ttl=60)
+        release = threading.Event()
+
+        def loader():
+            release.wait(5)
+            return 'tomorrow'
+
+        self.assertTrue(cache.prefetch('k', loader))
+        self.assertFalse(cache.prefetch('k', loader))
+        self.assertIsNone(cache.get('k'))
+        release.set()
+        for _ in range(100):
+            if cache.stats()['refreshes']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get('k'), 'tomorrow')
+        self.assertFalse(cache.prefetch('k', loader))
+        self.assertEqual(cache.stats()['prefetches'], 1)
+
+    def test_ttl_function_and_none_values(self):
+        cache = TTLCache(ttl=60)
+        self.assertIsNone(cache.get_or_refresh('none', lambda: None))
+        self.assertEqual(len(cache), 0)
+        cache.get_or_refresh('short', lambda: 'x', ttl=lambda value: -1)
+        self.assertIsNone(cache.get('short'))
+
+
+class PersistTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_saves_merge_entries_of_other_processes(self):
+        first = TTLCache(ttl=60, persist_path=self.path, persist_interval=3600)
+        second = TTLCache(ttl=60, persist_path=self.path, persist_interval=3600)
+        first._last_saved = second._last_saved = time.time()
+        first.set('a', 1)
+        second.set('b', 2)
+        second.set('a', 0, ttl=30)
+        first.save()
+        second.save()
+        with open(self.path) as f:
+            saved = {key: value for key, expires_at, value in json.load(f)}
+        # 'a' keeps the later expiry
+        self.assertEqual(saved, {'a': 1, 'b': 2})
+        loaded = TTLCache(ttl=60, persist_path=self.path)
+        self.assertEqual((loaded.get('a'), loaded.get('b')), (1, 2))
+
+
+class RenderCacheTest(unittest.TestCase):
+
+    def test_renders_once_per_version(self):
+        cache = RenderCache(maxsize=10)
+        calls = []
+
+        def render():
+            calls.append(1)
+            return {'type': 'bubble', 'n': len(calls)}
+
+        self.assertEqual(cache.get_or_render('aqi', 1, 'v1', render)['n'], 1)
+        self.assertEqual(cache.get_or_render('aqi', 1, 'v1', render)['n'], 1)
+        self.assertEqual(cache.get_or_render('aqi', 1, 'v2', render)['n'], 2)
+        self.assertEqual(cache.get_or_render('aqi', 1, None, render)['n'], 3)
+        self.assertEqual(cache.get_or_render('aqi', 1, None, render)['n'], 4)
+
+    def test_byte_budget(self):
+        cache = RenderCache(maxsize=10, max_bytes=100)
+        cache.get_or_render('k', 1, 'v', lambda: {'text': 'x' * 60})
+        cache.get_or_render('k', 2, 'v', lambda: {'text': 'y' * 60})
+        self.assertEqual(len(cache), 1)
+        cache.get_or_render('k', 3, 'v', lambda: {'text': 'z' * 200})
+        self.assertEqual(len(cache), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
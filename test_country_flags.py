@@ -0,0 +1,45 @@
+import unittest
+
+from country_flags import flags_by_code, get_country_flag, normalize_country_name
+
+
+class CountryFlagTest(unittest.TestCase):
+
+    def assertFlag(self, name, code):
+        self.assertEqual(get_country_flag(name), flags_by_code[code], name)
+
+    def test_exact_names_win_over_longer_ones(self):
+        # a substring scan resolved these to whichever longer name came first
+        self.assertFlag('Niger', 'NE')
+        self.assertFlag('Nigeria', 'NG')
+        self.assertFlag('Guinea', 'GN')
+        self.assertFlag('Guinea-Bissau', 'GW')
+        self.assertFlag('Equatorial Guinea', 'GQ')
+        self.assertFlag('Papua New Guinea', 'PG')
+
+    def test_aliases(self):
+        self.assertFlag('Congo (Kinshasa)', 'CD')
+        self.assertFlag('Congo (Brazzaville)', 'CG')
+        self.assertFlag("Cote d'Ivoire", 'CI')
+        self.assertFlag('Ireland', 'IE')
+
+    def test_iso_codes(self):
+        self.assertFlag('TH', 'TH')
+        self.assertFlag('gb', 'GB')
+        self.assertFlag(' jp ', 'JP')
+
+    def test_fuzzy_match(self):
+        self.assertFlag('thailand', 'TH')
+        self.assertFlag('Thailnd', 'TH')
+
+    def test_miss(self):
+        self.assertIsNone(get_country_flag('Atlantis'))
+        self.assertIsNone(get_country_flag(''))
+        self.assertIsNone(get_country_flag(None))
+
+    def test_normalize_country_name(self):
+        self.assertEqual(normalize_country_name("Côte d’Ivoire"), 'cote divoire')
+
+
+if __name__ == '__main__':
+    unittest.main()
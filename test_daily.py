@@ -0,0 +1,44 @@
+import unittest
+
+from daily import DailyAggregate, aggregate_daily
+
+
+class AggregateDailyTest(unittest.TestCase):
+
+    def test_one_row_per_date_in_order(self):
+        points = [('2019-01-02', 30, 40), ('2019-01-01', 10, 20), ('2019-01-02', 20, 50), ('2019-01-01', 5, 15)]
+        self.assertEqual(aggregate_daily(points), [
+            DailyAggregate('2019-01-02', 20, 50, 35.0, 2),
+            DailyAggregate('2019-01-01', 5, 20, 12.5, 2)
+        ])
+
+    def test_matches_rescan(self):
+        def rescan(points):
+            # what Weather._normalize_aqi_forecast_data did
+            aqi_forecast = []
+            for date_str, low, high in points:
+                if not any(d['date'] == date_str for d in aqi_forecast):
+                    aqi_forecast.append({'date': date_str, 'min': low, 'max': high})
+                else:
+                    for d in aqi_forecast:
+                        if d['date'] == date_str and low < d['min']:
+                            d['min'] = low
+                        if d['date'] == date_str and high > d['max']:
+                            d['max'] = high
+            return aqi_forecast
+
+        points = [('2019-01-{0:02d}'.format(1 + hour // 24), (hour * 7) % 180, (hour * 7) % 180 + 40)
+                  for hour in range(7 * 24)]
+        rows = aggregate_daily(points)
+        self.assertEqual([(row.date, row.min, row.max) for row in rows],
+                         [(d['date'], d['min'], d['max']) for d in rescan(points)])
+        self.assertTrue(all(row.count == 24 for row in rows))
+
+    def test_generator_and_empty_input(self):
+        self.assertEqual(aggregate_daily(iter([])), [])
+        self.assertEqual(aggregate_daily(point for point in [('d', 10, 20), ('d', 30, 50)]),
+                         [DailyAggregate('d', 10, 50, 27.5, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import unittest
+
+from linebot.models import CarouselContainer, QuickReply, QuickReplyButton, MessageAction
+
+from flex import Template, Slot, Splice, Optional, FlexMessage
+
+board = Template({
+    "type": "bubble",
+    "styles": {"header": {"backgroundColor": "#FFF800"}},
+    "header": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "text", "text": "DEPARTURES", "size": "xl", "weight": "bold"},
+            {"type": "text", "text": Slot('title'), "size": "xs", "wrap": True}
+        ]
+    },
+    "hero": Optional('hero'),
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {"type": "separator"},
+            Splice('rows'),
+            {"type": "separator"}
+        ]
+    }
+})
+row = Template({
+    "type": "box",
+    "layout": "horizontal",
+    "contents": [
+        {"type": "text", "text": Slot('flight_no'), "action": {"type": "postback", "data": Slot('data')}}
+    ]
+})
+
+
+def board_rows(count):
+    return [row(flight_no='TG{0}'.format(600 + i), data='flight_info=TG{0}'.format(600 + i)) for i in range(count)]
+
+
+class TemplateTest(unittest.TestCase):
+
+    def test_render(self):
+        bubble = board(title='Suvarnabhumi (BKK)', hero=None, rows=board_rows(2))
+        self.assertEqual(board.slots, {'title', 'hero', 'rows'})
+        self.assertEqual(bubble['header']['contents'][1]['text'], 'Suvarnabhumi (BKK)')
+        self.assertNotIn('hero', bubble)
+        self.assertEqual([item['type'] for item in bubble['body']['contents']], ['separator', 'box', 'box', 'separator'])
+        self.assertEqual(bubble['body']['contents'][2]['contents'][0]['action']['data'], 'flight_info=TG601')
+
+    def test_optional_value_is_kept(self):
+        hero = {"type": "image", "url": "https://example.com/a.jpg"}
+        self.assertIs(board(title='x', hero=hero, rows=[])['hero'], hero)
+
+    def test_static_subtrees_are_shared(self):
+        first = board(title='a', hero=None, rows=[])
+        second = board(title='b', hero=None, rows=[])
+        self.assertIs(first['styles'], second['styles'])
+        self.assertIs(first['header']['contents'][0], second['header']['contents'][0])
+        self.assertIsNot(first['header'], second['header'])
+
+    def test_missing_slot(self):
+        with self.assertRaises(KeyError):
+            board(title='x', rows=[])
+
+    def test_splice_outside_a_list(self):
+        with self.assertRaises(ValueError):
+            Template({"type": "box", "contents": Splice('rows')})
+
+    def test_same_json_as_linebot_models(self):
+        bubble = board(title='Suvarnabhumi (BKK)', hero=None, rows=board_rows(14))
+        carousel = {'type': 'carousel', 'contents': [bubble]}
+        via_models = CarouselContainer.new_from_json_dict(json.loads(json.dumps(carousel))).as_json_dict()
+        self.assertEqual(json.dumps(via_models, sort_keys=True), json.dumps(carousel, sort_keys=True))
+
+
+class FlexMessageTest(unittest.TestCase):
+
+    def test_as_json_dict(self):
+        contents = {'type': 'carousel', 'contents': []}
+        self.assertEqual(FlexMessage(alt_text='Airport', contents=contents).as_json_dict(),
+                         {'type': 'flex', 'altText': 'Airport', 'contents': contents})
+
+    def test_quick_reply(self):
+        quick_reply = QuickReply(items=[QuickReplyButton(action=MessageAction(label='AQI', text='aqi'))])
+        data = FlexMessage(alt_text='x', contents={}, quick_reply=quick_reply).as_json_dict()
+        self.assertEqual(data['quickReply'], quick_reply.as_json_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import time
+import datetime
+import unittest
+
+import flight_api
+from flight_api import FlightApi, route_cache
+
+# 2019-01-01T00:00:00Z
+new_year = 1546300800
+
+
+class RouteCacheEntryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = FlightApi()
+        self.window = flight_api.route_prefetch_window
+        flight_api.route_prefetch_window = 1800
+
+    def tearDown(self):
+        flight_api.route_prefetch_window = self.window
+
+    def test_positive_offset(self):
+        # 07:00 on Jan 1 in Bangkok (UTC+7); midnight there is 17:00Z
+        key, local_date, next_midnight = self.api._route_cache_entry('BKK', 'NRT', new_year)
+        self.assertEqual((key, local_date), ('BKK-NRT:2019-01-01', datetime.date(2019, 1, 1)))
+        self.assertEqual(next_midnight, new_year + 17 * 3600)
+
+    def test_negative_offset(self):
+        # still 19:00 on Dec 31 in New York (UTC-5)
+        key, local_date, next_midnight = self.api._route_cache_entry('JFK', 'LHR', new_year)
+        self.assertEqual((key, local_date), ('JFK-LHR:2018-12-31', datetime.date(2018, 12, 31)))
+        self.assertEqual(next_midnight, new_year + 5 * 3600)
+
+    def test_half_hour_offset(self):
+        key, local_date, next_midnight = self.api._route_cache_entry('DEL', 'BKK', new_year - 6 * 3600)
+        self.assertEqual(local_date, datetime.date(2018, 12, 31))
+        self.assertEqual(next_midnight, new_year - 5.5 * 3600)
+
+    def test_unknown_offset_falls_back_to_utc(self):
+        for origin in ('YAH', 'ZZZ'):
+            key, local_date, next_midnight = self.api._route_cache_entry(origin, 'BKK', new_year - 1)
+            self.assertEqual((local_date, next_midnight), (datetime.date(2018, 12, 31), new_year), origin)
+
+    def test_no_prefetch_outside_the_window(self):
+        entry, prefetch = self.api._route_prefetch_plan('BKK', 'NRT', new_year)
+        self.assertEqual(entry[:2], ('BKK-NRT:2019-01-01', datetime.date(2019, 1, 1)))
+        self.assertIsNone(prefetch)
+
+    def test_prefetch_just_before_local_midnight(self):
+        midnight = new_year + 17 * 3600
+        entry, prefetch = self.api._route_prefetch_plan('BKK', 'NRT', midnight - 60)
+        self.assertEqual(entry[:2], ('BKK-NRT:2019-01-01', datetime.date(2019, 1, 1)))
+        self.assertEqual(prefetch[:2], ('BKK-NRT:2019-01-02', datetime.date(2019, 1, 2)))
+        # the serving key changes exactly at midnight
+        entry, prefetch = self.api._route_prefetch_plan('BKK', 'NRT', midnight)
+        self.assertEqual(entry[0], 'BKK-NRT:2019-01-02')
+        self.assertIsNone(prefetch)
+
+    def test_ttl(self):
+        now = time.time()
+        self.assertEqual(self.api._route_ttl(now - 10)(None), 0)
+        self.assertEqual(self.api._route_ttl(now + 10 * route_cache.ttl)(None), route_cache.ttl)
+        self.assertAlmostEqual(self.api._route_ttl(now + 600)(None), 600, delta=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
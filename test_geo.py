@@ -0,0 +1,54 @@
+import random
+import unittest
+
+from geo import GeoIndex, haversine_km, snap_to_grid, parse_latlng
+
+
+class GeoIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(1)
+        self.points = [(index, rng.uniform(-89, 89), rng.uniform(-180, 180)) for index in range(2000)]
+        self.index = GeoIndex(self.points)
+
+    def brute_force(self, lat, lng, n=5, max_km=None):
+        found = sorted((haversine_km(lat, lng, p_lat, p_lng), key) for key, p_lat, p_lng in self.points)
+        return [(d, key) for d, key in found if max_km is None or d <= max_km][:n]
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(2)
+        for lat, lng in [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(200)]:
+            self.assertEqual([key for d, key in self.index.nearest(lat, lng)],
+                             [key for d, key in self.brute_force(lat, lng)], (lat, lng))
+
+    def test_antimeridian_and_poles(self):
+        index = GeoIndex([('east', 0.0, 179.9), ('west', 0.0, -179.9), ('far', 0.0, 170.0), ('pole', 89.99, 0.0)])
+        self.assertEqual([key for d, key in index.nearest(0.0, -179.99, 2)], ['west', 'east'])
+        self.assertEqual(index.nearest(89.99, 180.0, 1)[0][1], 'pole')
+
+    def test_max_km(self):
+        for lat, lng in [(13.75, 100.5), (-33.9, 151.2), (51.5, -0.1)]:
+            found = self.index.nearest(lat, lng, 10, 500)
+            expected = self.brute_force(lat, lng, 10, 500)
+            self.assertEqual([key for d, key in found], [key for d, key in expected])
+            for (distance, key), (expected_distance, key) in zip(found, expected):
+                self.assertAlmostEqual(distance, expected_distance, places=6)
+        self.assertEqual(GeoIndex([('a', 0.0, 0.0)]).nearest(0.0, 1.0, 1, 100), [])
+
+    def test_skips_unknown_coordinates(self):
+        self.assertEqual(len(GeoIndex([('a', float('nan'), 0.0), ('b', 1.0, 1.0)])), 1)
+        self.assertEqual(GeoIndex([]).nearest(0.0, 0.0), [])
+
+    def test_snap_to_grid(self):
+        self.assertEqual(snap_to_grid(13.7563, 100.5018, 0.01), (13.76, 100.5))
+        self.assertEqual(snap_to_grid('13.7549', '100.4951', 0.01), (13.75, 100.5))
+
+    def test_parse_latlng(self):
+        self.assertEqual(parse_latlng('13.75', '100.5'), (13.75, 100.5))
+        for lat, lng in [(None, None), ('13.75', None), ('abc', '100.5'), ('91', '0'), ('0', '-180.5')]:
+            with self.assertRaises(ValueError):
+                parse_latlng(lat, lng)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from intents import IntentClassifier
+
+# the text intents app.py and asgi.py register, in registration order
+intents = [
+    ('aqi', r'aqi\Z'),
+    ('look_up', r'(?s:.*?)มองบน'),
+    ('lineqa', r'(?s:.*?)lineqa'),
+    ('weather_menu', r'(?:อากาศ|weather)\Z'),
+    ('weather_in', r'weather in (.*)'),
+    ('flight', r'flight (.*)'),
+    ('route', r'([a-z]{3}-[a-z]{3})$'),
+    ('airport', r'airport (.*)')
+]
+
+
+class IntentClassifierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.classifier = IntentClassifier()
+        for name, pattern in intents:
+            self.classifier.add(name, pattern)(lambda event, *groups: groups)
+
+    def test_classify(self):
+        # expected: the first branch of the old if-chain, i.e. the reply the user got
+        messages = {
+            'AQI': ('aqi', ()),
+            'มองบน': ('look_up', ()),
+            'so lineqa': ('lineqa', ()),
+            'Weather': ('weather_menu', ()),
+            'อากาศ': ('weather_menu', ()),
+            'weather in Tokyo': ('weather_in', ('tokyo',)),
+            'flight tg676': ('flight', ('tg676',)),
+            'BKK-NRT': ('route', ('bkk-nrt',)),
+            'airport narita': ('airport', ('narita',)),
+            'weather in lineqa': ('lineqa', ())
+        }
+        for text, expected in messages.items():
+            self.assertEqual(self.classifier.classify(text)[:2], expected, text)
+
+    def test_unmatched_text(self):
+        self.assertIsNone(self.classifier.classify('hello there, how are you today?'))
+        self.assertIsNone(self.classifier.classify('aqi please'))
+        self.assertIsNone(self.classifier.dispatch(None, 'BKK-NRTX'))
+
+    def test_dispatch_passes_groups(self):
+        self.assertEqual(self.classifier.dispatch(None, 'flight TG676'), ('tg676',))
+
+    def test_duplicate_intent_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.classifier.add('aqi', r'aqi')(lambda event: None)
+
+
+if __name__ == '__main__':
+    unittest.main()
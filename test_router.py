@@ -0,0 +1,57 @@
+import unittest
+
+from router import PostbackRouter, parse_postback
+
+# the postback actions app.py and asgi.py register
+routes = [
+    ('place_search', {'lat': float, 'lng': float, 'type': str}),
+    ('weather', {'place': str}),
+    ('weather_hourly', {'lat': float, 'lng': float}),
+    ('flight_info', {'flight_no': str}),
+    ('airport', {'code': str}),
+    ('aqi_today_forecast', {'station_id': str}),
+    ('aqi_daily_forecast', {'station_id': str})
+]
+
+
+class PostbackRouterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.router = PostbackRouter()
+        for action, params in routes:
+            self.router.add(action, **params)(lambda event, _action=action, **kwargs: (_action, kwargs))
+
+    def test_parse_postback(self):
+        self.assertEqual(parse_postback('weather_hourly?lat=13.75&lng=100.5'),
+                         ('weather_hourly', {'lat': '13.75', 'lng': '100.5'}))
+        self.assertEqual(parse_postback('airport=BKK'), ('airport', {None: 'BKK'}))
+        self.assertEqual(parse_postback('airport'), ('airport', {}))
+
+    def test_each_payload_reaches_only_its_own_route(self):
+        # the old substring chain also ran the airport branch for 'weather=heathrow airport'
+        payloads = {
+            'place_search?lat=13.75&lng=100.5&type=cafe': ('place_search', {'lat': 13.75, 'lng': 100.5, 'type': 'cafe'}),
+            'weather=tokyo': ('weather', {'place': 'tokyo'}),
+            'weather=heathrow airport': ('weather', {'place': 'heathrow airport'}),
+            'weather_hourly?lat=13.75&lng=100.5': ('weather_hourly', {'lat': 13.75, 'lng': 100.5}),
+            'flight_info=TG676': ('flight_info', {'flight_no': 'TG676'}),
+            'airport=BKK': ('airport', {'code': 'BKK'}),
+            'aqi_today_forecast?station_id=5a0d2b1a': ('aqi_today_forecast', {'station_id': '5a0d2b1a'}),
+            'aqi_daily_forecast?station_id=5a0d2b1a': ('aqi_daily_forecast', {'station_id': '5a0d2b1a'})
+        }
+        for data, expected in payloads.items():
+            self.assertEqual(self.router.dispatch(None, data), expected, data)
+
+    def test_duplicate_route_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.router.add('airport', code=str)(lambda event, code: code)
+
+    def test_invalid_payloads_have_no_route(self):
+        self.assertIsNone(self.router.resolve('aqi_daily?station_id=1'))
+        self.assertIsNone(self.router.resolve('weather_hourly?lat=x&lng=1'))
+        self.assertIsNone(self.router.resolve('weather_hourly?lat=1'))
+        self.assertIsNone(self.router.dispatch(None, 'unknown=1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
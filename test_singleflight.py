@@ -0,0 +1,137 @@
+import time
+import asyncio
+import threading
+import unittest
+
+from singleflight import SingleFlight, AsyncSingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def run_concurrently(self, flight, key, func, callers=5):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(flight.do(key, func))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return results, errors
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight(timeout=5)
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results, errors = self.run_concurrently(flight, 'k', slow)
+        self.assertEqual((results, errors, len(calls)), (['value'] * 5, [], 1))
+        stats = flight.stats()
+        self.assertEqual((stats['upstream_calls'], stats['coalesced'], stats['in_flight']), (1, 4, 0))
+
+    def test_leader_error_reaches_every_waiter_and_releases_the_key(self):
+        flight = SingleFlight(timeout=5)
+
+        def failing():
+            time.sleep(0.2)
+            raise ValueError('upstream down')
+
+        results, errors = self.run_concurrently(flight, 'k', failing)
+        self.assertEqual(results, [])
+        self.assertEqual([str(e) for e in errors], ['upstream down'] * 5)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+        self.assertEqual(flight.do('k', lambda: 'recovered'), 'recovered')
+
+    def test_waiter_times_out(self):
+        flight = SingleFlight(timeout=0.05)
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=('k', lambda: release.wait(5)))
+        leader.start()
+        time.sleep(0.02)
+        with self.assertRaises(TimeoutError):
+            flight.do('k', lambda: 'not called')
+        release.set()
+        leader.join(5)
+        self.assertEqual(flight.stats()['timeouts'], 1)
+
+
+class AsyncSingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def gather(self, *calls):
+        async def run():
+            return await asyncio.gather(*calls, return_exceptions=True)
+        return self.loop.run_until_complete(run())
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = AsyncSingleFlight(timeout=5)
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'value'
+
+        results = self.gather(*[flight.do('k', slow) for _ in range(5)])
+        self.assertEqual((results, len(calls)), (['value'] * 5, 1))
+        self.assertEqual(flight.stats()['coalesced'], 4)
+
+    def test_leader_error_reaches_every_waiter_and_releases_the_key(self):
+        flight = AsyncSingleFlight(timeout=5)
+
+        async def failing():
+            await asyncio.sleep(0.05)
+            raise ValueError('upstream down')
+
+        async def recovered():
+            return 'recovered'
+
+        results = self.gather(*[flight.do('k', failing) for _ in range(3)])
+        self.assertEqual([str(e) for e in results], ['upstream down'] * 3)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+        self.assertEqual(self.gather(flight.do('k', recovered)), ['recovered'])
+
+    def test_waiter_times_out_without_cancelling_the_call(self):
+        flight = AsyncSingleFlight(timeout=0.05)
+
+        async def slow():
+            await asyncio.sleep(0.2)
+            return 'value'
+
+        async def late_waiter():
+            await asyncio.sleep(0.01)
+            return await flight.do('k', slow)
+
+        async def run():
+            first = asyncio.ensure_future(flight.do('k', slow))
+            waiter = await asyncio.gather(late_waiter(), return_exceptions=True)
+            call = flight._calls['k']
+            await asyncio.gather(first, return_exceptions=True)
+            await asyncio.sleep(0.25)
+            return waiter[0], call
+
+        error, call = self.loop.run_until_complete(run())
+        self.assertIsInstance(error, TimeoutError)
+        self.assertEqual(call.result(), 'value')
+        # the first caller waits under the same timeout, so it gives up too
+        self.assertEqual(flight.stats()['timeouts'], 2)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime, timezone
+
+import dateutil.parser
+import pytz
+
+from timeutil import parse_iso, parse, reformat, format_iso_local, format_utc_local, zone
+
+
+class ParseIsoTest(unittest.TestCase):
+
+    def test_matches_dateutil(self):
+        stamps = ['2019-01-01T03:00:00.000Z', '2019-01-01T10:00:00+07:00', '2019-01-01T10:00:00-0330',
+                  '2019-01-01T23:55:00+09:00', '2019-01-27T00:00:00', '2019-01-27', '2019-03-10 02:30:00+01']
+        for text in stamps:
+            old = dateutil.parser.parse(text)
+            record = parse_iso(text)
+            self.assertEqual(record.datetime, old, text)
+            self.assertEqual(record.offset, old.strftime('%z'), text)
+            self.assertEqual(record.local_epoch, old.replace(tzinfo=timezone.utc).timestamp(), text)
+            if old.tzinfo is not None:
+                self.assertEqual(record.epoch, old.timestamp(), text)
+            self.assertEqual(record.local_date, old.date(), text)
+
+    def test_rejects_other_text(self):
+        with self.assertRaises(ValueError):
+            parse_iso('01/02/2019')
+
+
+class FormatTest(unittest.TestCase):
+
+    def test_parse_matches_strptime(self):
+        for text, date_format in [('2019-01-01', '%Y-%m-%d'), ('2019-01-01 10:07', '%Y-%m-%d %H:%M'), ('23:30', '%H:%M'),
+                                  ('2019-01-01T10:00:00', '%Y-%m-%dT%H:%M:%S'), ('2019-01-01 10:00:01', '%Y-%m-%d %H:%M:%S'),
+                                  ('01/02/2019', '%d/%m/%Y')]:
+            self.assertEqual(parse(text, date_format), datetime.strptime(text, date_format), text)
+        with self.assertRaises(ValueError):
+            parse('2019-01-01 10', '%Y-%m-%d %H:%M')
+
+    def test_format_iso_local(self):
+        self.assertEqual(format_iso_local('2019-01-01T03:00:00.000Z', 'Asia/Bangkok', '%-I%p'), '10AM')
+        self.assertEqual(format_iso_local('2019-01-01T20:00:00.000Z', 'Asia/Bangkok', '%A %-d %B %Y'),
+                         'Wednesday 2 January 2019')
+
+    def test_format_utc_local(self):
+        def convert_time(dt_str, tz_str, from_format, to_format):
+            # what Weather.convert_time did
+            dt = pytz.utc.localize(datetime.strptime(dt_str, from_format))
+            return dt.astimezone(pytz.timezone(tz_str)).strftime(to_format)
+        for args in [('2019-01-01 10:00', 'Asia/Tokyo', '%Y-%m-%d %H:%M', '%a, %d %B %H:%M %p %z'),
+                     ('21:30', 'Asia/Tokyo', '%H:%M', '%I:%M %p'),
+                     ('08:05', 'Europe/London', '%H:%M', '%I:%M %p')]:
+            self.assertEqual(format_utc_local(*args), convert_time(*args), args)
+
+    def test_reformat(self):
+        self.assertEqual(reformat('2019-01-02', '%Y-%m-%d', '%a, %-d %b'), 'Wed, 2 Jan')
+
+    def test_unknown_zone(self):
+        # formatting in server-local time instead would pass for the place's local time
+        with self.assertRaises(pytz.UnknownTimeZoneError):
+            zone('Nowhere/Special')
+        with self.assertRaises(pytz.UnknownTimeZoneError):
+            format_iso_local('2019-01-01T03:00:00.000Z', 'Nowhere/Special', '%-I%p')
+        with self.assertRaises(pytz.UnknownTimeZoneError):
+            format_utc_local('21:30', 'Nowhere/Special', '%H:%M', '%I:%M %p')
+        self.assertIs(zone('Asia/Tokyo'), pytz.timezone('Asia/Tokyo'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import time
+import queue
+import threading
+import unittest
+
+from linebot.models import MessageEvent, TextMessage, SourceUser
+
+from webhook import EventDispatcher, EventQueue, group_by_source
+
+
+def text_event(user_id, text):
+    return MessageEvent(reply_token='token', source=SourceUser(user_id=user_id), message=TextMessage(text=text))
+
+
+class Recorder(object):
+    """Text message handler that records (user, text) and can be told to sleep, fail or block."""
+
+    def __init__(self, dispatcher, delay=0.0):
+        self.delay = delay
+        self.handled = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+        dispatcher.add(MessageEvent, message=TextMessage)(self)
+
+    def __call__(self, event):
+        self.started.set()
+        self.release.wait(5)
+        time.sleep(self.delay)
+        if event.message.text == 'fail':
+            raise ValueError('handler bug')
+        with self._lock:
+            self.handled.append((event.source.user_id, event.message.text))
+
+    def texts(self, user_id):
+        return [text for user, text in self.handled if user == user_id]
+
+
+class EventDispatcherTest(unittest.TestCase):
+
+    def test_group_by_source(self):
+        events = [text_event('a', '1'), text_event('b', '1'), text_event('a', '2')]
+        self.assertEqual([[event.message.text for event in group] for group in group_by_source(events)],
+                         [['1', '2'], ['1']])
+
+    def test_each_sender_in_order_senders_side_by_side(self):
+        dispatcher = EventDispatcher('secret', workers=4)
+        recorder = Recorder(dispatcher, delay=0.05)
+        events = [text_event(user, str(n)) for n in range(4) for user in ('a', 'b', 'c')]
+        start = time.time()
+        dispatcher.handle_events(events)
+        elapsed = time.time() - start
+        for user in ('a', 'b', 'c'):
+            self.assertEqual(recorder.texts(user), ['0', '1', '2', '3'])
+        # one sender at a time would take 12 x 50ms
+        self.assertLess(elapsed, 0.45)
+
+    def test_events_past_the_budget_are_skipped(self):
+        dispatcher = EventDispatcher('secret', budget=0.1)
+        recorder = Recorder(dispatcher, delay=0.15)
+        dispatcher.handle_events([text_event('a', '1'), text_event('a', '2'), text_event('a', '3')])
+        self.assertEqual(recorder.texts('a'), ['1'])
+
+    def test_handler_errors_are_contained(self):
+        dispatcher = EventDispatcher('secret')
+        recorder = Recorder(dispatcher)
+        failed = dispatcher.dispatch_in_order([text_event('a', '1'), text_event('a', 'fail'), text_event('a', '2')],
+                                              time.time() + 5)
+        self.assertEqual(failed, 1)
+        self.assertEqual(recorder.texts('a'), ['1', '2'])
+
+
+class EventQueueTest(unittest.TestCase):
+
+    def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail('condition not met')
+
+    def test_consumers_handle_queued_senders(self):
+        dispatcher = EventDispatcher('secret')
+        recorder = Recorder(dispatcher)
+        event_queue = EventQueue(dispatcher, workers=2, maxsize=8)
+        event_queue.put([text_event('a', '1'), text_event('b', 'fail'), text_event('a', '2')])
+        self.wait_for(lambda: event_queue.stats()['processed'] == 3)
+        self.assertEqual(recorder.texts('a'), ['1', '2'])
+        self.assertEqual(event_queue.stats()['failed'], 1)
+
+    def test_full_queue_hands_back_the_rest_for_inline_handling(self):
+        dispatcher = EventDispatcher('secret')
+        recorder = Recorder(dispatcher)
+        recorder.release.clear()
+        event_queue = EventQueue(dispatcher, workers=1, maxsize=1)
+        event_queue.put([text_event('a', '1')])
+        # the only consumer is now blocked in a's handler
+        self.assertTrue(recorder.started.wait(5))
+        rest = [text_event('c', '1'), text_event('c', '2')]
+        with self.assertRaises(queue.Full) as raised:
+            event_queue.put([text_event('b', '1')] + rest)
+        self.assertEqual(raised.exception.args[0], rest)
+        self.assertEqual(event_queue.stats()['rejected'], 2)
+        # what app.py's /callback does with them
+        recorder.release.set()
+        dispatcher.handle_events(raised.exception.args[0])
+        self.assertEqual(recorder.texts('c'), ['1', '2'])
+        self.wait_for(lambda: event_queue.stats()['processed'] == 2)
+        self.assertEqual(recorder.texts('b'), ['1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+import pytz
+
+# Upstream timestamps come in a few fixed shapes, so they are parsed with
+# format-specific regular expressions instead of dateutil's guessing parser
+# (datetime.fromisoformat needs Python 3.7). Parses, time zones and formatted
+# results are memoized: a forecast carousel formats the same handful of
+# timestamps for every user until the next reading arrives.
+
+_iso_pattern = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})'
+    r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d+))?)?)?'
+    r'\s*(Z|[+-]\d{2}(?::?\d{2})?)?\Z')
+
+# strptime formats the upstreams use, as (pattern, group names)
+_fixed_formats = {
+    '%Y-%m-%d': (re.compile(r'(\d{4})-(\d{2})-(\d{2})\Z'), ('year', 'month', 'day')),
+    '%Y-%m-%d %H:%M': (re.compile(r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2})\Z'),
+                       ('year', 'month', 'day', 'hour', 'minute')),
+    '%Y-%m-%d %H:%M:%S': (re.compile(r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})\Z'),
+                          ('year', 'month', 'day', 'hour', 'minute', 'second')),
+    '%Y-%m-%dT%H:%M:%S': (re.compile(r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})\Z'),
+                          ('year', 'month', 'day', 'hour', 'minute', 'second')),
+    '%H:%M': (re.compile(r'(\d{2}):(\d{2})\Z'), ('hour', 'minute'))
+}
+
+_unix_epoch = datetime(1970, 1, 1)
+
+# datetime: as written, aware when the text has an offset
+# epoch: seconds since the Unix epoch; text without an offset is taken as UTC
+# local_epoch: the wall-clock time as if it were UTC, like the flight API's *LOC fields
+# offset: '+0700' style UTC offset, '' without one
+# local_date: the calendar date of the wall-clock time
+IsoTime = namedtuple('IsoTime', 'datetime epoch local_epoch offset local_date')
+
+
+@lru_cache(maxsize=64)
+def fixed_offset(minutes):
+    """Shared tzinfo for a fixed UTC offset."""
+    if minutes == 0:
+        return timezone.utc
+    return timezone(timedelta(minutes=minutes))
+
+
+@lru_cache(maxsize=256)
+def zone(name):
+    """pytz time zone by IANA name; raises pytz.UnknownTimeZoneError like pytz.timezone."""
+    return pytz.timezone(name)
+
+
+@lru_cache(maxsize=4096)
+def parse_iso(text):
+    """Parse an ISO 8601 timestamp once into an IsoTime record."""
+    m = _iso_pattern.match(text)
+    if m is None:
+        raise ValueError('not an ISO 8601 timestamp: {0!r}'.format(text))
+    year, month, day, hour, minute, second, fraction, tz = m.groups()
+    local = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                     int(fraction[:6].ljust(6, '0')) if fraction else 0)
+    local_epoch = (local - _unix_epoch).total_seconds()
+    if tz is None:
+        return IsoTime(local, local_epoch, local_epoch, '', local.date())
+    minutes = 0
+    if tz != 'Z':
+        digits = tz[1:].replace(':', '')
+        minutes = int(digits[:2]) * 60 + int(digits[2:] or 0)
+        if tz[0] == '-':
+            minutes = -minutes
+    offset = '{0}{1:02d}{2:02d}'.format('-' if minutes < 0 else '+', abs(minutes) // 60, abs(minutes) % 60)
+    return IsoTime(local.replace(tzinfo=fixed_offset(minutes)), local_epoch - minutes * 60, local_epoch, offset,
+                   local.date())
+
+
+def parse(text, date_format):
+    """datetime.strptime(text, date_format), without strptime for the formats the upstreams use."""
+    fixed = _fixed_formats.get(date_format)
+    if fixed is None:
+        return datetime.strptime(text, date_format)
+    pattern, names = fixed
+    m = pattern.match(text)
+    if m is None:
+        raise ValueError('time data {0!r} does not match format {1!r}'.format(text, date_format))
+    fields = dict(zip(names, map(int, m.groups())))
+    return datetime(fields.get('year', 1900), fields.get('month', 1), fields.get('day', 1),
+                    fields.get('hour', 0), fields.get('minute', 0), fields.get('second', 0))
+
+
+@lru_cache(maxsize=4096)
+def reformat(text, from_format, to_format):
+    """Reformat a timestamp without converting its time zone."""
+    return parse(text, from_format).strftime(to_format)
+
+
+@lru_cache(maxsize=4096)
+def format_iso_local(text, tz_name, to_format):
+    """Format an ISO 8601 timestamp in the named time zone."""
+    dt = parse_iso(text).datetime
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(zone(tz_name)).strftime(to_format)
+
+
+@lru_cache(maxsize=4096)
+def format_utc_local(text, tz_name, from_format, to_format):
+    """Format a UTC time written in from_format in the named time zone."""
+    dt = parse(text, from_format).replace(tzinfo=pytz.utc)
+    return dt.astimezone(zone(tz_name)).strftime(to_format)
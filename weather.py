@@ -1,11 +1,17 @@
 from datetime import datetime
-import requests
 import os
 import sys
 import json
-import pytz
 import time
-import dateutil.parser
+from concurrent.futures import ThreadPoolExecutor, wait
+from http_client import default_client
+from cache import TTLCache, rendered_replies
+from geo import snap_to_grid
+from singleflight import upstream_calls
+from flex import Template, Slot, Splice
+from aqi_levels import waqi_styles, waqi_details, unknown_waqi_detail, style_for, styles_for
+from timeutil import parse_iso, reformat, format_utc_local
+from daily import aggregate_daily
 from linebot.models import (
     BubbleContainer, FlexSendMessage, TextSendMessage, TextMessage, CarouselContainer
 )
@@ -18,6 +24,31 @@ aqi_api_url = os.getenv('WEATHER_AQI_API', None)
 weather_api_key = os.getenv('WEATHER_API_KEY', None)
 geocode_api_key = os.getenv('GEOCODE_API_KEY', None)
 
+# current and daily forecast are fetched side by side; a request gets at most
+# weather_timeout seconds and the daily part is optional
+weather_executor = ThreadPoolExecutor(max_workers=int(os.getenv('WEATHER_FETCH_WORKERS', '8')))
+weather_timeout = float(os.getenv('WEATHER_TIMEOUT_SECONDS', '6'))
+weather_timeout_text = "Sorry, the weather service is slow right now, please try again in a moment"
+
+# place names and coordinates practically never move, so geocoding results are
+# kept for a long time; GEOCODE_CACHE_PATH keeps warm entries across restarts
+geocode_cache = TTLCache(maxsize=int(os.getenv('GEOCODE_CACHE_SIZE', '4096')),
+                         ttl=int(os.getenv('GEOCODE_CACHE_TTL', str(30 * 24 * 3600))),
+                         persist_path=os.getenv('GEOCODE_CACHE_PATH', None))
+geocode_not_found_ttl = 3600
+
+# weatherbit responses are shared by everyone within the same grid cell
+# (FORECAST_GRID_DEGREES, ~5km by default) until the endpoint's TTL runs out,
+# and served stale for up to FORECAST_STALE_TTL when weatherbit is failing
+forecast_grid_degrees = float(os.getenv('FORECAST_GRID_DEGREES', '0.05'))
+forecast_ttls = {
+    'current': int(os.getenv('FORECAST_CURRENT_TTL', '600')),
+    'forecast/daily': int(os.getenv('FORECAST_DAILY_TTL', str(3 * 3600))),
+    'forecast/hourly': int(os.getenv('FORECAST_HOURLY_TTL', '3600'))
+}
+forecast_cache = TTLCache(maxsize=int(os.getenv('FORECAST_CACHE_SIZE', '2048')),
+                          stale_ttl=int(os.getenv('FORECAST_STALE_TTL', str(6 * 3600))))
+
 user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_13_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/71.0.3578.98 Safari/537.36'
 
 if weather_api_key is None:
@@ -37,42 +68,385 @@ if aqi_api_token is None:
     sys.exit(1)
 
 
+separator = {
+    "type": "separator"
+}
+
+weather_bubble = Template({
+    "type": "bubble",
+    "styles": {
+        "body": {
+            "backgroundColor": "#ffffff"
+        }
+    },
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "md",
+        "contents": [
+            {
+                "type": "box",
+                "layout": "vertical",
+                "contents": [
+                    {
+                        "type": "box",
+                        "layout": "baseline",
+                        "spacing": "sm",
+                        "contents": [
+                            {
+                                "type": "icon",
+                                "url": "https://static.thenounproject.com/png/14236-200.png"
+                            },
+                            {
+                                "type": "text",
+                                "text": Slot('address'),
+                                "size": "sm",
+                                "wrap": True
+                            }
+                        ]
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('observed_at'),
+                        "size": "xxs"
+                    }
+                ]
+            },
+            {
+                "type": "box",
+                "layout": "vertical",
+                "margin": "xs",
+                "contents": [
+                    {
+                        "type": "text",
+                        "text": Slot('temp'),
+                        "size": "5xl",
+                        "align": "center",
+                        "action": {
+                            "type": "postback",
+                            "data": Slot('hourly_data')
+                        }
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('description'),
+                        "weight": "bold",
+                        "size": "lg",
+                        "align": "center"
+                    },
+                    Splice('min_max'),
+                    {
+                        "type": "text",
+                        "text": Slot('feels_like'),
+                        "size": "xs",
+                        "align": "center"
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('humidity'),
+                        "size": "xs",
+                        "align": "center"
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('sun'),
+                        "size": "xs",
+                        "align": "center"
+                    }
+                ]
+            },
+            separator,
+            {
+                "type": "box",
+                "layout": "vertical",
+                "spacing": "xs",
+                "contents": [
+                    Splice('forecast_rows')
+                ]
+            }
+        ]
+    }
+})
+
+weather_min_max_text = Template({
+    "type": "text",
+    "text": Slot('min_max'),
+    "size": "sm",
+    "align": "center"
+})
+
+weather_daily_row = Template({
+    "type": "box",
+    "layout": "horizontal",
+    "spacing": "xs",
+    "contents": [
+        {
+            "type": "box",
+            "layout": "vertical",
+            "flex": 4,
+            "contents": [
+                {
+                    "type": "text",
+                    "text": Slot('date'),
+                    "size": "xs"
+                },
+                {
+                    "type": "text",
+                    "text": Slot('description'),
+                    "size": "xxs"
+                }
+            ]
+        },
+        {
+            "type": "image",
+            "url": Slot('icon_url'),
+            "size": "xxs",
+            "flex": 2
+        },
+        {
+            "type": "text",
+            "text": Slot('min_max'),
+            "size": "sm",
+            "align": "end",
+            "gravity": "center",
+            "flex": 2
+        }
+    ]
+})
+
+weather_hourly_bubble = Template({
+    "type": "bubble",
+    "styles": {
+        "body": {
+            "backgroundColor": "#ffffff"
+        }
+    },
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "sm",
+        "contents": [
+            {
+                "type": "box",
+                "layout": "vertical",
+                "spacing": "md",
+                "contents": [
+                    {
+                        "type": "box",
+                        "layout": "baseline",
+                        "spacing": "sm",
+                        "contents": [
+                            {
+                                "type": "icon",
+                                "url": "https://static.thenounproject.com/png/14236-200.png"
+                            },
+                            {
+                                "type": "text",
+                                "text": Slot('city'),
+                                "size": "lg"
+                            }
+                        ]
+                    },
+                    {
+                        "type": "text",
+                        "text": Slot('date'),
+                        "size": "xs"
+                    }
+                ]
+            },
+            {
+                "type": "box",
+                "layout": "horizontal",
+                "contents": [
+                    {
+                        "type": "text",
+                        "size": "xxs",
+                        "text": "Time",
+                        "flex": 8
+                    },
+                    {
+                        "type": "text",
+                        "size": "xxs",
+                        "text": "Temp",
+                        "flex": 2
+                    },
+                    {
+                        "type": "text",
+                        "size": "xxs",
+                        "text": "Feels Like",
+                        "flex": 3
+                    }
+                ]
+            },
+            separator,
+            {
+                "type": "box",
+                "layout": "vertical",
+                "spacing": "xs",
+                "contents": [
+                    Splice('hourly_rows')
+                ]
+            }
+        ]
+    }
+})
+
+weather_hourly_row = Template({
+    "type": "box",
+    "layout": "horizontal",
+    "contents": [
+        {
+            "type": "box",
+            "layout": "vertical",
+            "flex": 5,
+            "contents": [
+                {
+                    "type": "text",
+                    "size": "xxs",
+                    "weight": "bold",
+                    "text": Slot('time')
+                },
+                {
+                    "type": "text",
+                    "size": "xxs",
+                    "wrap": True,
+                    "text": Slot('description')
+                }
+            ]
+        },
+        {
+            "type": "image",
+            "url": Slot('icon_url'),
+            "size": "xxs",
+            "flex": 3
+        },
+        {
+            "type": "text",
+            "size": "xs",
+            "text": Slot('temp'),
+            "gravity": "center",
+            "align": "center",
+            "flex": 2
+        },
+        {
+            "type": "text",
+            "size": "xs",
+            "text": Slot('feels_like'),
+            "gravity": "center",
+            "align": "center",
+            "flex": 3
+        }
+    ]
+})
+
+
 class Weather:
 
+    def __init__(self, http=None):
+        self.http = http or default_client
+
+    def _geocode_cache_key(self, location_or_latlng):
+        parts = str(location_or_latlng).replace(',', ' ').split()
+        try:
+            # ~11m precision is plenty for reverse geocoding a shared location
+            lat, lng = (float(part) for part in parts)
+            return 'latlng:{0:.4f},{1:.4f}'.format(lat, lng)
+        except ValueError:
+            return 'place:{0}'.format(' '.join(parts).lower())
+
     # resolve location by lat lng or find lat,lng by location_name
     def _resolve_location_latlng(self, location_or_latlng):
-        params = {
+        cache_key = self._geocode_cache_key(location_or_latlng)
+        result = geocode_cache.get(cache_key)
+        if result is not None:
+            return result
+        response = self.http.get(geocode_api_url, params=self._geocode_params(location_or_latlng))
+        return self._store_geocode_result(cache_key, response.json())
+
+    def _geocode_params(self, location_or_latlng):
+        return {
             'q': location_or_latlng,
             'abbrv': '1',
             'key': geocode_api_key
         }
-        response = requests.get(geocode_api_url, params=params)
-        return response.json()
 
-    def get_current_weather(self, lat, lng):
+    def _store_geocode_result(self, cache_key, result):
+        # quota and rate-limit errors are not cached
+        if result.get('status', {}).get('code') == 200:
+            geocode_cache.set(cache_key, result, ttl=None if len(result['results']) > 0 else geocode_not_found_ttl)
+        return result
+
+    def _get_forecast(self, endpoint, lat, lng):
+        cache_key, url, params = self._forecast_request(endpoint, lat, lng)
+        data = forecast_cache.get(cache_key)
+        if data is not None:
+            return data
+        try:
+            response = self.http.get(url, params=params)
+            data = response.json()
+        except Exception as e:
+            return self._stale_forecast(cache_key, e)
+        return self._store_forecast(endpoint, cache_key, response.status_code, data)
+
+    def _forecast_request(self, endpoint, lat, lng):
+        # nearby users share one forecast grid cell, and so one cache entry
+        lat, lng = snap_to_grid(lat, lng, forecast_grid_degrees)
+        cache_key = '{0}:{1},{2}'.format(endpoint, lat, lng)
         params = {
             'lat': lat,
             'lon': lng,
             'key': weather_api_key
         }
-        response = requests.get(weather_forecast_url + '/current', params=params)
-        return response.json()
+        return cache_key, '{0}/{1}'.format(weather_forecast_url, endpoint), params
+
+    def _stale_forecast(self, cache_key, error):
+        data = forecast_cache.get_stale(cache_key)
+        if data is None:
+            raise error
+        return data
+
+    def _store_forecast(self, endpoint, cache_key, status_code, data):
+        if status_code == 200 and 'data' in data:
+            forecast_cache.set(cache_key, data, ttl=forecast_ttls[endpoint])
+            return data
+        return forecast_cache.get_stale(cache_key, data)
+
+    def get_current_weather(self, lat, lng):
+        return self._get_forecast('current', lat, lng)
 
     def get_weather_forecast_daily(self, lat, lng):
-        params = {
-            'lat': lat,
-            'lon': lng,
-            'key': weather_api_key
-        }
-        response = requests.get(weather_forecast_url + '/forecast/daily', params=params)
-        return response.json()
+        return self._get_forecast('forecast/daily', lat, lng)
 
-    def get_weather(self, lat, lng):
-        current_data = self.get_current_weather(lat, lng)
-        daily_data = self.get_weather_forecast_daily(lat, lng)
+    def get_weather(self, lat, lng, timeout=weather_timeout):
+        current_future = weather_executor.submit(self.get_current_weather, lat, lng)
+        daily_future = weather_executor.submit(self.get_weather_forecast_daily, lat, lng)
+        done, not_done = wait([current_future, daily_future], timeout=timeout)
+        for future in not_done:
+            future.cancel()
+        daily = None
+        if daily_future in done and daily_future.exception() is None:
+            daily = daily_future.result()
+        if current_future not in done:
+            return self._combine_weather(lat, lng, self._stale_current_weather(lat, lng, timeout), daily)
+        return self._combine_weather(lat, lng, current_future.result(), daily)
+
+    def _stale_current_weather(self, lat, lng, timeout):
+        # the last known conditions of the cell beat no reply at all
+        cache_key, url, params = self._forecast_request('current', lat, lng)
+        data = forecast_cache.get_stale(cache_key)
+        if data is None:
+            raise TimeoutError('current weather for {0},{1} took longer than {2}s'.format(lat, lng, timeout))
+        print('====== SERVING STALE CURRENT WEATHER FOR {0},{1} ======'.format(lat, lng))
+        return data
+
+    def _combine_weather(self, lat, lng, current, daily):
         result = dict()
-        result['current'] = current_data['data'][0]
-        result['daily'] = daily_data['data']
+        result['current'] = current['data'][0]
+        result['daily'] = []
+        if daily is not None:
+            result['daily'] = daily.get('data') or []
+        else:
+            print('====== DAILY FORECAST UNAVAILABLE FOR {0},{1} ======'.format(lat, lng))
         return result
 
     def get_latlng_from_place_name(self, place_name):
@@ -84,6 +458,11 @@ class Weather:
         return geometry, address
 
     def get_weather_data(self, place_name_or_latlng):
+        # callers asking for the same place at the same time share one lookup
+        cache_key = 'weather:{0}'.format(self._geocode_cache_key(place_name_or_latlng))
+        return upstream_calls.do(cache_key, self._get_weather_data, place_name_or_latlng)
+
+    def _get_weather_data(self, place_name_or_latlng):
         geometry, address = self.get_latlng_from_place_name(place_name_or_latlng)
         weather_data = self.get_weather(geometry['lat'], geometry['lng'])
         weather_data['address'] = address
@@ -98,7 +477,7 @@ class Weather:
         params = {
             'token': aqi_api_token
         }
-        response = requests.get(url, params=params)
+        response = self.http.get(url, params=params)
         return response.json()
     
     def _normalize_aqi_forecast_data(self, aqi_forecast_data):
@@ -107,25 +486,17 @@ class Weather:
             'station_name': msg['i18n']['name']['en'],
             'station_link': msg['city']['url'],
             'aqi': msg['aqi'],
-            'aqi_forecast': []
+            'aqi_forecast': [
+                {
+                    'date': day.date,
+                    'min': day.min,
+                    'max': day.max,
+                    'mean': day.mean
+                } for day in aggregate_daily(
+                    (parse_iso(af['t']).local_date.strftime('%Y-%m-%d'), af['v'][0], af['v'][1])
+                    for af in msg['forecast']['aqi'])
+            ]
         }
-        for af in msg['forecast']['aqi']:
-            dt = dateutil.parser.parse(af['t'])
-            date_str = dt.date().strftime('%Y-%m-%d')
-            if not any(d['date'] == date_str for d in normalized_data['aqi_forecast']):
-                  normalized_data['aqi_forecast'].append(
-                      {
-                          'date': date_str,
-                          'min': af['v'][0],
-                          'max': af['v'][1]
-                      }
-                  )
-            else:
-                for d in normalized_data['aqi_forecast']:
-                    if d['date'] == date_str and af['v'][0] < d['min']:
-                        d['min'] = af['v'][0]
-                    if d['date'] == date_str and af['v'][1] > d['max']:
-                        d['max'] = af['v'][1]
         return normalized_data
     
     def get_weather_aqi_forecast(self, station_id):
@@ -139,7 +510,7 @@ class Weather:
             'Content-Type': 'application/x-www-form-urlencoded',
             'User-Agent': user_agent
         }
-        response = requests.post(url, data=data, headers=headers)
+        response = self.http.post(url, data=data, headers=headers)
         return response.json()
     
     def get_weather_aqi_daily_message(self, daily_data):
@@ -147,35 +518,13 @@ class Weather:
             "type": "carousel",
             "contents": []
         }
-        for af in daily_data['aqi_forecast']:
-            af['av'] = (af['max'] + af['min'])/2
-            current_date = datetime.now().date().strftime('%Y-%m-%d')
-            if af['date'] < current_date:
-                continue
-            if af['av'] > 0 and af['av'] <= 50:
-                bg_color = '#009966'
-                aqi_level_text = 'Good'
-                text_color = '#ffffff'
-            elif af['av'] > 50 and af['av'] <= 100:
-                bg_color = '#ffde33'
-                aqi_level_text = 'Moderate'
-                text_color = '#000000'
-            elif af['av'] > 100 and af['av'] <= 150:
-                bg_color = '#ff9933'
-                aqi_level_text = 'Unhealthy for Sensitive Groups'
-                text_color = '#000000'
-            elif af['av'] > 150 and af['av'] <= 200:
-                bg_color = '#cc0033'
-                aqi_level_text = 'Unhealthy'
-                text_color = '#ffffff'
-            elif af['av'] > 200 and af['av'] <= 300:
-                bg_color = '#660099'
-                aqi_level_text = 'Very Unhealthy'
-                text_color = '#ffffff'
-            elif af['av'] > 300:
-                bg_color = '#7e0023'
-                aqi_level_text = 'Hazardous'
-                text_color = '#ffffff'
+        current_date = datetime.now().date().strftime('%Y-%m-%d')
+        forecasts = [af for af in daily_data['aqi_forecast'] if af['date'] >= current_date]
+        level_styles = styles_for(waqi_styles, [(af['max'] + af['min'])/2 for af in forecasts])
+        for af, level_style in zip(forecasts, level_styles):
+            bg_color = level_style.background_color
+            aqi_level_text = level_style.text
+            text_color = level_style.text_color
             bubble = {
                 "type": "bubble",
                 "body": {
@@ -226,401 +575,87 @@ class Weather:
 
 
     def _format_date(self, date_str, from_format="%Y-%m-%d", to_format="%a, %-d %b"):
-        dt = datetime.strptime(date_str, from_format)
-        return dt.strftime(to_format)
+        return reformat(date_str, from_format, to_format)
 
     # convert datetime from utc to local time
     def convert_time(self, dt_str, tz_str, from_format, to_format):
-        dt = datetime.strptime(dt_str, from_format)
-        local_tz = pytz.timezone(tz_str)
-        dt = pytz.utc.localize(dt)
-        return dt.astimezone(local_tz).strftime(to_format)
+        return format_utc_local(dt_str, tz_str, from_format, to_format)
 
     def get_weather_message(self, weather_data):
-        bubble = {
-            "type": "bubble",
-            "styles": {
-                "body": {
-                    "backgroundColor": "#ffffff"
-                }
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "spacing": "md",
-                "contents": [
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                            {
-                                "type": "box",
-                                "layout": "baseline",
-                                "spacing": "sm",
-                                "contents": [
-                                    {
-                                        "type": "icon",
-                                        "url": "https://static.thenounproject.com/png/14236-200.png"
-                                    },
-                                    {
-                                        "type": "text",
-                                        "text": "{0} {1}".format(weather_data["address"]["formatted"],
-                                                                 weather_data["address"]["annotations"]["flag"]),
-                                        "size": "sm",
-                                        "wrap": True
-                                    }
-                                ]
-                            },
-                            {
-                                "type": "text",
-                                "text": self.convert_time(weather_data["current"]["ob_time"],
-                                                          weather_data["current"]['timezone'],
-                                                          '%Y-%m-%d %H:%M', '%a, %d %B %H:%M %p %z'),
-                                "size": "xxs"
-                            }
-                        ]
-                    },
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "margin": "xs",
-                        "contents": [
-                            {
-                                "type": "text",
-                                "text": "{0}º".format(int(weather_data["current"]['temp'])),
-                                "size": "5xl",
-                                "align": "center",
-                                "action": {
-                                    "type": "postback",
-                                    "data": "weather_hourly?lat={0}&lng={1}".format(
-                                        weather_data["address"]["geometry"]["lat"],
-                                        weather_data["address"]["geometry"][
-                                            "lng"])
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": weather_data["current"]["weather"]["description"],
-                                "weight": "bold",
-                                "size": "lg",
-                                "align": "center"
-                            },
-                            {
-                                "type": "text",
-                                "text": "{0}º / {1}º".format(int(weather_data["daily"][0]["min_temp"]),
-                                                             int(weather_data["daily"][0]["max_temp"])),
-                                "size": "sm",
-                                "align": "center"
-                            },
-                            {
-                                "type": "text",
-                                "text": "Feels Like: {0}º".format(int(weather_data["current"]["app_temp"])),
-                                "size": "xs",
-                                "align": "center"
-                            },
-                            {
-                                "type": "text",
-                                "text": "Humidity: {0}%".format(weather_data["current"]["rh"]),
-                                "size": "xs",
-                                "align": "center"
-                            },
-                            {
-                                "type": "text",
-                                "text": "SunRise/Set: {0} / {1}".format(
-                                    self.convert_time(weather_data["current"]["sunrise"],
-                                                      weather_data["current"]['timezone'], '%H:%M', '%I:%M %p'),
-                                    self.convert_time(weather_data["current"]["sunset"],
-                                                      weather_data["current"]['timezone'], '%H:%M', '%I:%M %p')),
-                                "size": "xs",
-                                "align": "center"
-                            }
-                        ]
-                    },
-                    {
-                        "type": "separator"
-                    },
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "spacing": "xs",
-                        "contents": []
-                    }
-                ]
-            }
-        }
-        bubble_forecast_contents = bubble["body"]["contents"][3]["contents"]
-        for index in range(1, 6):
-            data = weather_data["daily"][index]
-            bubble_forecast_contents.append(
-                {
-                    "type": "box",
-                    "layout": "horizontal",
-                    "spacing": "xs",
-                    "contents": [
-                        {
-                            "type": "box",
-                            "layout": "vertical",
-                            "flex": 4,
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": self._format_date(data["datetime"]),
-                                    "size": "xs"
-                                },
-                                {
-                                    "type": "text",
-                                    "text": data["weather"]["description"],
-                                    "size": "xxs"
-                                }
-                            ]
-                        },
-                        {
-                            "type": "image",
-                            "url": "https://www.weatherbit.io/static/img/icons/{0}.png".format(
-                                data["weather"]["icon"]),
-                            "size": "xxs",
-                            "flex": 2
-                        },
-                        {
-                            "type": "text",
-                            "text": "{0}º/{1}º".format(int(data["min_temp"]), int(data["max_temp"])),
-                            "size": "sm",
-                            "align": "end",
-                            "gravity": "center",
-                            "flex": 2
-                        }
-                    ]
-                }
-            )
-            bubble_forecast_contents.append(
-                {
-                    "type": "separator"
-                }
-            )
-        return BubbleContainer.new_from_json_dict(bubble)
+        address = weather_data["address"]
+        place_id = '{0}@{1},{2}'.format(address["formatted"], address["geometry"]["lat"], address["geometry"]["lng"])
+        return rendered_replies.get_or_render('weather', place_id, self._weather_version(weather_data),
+                                              lambda: self._render_weather_message(weather_data))
+
+    def _weather_version(self, weather_data):
+        # the daily forecast is refreshed on its own ttl without a timestamp of its
+        # own, so the version carries every daily field the bubble shows
+        ob_time = weather_data["current"].get("ob_time")
+        if ob_time is None:
+            return None
+        return ob_time, tuple((data["datetime"], data["min_temp"], data["max_temp"],
+                               data["weather"]["description"], data["weather"]["icon"])
+                              for data in weather_data["daily"][:6])
+
+    def _render_weather_message(self, weather_data):
+        current = weather_data["current"]
+        daily = weather_data["daily"]
+        min_max = []
+        if len(daily) > 0:
+            min_max.append(weather_min_max_text(min_max="{0}º / {1}º".format(int(daily[0]["min_temp"]),
+                                                                         int(daily[0]["max_temp"]))))
+        forecast_rows = []
+        for index in range(1, min(6, len(daily))):
+            data = daily[index]
+            forecast_rows.append(weather_daily_row(
+                date=self._format_date(data["datetime"]),
+                description=data["weather"]["description"],
+                icon_url="https://www.weatherbit.io/static/img/icons/{0}.png".format(data["weather"]["icon"]),
+                min_max="{0}º/{1}º".format(int(data["min_temp"]), int(data["max_temp"]))
+            ))
+            forecast_rows.append(separator)
+        return weather_bubble(
+            address="{0} {1}".format(weather_data["address"]["formatted"],
+                                     weather_data["address"]["annotations"]["flag"]),
+            observed_at=self.convert_time(current["ob_time"], current['timezone'],
+                                          '%Y-%m-%d %H:%M', '%a, %d %B %H:%M %p %z'),
+            temp="{0}º".format(int(current['temp'])),
+            hourly_data="weather_hourly?lat={0}&lng={1}".format(weather_data["address"]["geometry"]["lat"],
+                                                                weather_data["address"]["geometry"]["lng"]),
+            description=current["weather"]["description"],
+            min_max=min_max,
+            feels_like="Feels Like: {0}º".format(int(current["app_temp"])),
+            humidity="Humidity: {0}%".format(current["rh"]),
+            sun="SunRise/Set: {0} / {1}".format(
+                self.convert_time(current["sunrise"], current['timezone'], '%H:%M', '%I:%M %p'),
+                self.convert_time(current["sunset"], current['timezone'], '%H:%M', '%I:%M %p')),
+            forecast_rows=forecast_rows
+        )
 
     def get_weather_forcast_hourly(self, lat, lng):
-        params = {
-            'lat': lat,
-            'lon': lng,
-            'key': weather_api_key
-        }
-        response = requests.get(weather_forecast_url + '/forecast/hourly', params=params)
-        return response.json()
+        return self._get_forecast('forecast/hourly', lat, lng)
 
     def get_weather_forecast_hourly_data(self, hourly_data, limit=10):
-        date = self._format_date(hourly_data['data'][0]['timestamp_local'], '%Y-%m-%dT%H:%M:%S', '%a, %-d %B %Y')
         data = hourly_data['data']
-        bubble = {
-            "type": "bubble",
-            "styles": {
-                "body": {
-                    "backgroundColor": "#ffffff"
-                }
-            },
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "spacing": "sm",
-                "contents": [
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "spacing": "md",
-                        "contents": [
-                            {
-                                "type": "box",
-                                "layout": "baseline",
-                                "spacing": "sm",
-                                "contents": [
-                                    {
-                                        "type": "icon",
-                                        "url": "https://static.thenounproject.com/png/14236-200.png"
-                                    },
-                                    {
-                                        "type": "text",
-                                        "text": "{0}, {1}".format(hourly_data['city_name'],
-                                                                  hourly_data['country_code']),
-                                        "size": "lg"
-                                    }
-                                ]
-                            },
-                            {
-                                "type": "text",
-                                "text": date,
-                                "size": "xs"
-                            }
-                        ]
-                    },
-                    {
-                        "type": "box",
-                        "layout": "horizontal",
-                        "contents": [
-                            {
-                                "type": "text",
-                                "size": "xxs",
-                                "text": "Time",
-                                "flex": 8
-                            },
-                            {
-                                "type": "text",
-                                "size": "xxs",
-                                "text": "Temp",
-                                "flex": 2
-                            },
-                            {
-                                "type": "text",
-                                "size": "xxs",
-                                "text": "Feels Like",
-                                "flex": 3
-                            }
-                        ]
-                    },
-                    {
-                        "type": "separator"
-                    },
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "spacing": "xs",
-                        "contents": []
-                    }
-                ]
-            }
-        }
-        bubble_body_contents = bubble['body']['contents'][3]['contents']
+        hourly_rows = []
         for index in range(0, limit):
-            bubble_body_contents.append(
-                {
-                    "type": "box",
-                    "layout": "horizontal",
-                    "contents": [
-                        {
-                            "type": "box",
-                            "layout": "vertical",
-                            "flex": 5,
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "size": "xxs",
-                                    "weight": "bold",
-                                    "text": self._format_date(data[index]['timestamp_local'],
-                                                              '%Y-%m-%dT%H:%M:%S', '%-I%p')
-                                },
-                                {
-                                    "type": "text",
-                                    "size": "xxs",
-                                    "wrap": True,
-                                    "text": data[index]['weather']['description']
-                                }
-                            ]
-                        },
-                        {
-                            "type": "image",
-                            "url": "https://www.weatherbit.io/static/img/icons/{0}.png".format(
-                                data[index]['weather']['icon']),
-                            "size": "xxs",
-                            "flex": 3
-                        },
-                        {
-                            "type": "text",
-                            "size": "xs",
-                            "text": "{0}º".format(int(data[index]['temp'])),
-                            "gravity": "center",
-                            "align": "center",
-                            "flex": 2
-                        },
-                        {
-                            "type": "text",
-                            "size": "xs",
-                            "text": "{0}º".format(int(data[index]['app_temp'])),
-                            "gravity": "center",
-                            "align": "center",
-                            "flex": 3
-                        }
-                    ]
-                }
-            )
-            bubble_body_contents.append(
-                {
-                    "type": "separator"
-                }
-            )
-        return BubbleContainer.new_from_json_dict(bubble)
+            hourly_rows.append(weather_hourly_row(
+                time=self._format_date(data[index]['timestamp_local'], '%Y-%m-%dT%H:%M:%S', '%-I%p'),
+                description=data[index]['weather']['description'],
+                icon_url="https://www.weatherbit.io/static/img/icons/{0}.png".format(data[index]['weather']['icon']),
+                temp="{0}º".format(int(data[index]['temp'])),
+                feels_like="{0}º".format(int(data[index]['app_temp']))
+            ))
+            hourly_rows.append(separator)
+        return weather_hourly_bubble(
+            city="{0}, {1}".format(hourly_data['city_name'], hourly_data['country_code']),
+            date=self._format_date(data[0]['timestamp_local'], '%Y-%m-%dT%H:%M:%S', '%a, %-d %B %Y'),
+            hourly_rows=hourly_rows
+        )
 
     
     def _check_aqi_level(self, aqi):
-        aqi = int(aqi)
-        result = {
-            'level': '-1',
-            'level_text': 'Unknown',
-            'level_text_color': '#ffffff',
-            'level_image': 'https://i.imgur.com/SD87jjB.png',
-            'outdoor': {
-                'image': 'https://i.imgur.com/IEwBqbv.png',
-                'text': 'Unknown'
-            },
-            'mask': {
-                'image': 'https://i.imgur.com/7vFN3AZ.png',
-                'text': 'Unknown'
-            }
-        }
-        if aqi >= 0 and aqi <= 50:
-            # green
-            result['level'] = '1'
-            result['level_text'] = 'Good'
-            result['level_text_color'] = '#1ABC9C'
-            result['level_image'] = 'https://i.imgur.com/SD87jjB.png'
-            result['outdoor']['text'] = 'No Risk'
-            #'outdoor.image': 'https://i.imgur.com/krsW5US.png',
-            result['mask']['text'] = 'Not Needed'
-        elif aqi > 50 and aqi <= 100:
-            # yellow
-            result['level'] = '2'
-            result['level_text'] = 'Moderate'
-            result['level_text_color'] = '#f1c40f'
-            result['level_image'] = 'https://i.imgur.com/vxX2nVF.png'
-            result['outdoor']['text'] = 'People with respiratory disease should limit outdoor exertion'
-            # 'outdor.image': 'https://i.imgur.com/uUQumwh.png',
-            result['mask']['text'] = 'Recommended for People with respiratory disease'
-        elif aqi > 100 and aqi <= 150:
-            # orange
-            result['level'] = '3'
-            result['level_text'] = 'Unhealthy for Sensitive Groups'
-            result['level_text_color'] = '#e67e22'
-            # result['level_image'] = 'https://i.imgur.com/i5YnK6H.png'
-            result['level_image'] = 'https://i.imgur.com/y7O7bvz.png'
-            result['outdoor']['text'] = 'People with respiratory disease should limit outdoor exertion'
-            #'outdoor.image': 'https://i.imgur.com/2MFtPg3.png',
-            result['mask']['text'] = 'Recommended'
-        elif aqi > 150 and aqi <= 200:
-            # red
-            result['level'] = '4'
-            result['level_text'] = 'Unhealthy'
-            result['level_text_color'] = '#e74c3c'
-            result['level_image'] = 'https://i.imgur.com/DQE2DOJ.png'
-            result['outdoor']['text'] = 'Everyone should limit outdoor exertion'
-            # 'outdoor.image': 'https://i.imgur.com/m4Sve1v.png',
-            result['mask']['text'] = 'Recommended'
-        elif aqi > 200 and aqi < 300:
-            # purple
-            result['level'] = '5'
-            result['level_text'] = 'Very Unhealthy'
-            result['level_text_color'] = '#9b59b6'
-            result['level_image'] = 'https://i.imgur.com/YHQoI3i.png'
-            result['outdoor']['text'] = 'Everyone, esp children should limit outdoor exertion'
-            # 'image': 'https://i.imgur.com/IZdDkkn.png',
-            result['mask']['text'] = 'A Must'
-        elif aqi >= 300:
-            # dark red
-            result['level'] = '6'
-            result['level_text'] = 'Hazardous'
-            result['level_text_color'] = '#902E46'
-            result['level_image'] = 'https://i.imgur.com/VLAKdFj.png'
-            result['outdoor']['text'] = 'Everyone should avoid all outdoor exertion'
-            # 'outdoor.image': 'https://i.imgur.com/LFj1um8.png',
-            result['mask']['text'] = 'A Must'
-        return result
+        return style_for(waqi_details, int(aqi), unknown_waqi_detail)
 
     def get_iaqi_by_param(self, iaqi_list, param_name):
         result = dict()
@@ -698,7 +733,7 @@ class Weather:
                                         "contents": [
                                             {
                                                 "type": "image",
-                                                "url": normalized_data['level']['level_image'],
+                                                "url": normalized_data['level'].level_image,
                                                 "size": "xs"
                                             },
                                             {
@@ -706,15 +741,15 @@ class Weather:
                                                 "text": '{}'.format(normalized_data['aqi']),
                                                 "size": "4xl",
                                                 "gravity": "top",
-                                                "color": normalized_data['level']['level_text_color']
+                                                "color": normalized_data['level'].level_text_color
                                             }
                                         ]
                                     },
                                     {
                                         "type": "text",
-                                        "text": normalized_data['level']['level_text'],
+                                        "text": normalized_data['level'].level_text,
                                         "align": "center",
-                                        "color": normalized_data['level']['level_text_color']
+                                        "color": normalized_data['level'].level_text_color
                                     },
                                     {
                                         "type": "text",
@@ -830,9 +865,9 @@ class Weather:
                                             },
                                             {
                                                 "type": "text",
-                                                "text": normalized_data['level']['outdoor']['text'],
+                                                "text": normalized_data['level'].outdoor_text,
                                                 "size": "xs",
-                                                "color": normalized_data['level']['level_text_color'],
+                                                "color": normalized_data['level'].level_text_color,
                                                 "wrap": True
                                             }
                                         ]
@@ -868,9 +903,9 @@ class Weather:
                                             },
                                             {
                                                 "type": "text",
-                                                "text": normalized_data['level']['mask']['text'],
+                                                "text": normalized_data['level'].mask_text,
                                                 "size": "xs",
-                                                "color": normalized_data['level']['level_text_color'],
+                                                "color": normalized_data['level'].level_text_color,
                                                 "wrap": True
                                             }
                                         ]
@@ -897,7 +932,7 @@ class Weather:
                                     "label": "More Details",
                                     "uri": normalized_data['more_details_link']
                                 },
-                                "color": normalized_data['level']['level_text_color'],
+                                "color": normalized_data['level'].level_text_color,
                                 "style": "secondary"
                             },
                             {
@@ -908,7 +943,7 @@ class Weather:
                                     "text": "Daily Forecast",
                                     "data": "aqi_daily?station_id={0}".format(normalized_data['idx'])
                                 },
-                                "color": normalized_data['level']['level_text_color'],
+                                "color": normalized_data['level'].level_text_color,
                                 "style": "secondary"
                             }
                         ]
@@ -931,40 +966,12 @@ class Weather:
     def get_weather_aqi_message(self, weather_aqi_data):
         data = weather_aqi_data['data']
         aqi_last = int(data['aqi'])
-        aqi_level = 1
-        bg_color = '#FFFF00'
-        aqi_level_text = 'Moderate'
+        level_style = style_for(waqi_styles, aqi_last, waqi_styles[1])
+        aqi_level = level_style.level
+        bg_color = level_style.background_color
+        aqi_level_text = level_style.text
+        text_color = level_style.text_color
         msg_text = ''
-        if aqi_last > 0 and aqi_last <= 50:
-            bg_color = '#009966'
-            aqi_level_text = 'Good'
-            aqi_level = 1
-            text_color = '#ffffff'
-        elif aqi_last > 50 and aqi_last <= 100:
-            bg_color = '#ffde33'
-            aqi_level_text = 'Moderate'
-            aqi_level = 2
-            text_color = '#000000'
-        elif aqi_last > 100 and aqi_last <= 150:
-            bg_color = '#ff9933'
-            aqi_level_text = 'Unhealthy for Sensitive Groups'
-            aqi_level = 3
-            text_color = '#000000'
-        elif aqi_last > 150 and aqi_last <= 200:
-            bg_color = '#cc0033'
-            aqi_level_text = 'Unhealthy'
-            aqi_level = 4
-            text_color = '#ffffff'
-        elif aqi_last > 200 and aqi_last <= 300:
-            bg_color = '#660099'
-            aqi_level_text = 'Very Unhealthy'
-            aqi_level = 5
-            text_color = '#ffffff'
-        elif aqi_last > 300:
-            bg_color = '#7e0023'
-            aqi_level_text = 'Hazardous'
-            aqi_level = 6
-            text_color = '#ffffff'
         bubble = {
             "type": "bubble",
             "direction": "ltr",
@@ -0,0 +1,175 @@
+import os
+import time
+import queue
+import inspect
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from linebot import WebhookHandler
+from linebot.exceptions import LineBotApiError
+from linebot.models import MessageEvent
+
+webhook_workers = int(os.getenv('WEBHOOK_WORKERS', '8'))
+# events of one delivery still waiting after this long are dropped, their
+# reply tokens are about to expire anyway
+webhook_budget = float(os.getenv('WEBHOOK_BUDGET_SECONDS', '20'))
+
+
+def source_key(event):
+    source = event.source
+    return getattr(source, 'user_id', None) or getattr(source, 'group_id', None) \
+        or getattr(source, 'room_id', None)
+
+
+def group_by_source(events):
+    """Split events into per-sender lists, keeping delivery order within each."""
+    groups = OrderedDict()
+    for event in events:
+        groups.setdefault(source_key(event), []).append(event)
+    return list(groups.values())
+
+
+class EventDispatcher(WebhookHandler):
+    """WebhookHandler that runs the events of one delivery concurrently.
+
+    Events from the same sender are handled in order on one thread; different
+    senders run side by side on a pool of webhook_workers threads, and the
+    whole delivery gets webhook_budget seconds.
+    """
+
+    def __init__(self, channel_secret, workers=webhook_workers, budget=webhook_budget):
+        super(EventDispatcher, self).__init__(channel_secret)
+        self.budget = budget
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    @staticmethod
+    def _handler_key(event, message=None):
+        # same key format WebhookHandler.add() registers handlers under
+        if message is None:
+            return event.__name__
+        return event.__name__ + '_' + message.__name__
+
+    def dispatch(self, event):
+        func = None
+        if isinstance(event, MessageEvent):
+            func = self._handlers.get(self._handler_key(event.__class__, event.message.__class__))
+        if func is None:
+            func = self._handlers.get(self._handler_key(event.__class__))
+        if func is None:
+            func = self._default
+        if func is None:
+            print('No handler of {0} and no default handler'.format(event.__class__.__name__))
+        elif len(inspect.signature(func).parameters) == 0:
+            return func()
+        else:
+            return func(event)
+
+    def dispatch_in_order(self, events, deadline):
+        """Dispatch events one after another, returning how many failed."""
+        failed = 0
+        for event in events:
+            if time.time() > deadline:
+                print('====== SKIPPED {0} PAST WEBHOOK BUDGET ======'.format(event.__class__.__name__))
+                continue
+            try:
+                self.dispatch(event)
+            except LineBotApiError as e:
+                failed += 1
+                log_line_api_error(e)
+            except Exception as e:
+                failed += 1
+                print('====== EVENT HANDLER FAILED: {0!r} ======'.format(e))
+        return failed
+
+    def handle_events(self, events):
+        deadline = time.time() + self.budget
+        groups = group_by_source(events)
+        if len(groups) == 1:
+            self.dispatch_in_order(groups[0], deadline)
+            return
+        futures = [self._executor.submit(self.dispatch_in_order, group, deadline) for group in groups]
+        done, not_done = wait(futures, timeout=self.budget)
+        if not_done:
+            print('====== {0} SENDERS STILL RUNNING AFTER {1}s BUDGET ======'.format(len(not_done), self.budget))
+
+    def handle(self, body, signature):
+        self.handle_events(self.parser.parse(body, signature))
+
+
+def log_line_api_error(e):
+    print("Got exception from LINE Messaging API: %s\n" % e.message)
+    for m in e.error.details:
+        print("  %s: %s" % (m.property, m.message))
+    print("\n")
+
+
+class EventQueue(object):
+    """Bounded queue of parsed webhook events drained by a pool of consumer threads.
+
+    Each queue item is one sender's events from a delivery, so a sender's
+    events are still handled in order. put() raises queue.Full with the events
+    that did not fit so the caller can fall back to handling them itself.
+    """
+
+    def __init__(self, dispatcher, workers=webhook_workers,
+                 maxsize=int(os.getenv('WEBHOOK_QUEUE_SIZE', '256'))):
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._threads = []
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _start(self):
+        # started on first use so each forked gunicorn worker gets its own threads
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._consume, name='webhook-{0}'.format(number))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def put(self, events):
+        self._start()
+        groups = group_by_source(events)
+        for index, group in enumerate(groups):
+            try:
+                self._queue.put_nowait((time.time(), group))
+            except queue.Full:
+                remaining = [event for group in groups[index:] for event in group]
+                with self._lock:
+                    self.rejected += len(remaining)
+                raise queue.Full(remaining)
+
+    def _consume(self):
+        while True:
+            queued_at, group = self._queue.get()
+            wait_ms = (time.time() - queued_at) * 1000
+            try:
+                failed = self.dispatcher.dispatch_in_order(group, queued_at + self.dispatcher.budget)
+            finally:
+                self._queue.task_done()
+            with self._lock:
+                self.processed += len(group)
+                self.failed += failed
+                self.total_wait_ms += wait_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'depth': self._queue.qsize(),
+                'maxsize': self._queue.maxsize,
+                'workers': len(self._threads),
+                'processed': self.processed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'avg_wait_ms': round(self.total_wait_ms / self.processed, 2) if self.processed else None,
+                'max_wait_ms': round(self.max_wait_ms, 2)
+            }